@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+End-to-end benchmark of downloads against a local mock of the music API, cover host and
+audio CDN, with configurable latency, bandwidth and error rate.
+
+Usage:
+    python -m benchmarks.bench_download
+    python -m benchmarks.bench_download --scenario singer --albums 20 --latency 0.05 --json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from unittest import mock
+
+from musicftdl import musicftdl
+from musicftdl.models import DownloadArgs
+from musicftdl.utils import print_table
+from tests.mock_server import MockMusicApi
+
+SCENARIOS = ('album', 'singer', 'keyword')
+
+
+def percentile(values: list, q: float) -> float:
+    """The q-th percentile (0 to 100) of values, nearest rank."""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values), max(1, math.ceil(q / 100 * len(values)))) - 1]
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def api_rate() -> float:
+    """Requests per second allowed to the API host, for the mock API, None if unlimited."""
+    return musicftdl.consts.host_rates.get('mapi.lonsty.me', musicftdl.consts.default_host_rate)
+
+
+def run_scenario(scenario: str, albums: int=4, songs: int=10, size: int=1024 * 1024, latency: float=0,
+                 bandwidth: float=None, error_rate: float=0, format: str='flac', workers: int=20,
+                 seed: int=0) -> dict:
+    """
+    Download `albums` albums of `songs` songs of `size` bytes from a mock API, and measure it.
+    :param scenario: 'album' downloads each album by its mid, 'singer' all albums of one
+        singer, 'keyword' every song by searching its name.
+    """
+    durations = []
+    lock = threading.Lock()
+    fetch_song_chore = musicftdl.fetch_song_chore
+
+    def timed_fetch_song_chore(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fetch_song_chore(*args, **kwargs)
+        finally:
+            with lock:
+                durations.append(time.perf_counter() - start)
+
+    api = MockMusicApi(cdn_host='localhost', latency=latency, bandwidth=bandwidth, error_rate=error_rate,
+                       seed=seed)
+    with api, tempfile.TemporaryDirectory() as tmpdir, \
+            mock.patch.object(musicftdl, 'fetch_song_chore', timed_fetch_song_chore), \
+            mock.patch.dict(musicftdl.host_throttle.rates, {'127.0.0.1': api_rate()}), \
+            redirect_stdout(io.StringIO()):
+        song_mids = []
+        for i in range(albums):
+            song_mids += api.add_album('singer', f'album{i}', songs=songs, size=size)
+        args = DownloadArgs(destination=tmpdir, name_style=3, format=format, page=1, page_size=50,
+                            workers=workers, all_pages=True)
+
+        connections = musicftdl.pool_stats.dict()
+        start = time.perf_counter()
+        if scenario == 'album':
+            musicftdl.download_many(args, musicftdl.parse_manifest([f'album:album{i}' for i in range(albums)]))
+        elif scenario == 'singer':
+            musicftdl.download(args.copy(update={'resource': 'singer', 'singer': True}))
+        elif scenario == 'keyword':
+            musicftdl.download_many(args, musicftdl.parse_manifest([f'keyword:Song {mid}' for mid in song_mids]))
+        else:
+            raise ValueError(f'Unknown scenario <{scenario}>')
+        elapsed = time.perf_counter() - start
+        connections = {k: v - connections[k] for k, v in musicftdl.pool_stats.dict().items()}
+
+        downloaded = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(tmpdir)
+                         for name in names if not name.startswith('.musicftdl.db'))
+
+    return {
+        'scenario': scenario,
+        'songs': len(durations),
+        'seconds': round(elapsed, 3),
+        'songs_per_second': round(len(durations) / elapsed, 2),
+        'mb_per_second': round(downloaded / elapsed / 1024 / 1024, 2),
+        'p50_ms': round(percentile(durations, 50) * 1000, 1),
+        'p99_ms': round(percentile(durations, 99) * 1000, 1),
+        'peak_rss_mb': round(peak_rss() / 1024 / 1024, 1),
+        'requests': len(api.requests),
+        'connections_opened': connections['new_connections'],
+        'connections_reused': connections['reused_connections'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append',
+                        help='Scenario to run, may be repeated. [default: all]')
+    parser.add_argument('--albums', type=int, default=4, help='Number of albums. [default: 4]')
+    parser.add_argument('--songs', type=int, default=10, help='Songs per album. [default: 10]')
+    parser.add_argument('--size', type=int, default=1024 * 1024, help='Bytes per song. [default: 1 MiB]')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds per request. [default: 0.02]')
+    parser.add_argument('--bandwidth', type=float, default=None, help='Bytes per second per response.')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of 503 responses. [default: 0]')
+    parser.add_argument('--format', default='flac', help='Song format, 128 and 320 are tagged. [default: flac]')
+    parser.add_argument('--workers', type=int, default=20, help='Songs downloaded concurrently. [default: 20]')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON lines.')
+    options = parser.parse_args(argv)
+    scenarios = options.scenario or list(SCENARIOS)
+
+    params = dict(albums=options.albums, songs=options.songs, size=options.size, latency=options.latency,
+                  bandwidth=options.bandwidth, error_rate=options.error_rate, format=options.format,
+                  workers=options.workers)
+    if len(scenarios) == 1:
+        results = [run_scenario(scenarios[0], **params)]
+    else:
+        # A process per scenario, so that caches, pools and peak RSS are not shared.
+        results = []
+        for scenario in scenarios:
+            argv = [sys.executable, '-m', 'benchmarks.bench_download', '--scenario', scenario, '--json'] + \
+                   [f'--{k.replace("_", "-")}={v}' for k, v in params.items() if v is not None]
+            output = subprocess.run(argv, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if options.json:
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print_table(list(results[0].keys()), [list(result.values()) for result in results])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""
+Microbenchmark of building the songs of the download pipeline from API data: pydantic Song
+and SongInfo models, as before, against slotted Tracks with memoized date parsing.
+
+Usage:
+    python -m benchmarks.bench_models
+    python -m benchmarks.bench_models --scenario album --songs 5000 --json
+"""
+import argparse
+import json
+import time
+
+from musicftdl.musicftdl import (build_song_info, parse_album_songs,
+                                 parse_album_tracks, parse_singer_albums)
+from musicftdl.utils import parse_date, print_table
+
+SCENARIOS = ('album', 'singer')
+
+
+def singer_albums_data(albums: int) -> dict:
+    """Data of the singer albums endpoint, listing albums of one singer."""
+    return {'list': [{
+        'album_mid': f'album{i}',
+        'album_name': f'Album {i}',
+        'albumtype': '录音室专辑',
+        'lan': '国语',
+        'latest_song': {'song_count': 10},
+        'company': {'company_name': 'Company'},
+        'pub_time': f'20{i % 20:02d}-05-11',
+        'singers': [{'singer_mid': 'singer', 'singer_name': 'Singer'}],
+    } for i in range(albums)]}
+
+
+def album_songs_data(album_mid: str, songs: int) -> dict:
+    """Data of the album songs endpoint."""
+    return {'list': [{
+        'mid': f'{album_mid}_{i + 1}',
+        'name': f'Song {album_mid}_{i + 1}',
+        'index_album': i + 1,
+        'singer': [{'mid': 'singer', 'name': 'Singer'}, {'mid': 'guest', 'name': 'Guest'}],
+        'interval': 200 + i,
+        'genre': 1,
+        'file': {'media_mid': f'media_{album_mid}_{i + 1}'},
+    } for i in range(songs)]}
+
+
+def pydantic_songs(album, data: dict) -> list:
+    songs = [build_song_info(song, album) for song in parse_album_songs(data)]
+    for song_info in songs:
+        # Parsed by dateutil at each access before dates were memoized.
+        parse_date.__wrapped__(song_info.publish_time)
+    return songs
+
+
+def tracks(album, data: dict) -> list:
+    songs = parse_album_tracks(data, album)
+    for track in songs:
+        track.publish_date
+    return songs
+
+
+def measure(build, albums: list, repeat: int) -> float:
+    """Best seconds of repeat runs of build over the (album, data) of albums."""
+    best = float('inf')
+    for _ in range(repeat):
+        parse_date.cache_clear()
+        start = time.perf_counter()
+        for album, data in albums:
+            build(album, data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_scenario(scenario: str, albums: int=100, songs: int=12, cover_size: int=256 * 1024,
+                 repeat: int=5) -> dict:
+    """
+    Build the songs of albums, as in `fetch_album_chore`, both ways, and measure it.
+    :param scenario: 'album' builds one album of `songs` songs, 'singer' `albums` albums of
+        `songs` songs listed by a singer.
+    """
+    if scenario == 'album':
+        listing = singer_albums_data(1)
+    elif scenario == 'singer':
+        listing = singer_albums_data(albums)
+    else:
+        raise ValueError(f'Unknown scenario <{scenario}>')
+    cover = b'\xff\xd8\xff\xe0' + bytes(cover_size)
+    data = []
+    for album in parse_singer_albums(listing):
+        album.album_cover_content = cover
+        data.append((album, album_songs_data(album.album_mid, songs)))
+
+    total = len(data) * songs
+    before = measure(pydantic_songs, data, repeat)
+    after = measure(tracks, data, repeat)
+    return {
+        'scenario': scenario,
+        'songs': total,
+        'pydantic_us_per_song': round(before / total * 1e6, 2),
+        'track_us_per_song': round(after / total * 1e6, 2),
+        'speedup': round(before / after, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append',
+                        help='Scenario to run, may be repeated. [default: all]')
+    parser.add_argument('--albums', type=int, default=100, help='Albums of the singer. [default: 100]')
+    parser.add_argument('--songs', type=int, default=None,
+                        help='Songs per album. [default: 2000 for album, 12 for singer]')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs, the best is reported. [default: 5]')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON lines.')
+    options = parser.parse_args(argv)
+
+    results = [run_scenario(scenario, options.albums, options.songs or (2000 if scenario == 'album' else 12),
+                            repeat=options.repeat)
+               for scenario in options.scenario or list(SCENARIOS)]
+    if options.json:
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print_table(list(results[0].keys()), [list(result.values()) for result in results])
+
+
+if __name__ == '__main__':
+    main()
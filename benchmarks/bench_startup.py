@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""
+Startup benchmark of the musicftdl CLI, with `python -X importtime` in a fresh interpreter
+per run, reporting the import time of each command and the heaviest modules it loads.
+
+Usage:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --top 5 --max-ms 100
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Statements importing what each command needs before it does any work.
+COMMANDS = {
+    'help': 'import musicftdl.cli',
+    'search': 'import musicftdl.cli, musicftdl.musicftdl',
+    'download': 'import musicftdl.cli, musicftdl.musicftdl, musicftdl.tagging, dateutil.parser',
+}
+# Dependencies that commands must not import until they need them.
+HEAVY = ('eyed3', 'requests', 'dateutil', 'pydantic', 'prettytable')
+
+
+def import_times(statement: str) -> dict:
+    """
+    Run statement in a fresh interpreter with `-X importtime`, and return the
+    (self, cumulative, depth) of each module imported, in microseconds, in import order.
+    Modules imported by other modules have a depth above 0.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        name = module.strip()
+        times[name] = (int(self_us), int(cumulative_us), (len(module) - len(module.lstrip()) - 1) // 2)
+    return times
+
+
+def heavy_modules(times: dict) -> list:
+    """The top-level packages of HEAVY imported."""
+    return sorted({module.split('.')[0] for module in times} & set(HEAVY))
+
+
+def run_command(command: str, runs: int=5, top: int=3) -> dict:
+    """Import what command needs runs times, and measure the median time of those imports."""
+    startup = import_times('pass')
+    samples = [import_times(COMMANDS[command]) for _ in range(runs)]
+    # Top-level imports of the statement, less those of the interpreter startup.
+    totals = [sum(cumulative for module, (_, cumulative, depth) in times.items()
+                  if depth == 0 and module not in startup)
+              for times in samples]
+    times = samples[-1]
+    heaviest = sorted(times, key=lambda module: times[module][0], reverse=True)[:top]
+    return {
+        'command': command,
+        'import_ms': round(statistics.median(totals) / 1000, 1),
+        'modules': len(times),
+        'heavy': ','.join(heavy_modules(times)) or '-',
+        'heaviest': ','.join(f'{module}:{times[module][0] / 1000:.1f}' for module in heaviest),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--command', choices=list(COMMANDS), action='append',
+                        help='Command to measure, may be repeated. [default: all]')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per command, the median is reported. [default: 5]')
+    parser.add_argument('--top', type=int, default=3, help='Heaviest modules listed by self time. [default: 3]')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='Exit with status 1 if the imports of `--help` take longer, in milliseconds.')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON lines.')
+    options = parser.parse_args(argv)
+
+    results = [run_command(command, options.runs, options.top) for command in options.command or list(COMMANDS)]
+    if options.json:
+        for result in results:
+            print(json.dumps(result))
+    else:
+        from musicftdl.utils import print_table
+        print_table(list(results[0].keys()), [list(result.values()) for result in results])
+
+    slow = [r for r in results if r['command'] == 'help' and options.max_ms and r['import_ms'] > options.max_ms]
+    if slow:
+        print(f'Imports of `musicftdl --help` took {slow[0]["import_ms"]} ms, more than {options.max_ms} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
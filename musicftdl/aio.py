@@ -0,0 +1,367 @@
+"""Asyncio counterpart of the main module, built on aiohttp."""
+import asyncio
+import os
+import random
+from typing import List
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    raise ImportError('musicftdl.aio requires aiohttp, install it by `pip install musicftdl[aio]`.')
+
+from musicftdl import musicftdl
+from musicftdl.models import (Album, DownloadArgs, SearchResult, Singer, Song,
+                              SongInfo)
+from musicftdl.musicftdl import (DataNotFoundError, build_song_info, consts,
+                                 cover_cache, is_complete_part,
+                                 metadata_cache, parse_album,
+                                 parse_album_songs, parse_json_data,
+                                 parse_search, parse_singer_albums,
+                                 parse_song_info)
+from musicftdl.tagging import id3v2_size, parse_id3v2_size, render_tag
+
+# Bytes of a download buffered before they are written to the file, off the event loop.
+WRITE_SIZE = 256 * 1024
+
+
+async def to_thread(func, *args):
+    """
+    Call func in the default executor of the running loop. The caches, SQLite and the file
+    system are blocking, so they are used through this, not from the event loop.
+    """
+    return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+class AsyncClient:
+    """
+    An aiohttp session whose requests are bounded by semaphores: `limit` API requests
+    and `download_limit` song downloads may be in flight at the same time.
+    Usage:
+        async with AsyncClient(limit=1000) as client:
+            songs = await get_album_songs(client, album_mid)
+    """
+
+    def __init__(self, limit: int=100, download_limit: int=20, tries: int=3, delay: float=1, backoff: float=2):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.download_semaphore = asyncio.Semaphore(download_limit)
+        self.tries, self.delay, self.backoff = tries, delay, backoff
+        self.session = None
+
+    async def __aenter__(self):
+        connect, read = consts.timeout
+        self.session = aiohttp.ClientSession(
+            headers=consts.headers,
+            timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+            connector=aiohttp.TCPConnector(limit=self.limit)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _retry(self, coro_func):
+        delay = self.delay
+        for _ in range(self.tries - 1):
+            try:
+                return await coro_func()
+            except aiohttp.ClientResponseError as e:
+                # Same classification as `musicftdl.is_transient`, e.g. don't retry a 404.
+                if e.status not in (408, 425, 429, 500, 502, 503, 504):
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay *= self.backoff
+        return await coro_func()
+
+    async def get_json_data(self, url: str):
+        async def get():
+            async with self.semaphore, self.session.get(url) as resp:
+                resp.raise_for_status()
+                return await resp.json(content_type=None)
+
+        return parse_json_data(await self._retry(get))
+
+    async def get_content(self, url: str) -> bytes:
+        async def get():
+            async with self.semaphore, self.session.get(url) as resp:
+                resp.raise_for_status()
+                return await resp.read()
+
+        return await self._retry(get)
+
+
+async def fetch_data(client: AsyncClient, endpoint: str, *params):
+    """Same as `musicftdl.fetch_data`, through the same metadata cache."""
+    data = await to_thread(metadata_cache.get, endpoint, params)
+    if data is None:
+        data = await client.get_json_data(getattr(consts.api, endpoint).format(*params))
+        await to_thread(metadata_cache.set, endpoint, params, data)
+    return data
+
+
+async def search(client: AsyncClient, key: str, page: int=1, page_size: int=20) -> List[SearchResult]:
+    return parse_search(await fetch_data(client, 'search', key, page, page_size))
+
+
+async def get_singer_albums(client: AsyncClient, singer_mid: str, page: int=1, page_size: int=50) -> List[Album]:
+    return parse_singer_albums(await fetch_data(client, 'singer_album', singer_mid, page, page_size))
+
+
+async def get_album(client: AsyncClient, album_mid: str) -> Album:
+    return parse_album(await fetch_data(client, 'album', album_mid))
+
+
+async def get_album_cover_content(client: AsyncClient, album_mid: str, url: str) -> bytes:
+    """Same as `musicftdl.get_album_cover_content`, through the same cover cache."""
+    content = await to_thread(cover_cache.get_cached, album_mid)
+    if content is None:
+        content = await client.get_content(url)
+        await to_thread(cover_cache.put, album_mid, content)
+    return content
+
+
+async def get_album_songs(client: AsyncClient, album_mid: str) -> List[Song]:
+    return parse_album_songs(await fetch_data(client, 'album_songs', album_mid))
+
+
+async def get_song_url(client: AsyncClient, song_mid: str, format: str='128') -> str:
+    return await fetch_data(client, 'song_url', song_mid, format)
+
+
+async def get_song_urls(client: AsyncClient, song_mids: List[str], format: str='128',
+                        batch_size: int=consts.url_batch_size, fallback: bool=True) -> dict:
+    """Same as `musicftdl.get_song_urls`, batches are resolved concurrently."""
+
+    def cached():
+        return {mid: url for mid, url in ((mid, metadata_cache.get('song_url', (mid, format))) for mid in song_mids)
+                if url is not None}
+
+    def cache(resolved):
+        for mid, url in resolved.items():
+            metadata_cache.set('song_url', (mid, format), url)
+
+    urls = await to_thread(cached)
+    missing = [mid for mid in song_mids if mid not in urls]
+
+    async def resolve_batch(batch):
+        try:
+            data = await client.get_json_data(consts.api.song_urls.format(','.join(batch), format))
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                musicftdl.batch_song_url_supported = False
+                return
+            raise
+        except DataNotFoundError:
+            return
+        resolved = {mid: data[mid] for mid in batch if data.get(mid)}
+        urls.update(resolved)
+        await to_thread(cache, resolved)
+
+    if musicftdl.batch_song_url_supported:
+        await asyncio.gather(*[resolve_batch(missing[i:i + batch_size]) for i in range(0, len(missing), batch_size)])
+
+    async def resolve(mid):
+        try:
+            urls[mid] = await get_song_url(client, mid, format)
+        except DataNotFoundError:
+            pass
+
+    if fallback and not musicftdl.batch_song_url_supported:
+        await asyncio.gather(*[resolve(mid) for mid in song_mids if mid not in urls])
+    return urls
+
+
+async def get_song_info(client: AsyncClient, song_mid: str) -> SongInfo:
+    return parse_song_info(await fetch_data(client, 'song_info', song_mid))
+
+
+class _PartWriter:
+    """
+    Write a download in blocks of WRITE_SIZE bytes, off the event loop. The file is opened
+    by the first block, so the response is read as soon as its headers arrived.
+    """
+
+    def __init__(self, filename: str, mode: str):
+        self.filename = filename
+        self.mode = mode
+        self.file = None
+        self.buffer = []
+        self.size = 0
+
+    def _write(self, data: bytes):
+        if self.file is None:
+            self.file = open(self.filename, self.mode)
+        self.file.write(data)
+
+    async def flush(self):
+        if self.buffer:
+            data, self.buffer, self.size = b''.join(self.buffer), [], 0
+            await to_thread(self._write, data)
+
+    async def write(self, chunk: bytes):
+        self.buffer.append(chunk)
+        self.size += len(chunk)
+        if self.size >= WRITE_SIZE:
+            await self.flush()
+
+    async def close(self):
+        await self.flush()
+        if self.file is None:
+            await to_thread(self._write, b'')
+        await to_thread(self.file.close)
+
+
+def _file_size(filename: str) -> int:
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+async def strip_id3v2(chunks):
+    """Same as `musicftdl.tagging.strip_id3v2`, for the chunks of an async iterator."""
+    head, skip = b'', None
+    async for chunk in chunks:
+        if skip is None:
+            head += chunk
+            if len(head) < 10:
+                continue
+            chunk, head, skip = head, b'', parse_id3v2_size(head)
+        if skip:
+            chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+        if chunk:
+            yield chunk
+    if head:
+        yield head
+
+
+async def download_music(client: AsyncClient, url: str, filename: str, overwrite: bool=False,
+                         chunk_size: int=consts.chunk_size, tag: bytes=None):
+    """
+    Same as `musicftdl.download_music`: download through a resumable `.part` file.
+    :param tag: rendered ID3 tag, written ahead of the audio in place of the ID3v2 tag the
+        audio may start with, so that the file is written once.
+    :return: True if downloaded, False if skipped, None on error.
+    """
+    if not overwrite and await to_thread(_file_size, filename) > 0:
+        print(f'{filename} [Skipped]')
+        return False
+
+    part = filename + '.part'
+    offset = await to_thread(_file_size, part) if not overwrite else 0
+    tag_size = await to_thread(id3v2_size, part) if tag and offset else 0
+    if tag and offset and not tag_size:
+        offset = 0  # Not started by a tagging download, start over.
+
+    async with client.download_semaphore:
+        try:
+            # Offset of the audio in the body, which is past its own ID3v2 tag when resuming with a tag.
+            body_offset = offset
+            if tag_size:
+                async with client.session.get(url, headers={'Range': 'bytes=0-9'}, auto_decompress=False) as resp:
+                    resp.raise_for_status()
+                    body_offset = offset - tag_size + parse_id3v2_size(await resp.content.read(10))
+            headers = {'Range': f'bytes={body_offset}-'} if body_offset else None
+
+            async with client.session.get(url, headers=headers, auto_decompress=False) as resp:
+                if not is_complete_part(resp.status, resp.headers, body_offset):
+                    resp.raise_for_status()
+                    chunks = resp.content.iter_chunked(chunk_size)
+                    writer = _PartWriter(part, 'ab' if resp.status == 206 else 'wb')
+                    if tag and resp.status != 206:
+                        # The whole body, asked for or answered to a Range that was ignored.
+                        await writer.write(tag)
+                        chunks = strip_id3v2(chunks)
+                    try:
+                        async for chunk in chunks:
+                            await writer.write(chunk)
+                    finally:
+                        # What was received before an error is kept, to be resumed.
+                        await writer.close()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Including aiohttp.ClientPayloadError when the body is cut short.
+            print(f'{e}, {filename} [Incomplete]')
+            return
+
+    await to_thread(os.replace, part, filename)
+    print(filename)
+    return True
+
+
+async def download_with_tags(client: AsyncClient, filename: str, song_info: SongInfo, overwrite: bool=False,
+                             retag: bool=True, chunk_size: int=consts.chunk_size):
+    """Same as `musicftdl.download_with_tags`, the tag is rendered off the event loop."""
+    tag = await to_thread(render_tag, song_info) if retag else None
+    return await download_music(client, song_info.url, filename, overwrite, chunk_size, tag)
+
+
+async def fetch_song_chore(client: AsyncClient, song_info: SongInfo, args: DownloadArgs):
+    try:
+        song_info.url = song_info.url or await get_song_url(client, song_info.song_mid, args.format)
+    except Exception as e:
+        print(f'{e}, {song_info.singer_name} - {song_info.album_name} - '
+              f'[{song_info.song_mid} {args.format}] {song_info.song_name}')
+    else:
+        filename = await to_thread(args.filename, song_info)
+        await download_with_tags(client, filename, song_info, args.overwrite, args.retag, args.chunk_size)
+
+
+async def fetch_album_chore(client: AsyncClient, album: Album, args: DownloadArgs) -> Album:
+    try:
+        album.songs, album.album_cover_content = await asyncio.gather(
+            get_album_songs(client, album.album_mid),
+            get_album_cover_content(client, album.album_mid, album.album_cover_bg_url)
+        )
+    except Exception as e:
+        # Other albums go on, as with `musicftdl.fetch_album_chore` on a scheduler.
+        print(f'{e}, {album.singer_name} - {album.album_name} [Skipped]')
+        return album
+    # Songs left out are resolved one by one, concurrently, by their own chores.
+    try:
+        urls = await get_song_urls(client, [song.song_mid for song in album.songs], args.format,
+                                   args.url_batch_size, fallback=False)
+    except Exception:
+        urls = {}
+    for song in album.songs:
+        song.url = urls.get(song.song_mid)
+    await asyncio.gather(*[fetch_song_chore(client, build_song_info(song, album), args)
+                           for song in album.songs])
+    return album
+
+
+async def _download_by_song_mid(client: AsyncClient, song_mid: str, args: DownloadArgs):
+    song_info = await get_song_info(client, song_mid)
+    assert song_info.song_mid, f'Song <{song_mid}> not found!'
+    song_info.url, song_info.album_cover_content = await asyncio.gather(
+        get_song_url(client, song_info.song_mid, args.format),
+        get_album_cover_content(client, song_info.album_mid, song_info.album_cover_bg_url)
+    )
+    filename = await to_thread(args.filename, song_info)
+    await download_with_tags(client, filename, song_info, args.overwrite, args.retag, args.chunk_size)
+
+
+async def download(args: DownloadArgs, client: AsyncClient=None):
+    """Same as `musicftdl.download`, albums and songs are all fetched concurrently."""
+    if client is None:
+        async with AsyncClient(download_limit=args.workers) as client:
+            return await download(args, client)
+
+    if not any([args.singer, args.album, args.keywords]):
+        return await _download_by_song_mid(client, args.resource, args)
+
+    if args.singer:
+        albums = await get_singer_albums(client, args.resource, page=args.page, page_size=args.page_size)
+        assert albums, f'Singer <{args.resource}> not found!'
+        singer = Singer(singer_mid=args.resource, singer_name=albums[0].singer_name, albums=albums)
+    elif args.album:
+        album = await get_album(client, args.resource)
+        assert album.album_mid, f'Album <{args.resource}> not found!'
+        singer = Singer(singer_mid=album.singer_mid, singer_name=album.singer_name, albums=[album])
+    else:
+        result = await search(client, args.resource, page=1, page_size=1)
+        assert result, f'Resource <{args.resource}> not found!'
+        return await _download_by_song_mid(client, result[0].song_mid, args)
+
+    await asyncio.gather(*[fetch_album_chore(client, album, args) for album in args.filter_albums(singer.albums)])
@@ -0,0 +1,187 @@
+"""Persistent caches shared across runs."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'musicftdl')
+
+
+class MetadataCache:
+    """
+    Cache API data in a SQLite database, keyed by endpoint and parameters. Entries expire
+    after the TTL of their endpoint, and the least recently used ones are evicted once the
+    database holds more than `max_size` bytes of data.
+    Usage:
+        cache = MetadataCache('/tmp/metadata.sqlite3', ttls={'song_url': 600})
+        data = cache.get('song_url', ('001xxx', '128'))
+        if data is None:
+            cache.set('song_url', ('001xxx', '128'), fetch())
+    """
+
+    def __init__(self, path: str=None, ttls: dict=None, max_size: int=64 * 1024 * 1024,
+                 enabled: bool=True, refresh: bool=False):
+        """
+        :param path: database file, defaults to metadata.sqlite3 in `default_cache_dir()`.
+        :param ttls: seconds to keep entries of each endpoint, endpoints without a TTL are not cached.
+        :param enabled: if False, nothing is read from or written to the cache.
+        :param refresh: if True, entries are not read but still written, to refresh the cache.
+        """
+        self.path = path or os.path.join(default_cache_dir(), 'metadata.sqlite3')
+        self.ttls = ttls or {}
+        self.max_size = max_size
+        self.enabled = enabled
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._conn = None
+        self._size = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS metadata ('
+                               'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+                               'expires REAL NOT NULL, accessed REAL NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed)')
+            self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def _key(endpoint: str, params: tuple) -> str:
+        return endpoint + json.dumps(params, ensure_ascii=False)
+
+    def get(self, endpoint: str, params: tuple):
+        """Return the cached data, or None if it's missing, expired or not to be read."""
+        if not self.enabled or self.refresh or endpoint not in self.ttls:
+            return None
+
+        key, now = self._key(endpoint, params), time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT value FROM metadata WHERE key = ? AND expires > ?', (key, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE metadata SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, endpoint: str, params: tuple, data):
+        if not self.enabled or not data or endpoint not in self.ttls:
+            return
+
+        key, value, now = self._key(endpoint, params), json.dumps(data, ensure_ascii=False), time.time()
+        with self._lock:
+            conn = self._connect()
+            old = conn.execute('SELECT size FROM metadata WHERE key = ?', (key,)).fetchone()
+            conn.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?)',
+                         (key, value, len(value), now + self.ttls[endpoint], now))
+            self._size += len(value) - (old[0] if old else 0)
+            if self._size > self.max_size:
+                self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute('DELETE FROM metadata WHERE expires <= ?', (now,))
+        self._size = conn.execute('SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+        # Drop the least recently used entries until only 90% of max_size is used.
+        rows = conn.execute('SELECT key, size FROM metadata ORDER BY accessed').fetchall()
+        for key, size in rows:
+            if self._size <= self.max_size * 0.9:
+                break
+            conn.execute('DELETE FROM metadata WHERE key = ?', (key,))
+            self._size -= size
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute('DELETE FROM metadata')
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CoverCache:
+    """
+    Cache album covers in files named by album_mid under `path`, plus the `capacity`
+    most recently used ones in memory. Concurrent requests for the same cover wait for
+    a single fetch.
+    Usage:
+        cover_cache = CoverCache()
+        content = cover_cache.get(album_mid, lambda: download(cover_url))
+    """
+
+    def __init__(self, path: str=None, capacity: int=64, enabled: bool=True, refresh: bool=False):
+        """
+        :param enabled: if False, covers are only kept in memory.
+        :param refresh: if True, covers are not read from disk but still written.
+        """
+        self.path = path or os.path.join(default_cache_dir(), 'covers')
+        self.capacity = capacity
+        self.enabled = enabled
+        self.refresh = refresh
+        self.memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _filename(self, album_mid: str) -> str:
+        return os.path.join(self.path, f'{album_mid}.jpg')
+
+    def get_cached(self, album_mid: str) -> bytes:
+        """Return the cover from memory or disk, or None if it's not cached."""
+        with self._lock:
+            if album_mid in self.memory:
+                self.memory.move_to_end(album_mid)
+                return self.memory[album_mid]
+
+        if not self.enabled or self.refresh:
+            return None
+        try:
+            with open(self._filename(album_mid), 'rb') as f:
+                content = f.read()
+        except OSError:
+            return None
+        self._remember(album_mid, content)
+        return content
+
+    def put(self, album_mid: str, content: bytes):
+        if not content:
+            return
+        self._remember(album_mid, content)
+        if self.enabled:
+            os.makedirs(self.path, exist_ok=True)
+            tmp = f'{self._filename(album_mid)}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, self._filename(album_mid))
+
+    def _remember(self, album_mid: str, content: bytes):
+        with self._lock:
+            self.memory[album_mid] = content
+            self.memory.move_to_end(album_mid)
+            while len(self.memory) > self.capacity:
+                self.memory.popitem(last=False)
+
+    def get(self, album_mid: str, fetch) -> bytes:
+        """Return the cached cover, or call `fetch()` once to get and cache it."""
+        content = self.get_cached(album_mid)
+        if content is not None:
+            return content
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(album_mid, threading.Lock())
+        with key_lock:
+            content = self.get_cached(album_mid)
+            if content is None:
+                content = fetch()
+                self.put(album_mid, content)
+        with self._lock:
+            self._key_locks.pop(album_mid, None)
+        return content
@@ -1,15 +1,81 @@
-"""Console script for musicftdl."""
+"""
+Console script for musicftdl.
+
+Only click is imported up front. Each command imports what it needs as it runs, so that
+`--help` doesn't load requests and pydantic, and only downloads load eyed3 and dateutil.
+"""
+import itertools
 import sys
 from typing import List
 
 import click
 
-from musicftdl.models import DownloadArgs
-from musicftdl.musicftdl import download as dl
-from musicftdl.musicftdl import (get_album_songs, get_singer_albums,
-                                 get_song_info, get_song_url)
-from musicftdl.musicftdl import search as search_kw
-from musicftdl.utils import cut_str_to_multi_line, print_table
+from musicftdl.utils import cut_str_to_multi_line, parse_rate, print_table
+
+
+def cache_options(f):
+    """Add --no-cache and --refresh options, which configure the metadata and cover caches, to a command."""
+    def disable(ctx, param, value):
+        from musicftdl.musicftdl import cover_cache, metadata_cache
+        metadata_cache.enabled = cover_cache.enabled = not value
+
+    def refresh(ctx, param, value):
+        from musicftdl.musicftdl import cover_cache, metadata_cache
+        metadata_cache.refresh = cover_cache.refresh = value
+
+    f = click.option('--refresh', is_flag=True, expose_value=False, callback=refresh,
+                     help='Fetch metadata and covers from the API and refresh the caches.')(f)
+    f = click.option('--no-cache', is_flag=True, expose_value=False, callback=disable,
+                     help='Do not read or write the metadata and cover caches.')(f)
+    return f
+
+
+def rate_options(f):
+    """
+    Add --max-rate and --max-host-rate options, which cap the bandwidth of all downloads, and
+    --host-rate, which caps the requests sent to a host, to a command.
+    """
+    def configure(ctx, param, value):
+        from musicftdl.musicftdl import bandwidth
+        # Called once per option, each time with the options parsed so far.
+        ctx.meta[param.name] = value
+        rate, host_rates = ctx.meta.get('max_rate'), ctx.meta.get('max_host_rate', ())
+        try:
+            bandwidth.configure(parse_rate(rate) if rate else None,
+                                {host: parse_rate(r) for host, _, r in (v.partition('=') for v in host_rates)})
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+
+    def configure_hosts(ctx, param, value):
+        from musicftdl.musicftdl import consts, host_throttle
+        try:
+            rates = {host: float(rate) for host, _, rate in (v.partition('=') for v in value)}
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        host_throttle.configure(rates={**consts.host_rates, **rates})
+
+    f = click.option('--host-rate', multiple=True, metavar='HOST=RATE', expose_value=False,
+                     callback=configure_hosts,
+                     help='Cap the requests per second sent to HOST, e.g. mapi.lonsty.me=20, may be repeated.')(f)
+    f = click.option('--max-host-rate', multiple=True, metavar='HOST=RATE', expose_value=False,
+                     callback=configure, help='Cap the bandwidth of downloads from HOST, may be repeated.')(f)
+    f = click.option('--max-rate', default=None, metavar='RATE', expose_value=False, callback=configure,
+                     help='Cap the bandwidth of all downloads together, in bytes per second, e.g. 512K or 2M.')(f)
+    return f
+
+
+def metrics_option(f):
+    """Add a --metrics option, which records the timings of the run and exports them as it ends, to a command."""
+    def enable(ctx, param, value):
+        from musicftdl.musicftdl import metrics
+        metrics.enabled = bool(value)
+        if value:
+            metrics.reset()
+            ctx.call_on_close(lambda: metrics.export(value))
+
+    return click.option('--metrics', default=None, metavar='PATH', expose_value=False, callback=enable,
+                        help='Export counters and timings of each stage and HTTP call to PATH, '
+                             'as a Prometheus textfile if PATH ends with .prom, as JSON otherwise.')(f)
 
 
 @click.group()
@@ -24,11 +90,19 @@ def cli():
 #               help='0: song\n2: song list\n7: lyrics\n8: album\n9: singer\n12: mv')
 @click.option('-P', '--page', default=1, show_default=True, help='Page No.')
 @click.option('-S', '--page-size', default=20, show_default=True, help='Page size.')
+@click.option('-A', '--all-pages', is_flag=True, help='Fetch all pages, concurrently.')
+@cache_options
 @click.argument('keywords', nargs=-1)
-def search(keywords, page, page_size):
+def search(keywords, page, page_size, all_pages):
     """Search songs by KEYWORDS."""
+    from musicftdl.musicftdl import iter_search
+    from musicftdl.musicftdl import search as search_kw
+
     try:
-        result = search_kw(' '.join(keywords), page, page_size)
+        if all_pages:
+            result = [item for item in iter_search(' '.join(keywords), page_size)]
+        else:
+            result = search_kw(' '.join(keywords), page, page_size)
     except Exception as e:
         print(e)
         sys.exit(1)
@@ -45,11 +119,19 @@ def search(keywords, page, page_size):
 @cli.command()
 @click.option('-P', '--page', default=1, show_default=True, help='Page No.')
 @click.option('-S', '--page-size', default=50, show_default=True, help='Page size.')
+@click.option('-A', '--all-pages', is_flag=True, help='Fetch all pages of albums, concurrently.')
+@cache_options
 @click.argument('mid')
-def list(mid, page, page_size):
+def list(mid, page, page_size, all_pages):
     """List albums/songs of the given SINGER/ALBUM MID."""
+    from musicftdl.musicftdl import (get_album_songs, get_singer_albums,
+                                     iter_singer_albums)
+
     try:
-        result = get_singer_albums(mid, page, page_size)
+        if all_pages:
+            result = [album for album in iter_singer_albums(mid, page_size)]
+        else:
+            result = get_singer_albums(mid, page, page_size)
     except Exception as e:
         print(e)
         sys.exit(1)
@@ -83,9 +165,12 @@ def list(mid, page, page_size):
 
 
 @cli.command()
+@cache_options
 @click.argument('song-mid')
 def show(song_mid):
     """Show information and play url of the given SONG MID."""
+    from musicftdl.musicftdl import get_song_info, get_song_url
+
     try:
         song_info = get_song_info(song_mid)
     except Exception as e:
@@ -128,13 +213,90 @@ def show(song_mid):
               type=click.Choice(['128', '320', 'm4a', 'flac', 'ape']), help='Song format.')
 @click.option('-P', '--page', default=1, show_default=True, help='Page No.')
 @click.option('-S', '--page-size', default=50, show_default=True, help='Page size.')
+@click.option('-A', '--all-pages', is_flag=True, help='Download albums of all pages, ignoring --page.')
+@click.option('-w', '--workers', default=20, show_default=True,
+              help='Number of songs downloaded concurrently, shared by all albums.')
+@click.option('--max-workers', default=64, show_default=True,
+              help='Number of songs downloaded concurrently that hosts keeping up are raised to, from --workers.')
+@click.option('--search-workers', default=8, show_default=True,
+              help='Number of keywords searched concurrently, with -k and --from-file.')
+@click.option('--chunk-size', default=8192, show_default=True,
+              help='Bytes read from the network per write while downloading.')
+@click.option('-F', '--from-file', type=click.File('r'), default=None,
+              help='Download resources listed in a file, or stdin with "-", one per line as TYPE:RESOURCE '
+                   '(TYPE: song, album, singer or keyword) or as JSON.')
 # @click.option('--proxy', default=None, help='Set a HTTP/HTTPS proxy, as format USERNAME:PASSWORD@IP:PORT.')
-@click.argument('resource')
-def download(**kwargs):
+@cache_options
+@rate_options
+@metrics_option
+@click.argument('resource', required=False)
+def download(from_file, **kwargs):
     """Download songs by SINGER/ALBUM MID or KEYWORDS."""
+    from musicftdl.models import DownloadArgs
+    from musicftdl.musicftdl import download as dl
+    from musicftdl.musicftdl import download_many, parse_manifest, progress
+
     args = DownloadArgs(**kwargs)
+    if from_file is None and not args.resource:
+        raise click.UsageError('Missing argument RESOURCE, or option --from-file.')
+    try:
+        if from_file is None:
+            with progress:
+                dl(args)
+            return
+        default_type = 'singer' if args.singer else 'album' if args.album else \
+            'keyword' if args.keywords else 'song'
+        # Invalid lines are reported as failed resources, and the other lines still downloaded.
+        resources = parse_manifest(from_file, default_type, strict=False)
+        if args.resource:
+            resources = itertools.chain(parse_manifest([args.resource], default_type), resources)
+        with progress:
+            reports = download_many(args, resources)
+    except Exception as e:
+        print(e)
+        return
+
+    print_table(['type', 'resource', 'downloaded', 'skipped', 'failed', 'error'],
+                [[r.type, cut_str_to_multi_line(r.resource, 40), r.downloaded, r.skipped, r.failed, r.error or '']
+                 for r in reports])
+    failed = [r for r in reports if not r.ok]
+    if failed:
+        print(f'{len(failed)} of {len(reports)} resources failed')
+        sys.exit(1)
+
+
+@cli.command()
+@click.option('-d', '--destination', default='.', help='Destination to save songs.')
+@click.option('-n', '--name-style', default='3', show_default=True,
+              type=click.Choice(['1', '2', '3']),
+              help='Style of filename. [ 1: SONG.ext | 2: SINGER - SONG.ext | 3: SINGER - ALBUM - SONG.ext')
+@click.option('-t', '--album_types', default='SELO', show_default=True,
+              help='Download songs of selected types of albums. [ S: Studio Album | '
+                   'E: EP Single | L: Live Album | O: Others ]')
+@click.option('-c/-C', '--classified/--no-classified', 'classified', default=True,
+              show_default=True, help='Store in folders classify by singers and albums.')
+@click.option('-f', '--format', default='128', show_default=True,
+              type=click.Choice(['128', '320', 'm4a', 'flac', 'ape']), help='Song format.')
+@click.option('-w', '--workers', default=20, show_default=True,
+              help='Number of songs downloaded concurrently, shared by all albums.')
+@click.option('--max-workers', default=64, show_default=True,
+              help='Number of songs downloaded concurrently that hosts keeping up are raised to, from --workers.')
+@click.option('--chunk-size', default=8192, show_default=True,
+              help='Bytes read from the network per write while downloading.')
+@cache_options
+@rate_options
+@metrics_option
+@click.argument('singer-mids', nargs=-1, required=True)
+def sync(singer_mids, **kwargs):
+    """Download songs of SINGER_MIDS released or missed since the last sync."""
+    from musicftdl.models import DownloadArgs
+    from musicftdl.musicftdl import progress
+    from musicftdl.musicftdl import sync as sync_singers
+
+    args = DownloadArgs(singer=True, page_size=50, **kwargs)
     try:
-        dl(args)
+        with progress:
+            sync_singers(args, singer_mids)
     except Exception as e:
         print(e)
 
@@ -0,0 +1,139 @@
+"""Index of the songs in a destination folder, to tell what is downloaded without a stat per song."""
+import os
+import sqlite3
+import threading
+from typing import Optional, Tuple
+
+
+class LibraryIndex:
+    """
+    Map song_mid and str_media_mid of downloaded songs to their path, size and format,
+    in a SQLite database in the destination folder, which is scanned once per run.
+    Songs are found under whatever name style or album folder they were downloaded to,
+    and whether a file exists is a lookup in the names listed by the scan.
+    A destination which is not `managed` is neither scanned nor given a database: songs
+    downloaded by the run are indexed in memory, and other files are checked one by one.
+    Usage:
+        library = LibraryIndex('/music')
+        if library.get(song_mid, '320') is None:
+            ...
+            library.add(song_mid, str_media_mid, '320', filename)
+    """
+
+    def __init__(self, destination: str, filename: str='.musicftdl.db', managed: bool=True):
+        """
+        :param managed: keep the index in filename of the destination, scanned once per run.
+        """
+        self.destination = os.path.abspath(destination)
+        self.path = os.path.join(self.destination, filename)
+        self.managed = managed
+        self.paths = None
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.managed:
+                os.makedirs(self.destination, exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            else:
+                self._conn = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS library ('
+                               'song_mid TEXT NOT NULL, format TEXT NOT NULL, str_media_mid TEXT, '
+                               'path TEXT NOT NULL, size INTEGER NOT NULL, PRIMARY KEY (song_mid, format))')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS library_media ON library (str_media_mid, format)')
+        return self._conn
+
+    def scan(self):
+        """
+        List the files of the destination, without a stat per file, and forget indexed songs
+        whose file is gone. Unmanaged destinations are not listed.
+        """
+        if not self.managed:
+            with self._lock:
+                self.paths = set()
+            return
+
+        paths = set()
+        folders = [self.destination]
+        while folders:
+            try:
+                entries = list(os.scandir(folders.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                else:
+                    paths.add(os.path.relpath(entry.path, self.destination))
+
+        with self._lock:
+            conn = self._connect()
+            gone = [(row[0],) for row in conn.execute('SELECT path FROM library') if row[0] not in paths]
+            conn.executemany('DELETE FROM library WHERE path = ?', gone)
+            self.paths = paths
+
+    def _scanned(self) -> set:
+        if self.paths is None:
+            self.scan()
+        return self.paths
+
+    def _relpath(self, filename: str) -> str:
+        return os.path.relpath(os.path.abspath(filename), self.destination)
+
+    def exists(self, filename: str) -> bool:
+        """Whether the file was in the destination when scanned, or added since."""
+        with self._lock:
+            if self._relpath(filename) in self._scanned():
+                return True
+        return not self.managed and os.path.isfile(filename)
+
+    def size(self, filename: str) -> int:
+        """Size of the file, 0 if it does not exist. Only existing files are stat'ed."""
+        if not self.exists(filename):
+            return 0
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+
+    def get(self, song_mid: str, format: str) -> Optional[Tuple[str, int]]:
+        """Return (path, size) of the song downloaded in the format, or None."""
+        return self._find('song_mid', song_mid, format)
+
+    def find_media(self, str_media_mid: str, format: str) -> Optional[Tuple[str, int]]:
+        """Return (path, size) of any song downloaded with the media in the format, or None."""
+        return self._find('str_media_mid', str_media_mid, format) if str_media_mid else None
+
+    def _find(self, column: str, value: str, format: str) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            paths = self._scanned()
+            for path, size in self._connect().execute(
+                    f'SELECT path, size FROM library WHERE {column} = ? AND format = ?', (value, format)):
+                if path in paths and size > 0:
+                    return os.path.join(self.destination, path), size
+        return None
+
+    def add(self, song_mid: str, str_media_mid: str, format: str, filename: str, size: int=None):
+        """Index the song downloaded to filename."""
+        if size is None:
+            size = os.path.getsize(filename)
+        path = self._relpath(filename)
+        with self._lock:
+            self._scanned().add(path)
+            self._connect().execute('INSERT OR REPLACE INTO library VALUES (?, ?, ?, ?, ?)',
+                                    (song_mid, format, str_media_mid, path, size))
+
+    def discard(self, filename: str):
+        """Forget the file, which is gone or about to be replaced."""
+        path = self._relpath(filename)
+        with self._lock:
+            self._scanned().discard(path)
+            self._connect().execute('DELETE FROM library WHERE path = ?', (path,))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
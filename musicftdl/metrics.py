@@ -0,0 +1,163 @@
+"""Counters and latency histograms of the stages of a run, exported as JSON or a Prometheus textfile."""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Upper bounds in seconds of the latency histogram buckets, as Prometheus' defaults.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+
+    def __init__(self, buckets: tuple=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self) -> list:
+        """(upper bound, number of values not greater) of every bucket, the last one '+Inf'."""
+        result, total = [], 0
+        for le, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((le, total))
+        return result
+
+    def dict(self) -> dict:
+        return {'count': self.count, 'sum': round(self.sum, 6), 'max': round(self.max, 6),
+                'buckets': {str(le): count for le, count in self.cumulative()}}
+
+
+class Metrics:
+    """
+    Count events and bytes, and time stages, by name and labels. Disabled, every hook
+    returns after checking `enabled`, so instrumented code runs at full speed.
+    Usage:
+        metrics = Metrics(enabled=True)
+
+        @metrics.instrument('get_album_songs')
+        def get_album_songs(album_mid):
+            ...
+
+        with metrics.timer('http', host='mapi.lonsty.me'):
+            ...
+        metrics.count('bytes', 1024, stage='download_music')
+        metrics.export('metrics.prom')
+    """
+
+    def __init__(self, enabled: bool=False, namespace: str='musicftdl'):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: float=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Time the block as a stage, and count its errors."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.count('errors', stage=stage, **labels)
+            raise
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def instrument(self, stage: str):
+        """Decorate a function to time its calls as a stage."""
+
+        def decorator(f):
+
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                with self.timer(stage):
+                    return f(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def dict(self) -> dict:
+        """Counters and histograms, each as a list of entries with their labels."""
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [{'name': name, 'labels': dict(labels), **histogram.dict()}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+
+        def series(name, labels, **extra):
+            pairs = [f'{k}="{str(v)}"' for k, v in list(labels) + list(extra.items())]
+            return f'{self.namespace}_{name}' + ('{' + ','.join(pairs) + '}' if pairs else '')
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f'# TYPE {self.namespace}_{name}_total counter')
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f'{series(name + "_total", labels)} {value}')
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {self.namespace}_{name} histogram')
+                for (n, labels), histogram in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for le, count in histogram.cumulative():
+                        lines.append(f'{series(name + "_bucket", labels, le=le)} {count}')
+                    lines.append(f'{series(name + "_sum", labels)} {histogram.sum}')
+                    lines.append(f'{series(name + "_count", labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str):
+        """
+        Write the metrics to path, atomically: as a Prometheus textfile if path ends with
+        `.prom`, as JSON otherwise.
+        """
+        content = self.prometheus() if path.endswith('.prom') else json.dumps(self.dict(), indent=2)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(content)
+        os.replace(tmp, path)
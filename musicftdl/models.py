@@ -3,11 +3,11 @@
 import os
 from typing import List
 
-from dateutil import parser
 from pydantic import BaseModel, validator
 
 from musicftdl.utils import (convert_seconds_to_dtstr,
-                             convert_to_safe_filename, mkdirs_if_not_exist)
+                             convert_to_safe_filename, mkdirs_if_not_exist,
+                             parse_date)
 
 
 class API(BaseModel):
@@ -17,6 +17,7 @@ class API(BaseModel):
     album_songs: str = 'http://mapi.lonsty.me/album/songs?albummid={}'
     song_info: str = 'http://mapi.lonsty.me/song?songmid={}'
     song_url: str = 'http://mapi.lonsty.me/song/url?id={}&type={}'
+    song_urls: str = 'http://mapi.lonsty.me/song/urls?id={}&type={}'
 
 
 class Consts(BaseModel):
@@ -28,6 +29,30 @@ class Consts(BaseModel):
         'https': 'https://183.129.244.16:33238'
     }
     timeout: tuple = (15, 30)
+    chunk_size: int = 8192
+    url_batch_size: int = 50
+    # Pages fetched concurrently when fetching all pages.
+    page_workers: int = 4
+    # Keyword searches per second, of a batch of keywords.
+    search_rate: float = 10
+    # Hosts to keep connections for, and connections kept alive per host.
+    pool_connections: int = 10
+    pool_maxsize: int = 64
+    # Requests per second allowed to each host, audio CDN hosts get `default_host_rate`.
+    host_rates: dict = {
+        'mapi.lonsty.me': 50,
+        'y.gtimg.cn': 20,
+    }
+    default_host_rate: float = 50
+    # Seconds to keep data of each API endpoint in the metadata cache.
+    cache_ttls: dict = {
+        'search': 24 * 3600,
+        'singer_album': 24 * 3600,
+        'album': 30 * 24 * 3600,
+        'album_songs': 30 * 24 * 3600,
+        'song_info': 30 * 24 * 3600,
+        'song_url': 10 * 60,  # Play URLs expire soon
+    }
 
 
 class SearchResult(BaseModel):
@@ -102,7 +127,7 @@ class Album(BaseModel):
 
     @property
     def publish_date(self):
-        return parser.parse(self.publish_time)
+        return parse_date(self.publish_time)
 
     @property
     def album_cover_bg_url(self):
@@ -121,7 +146,33 @@ class Singer(BaseModel):
     albums: List[Album] = None
 
 
-class SongInfo(BaseModel):
+class SongProperties:
+    """Properties of a song derived from its fields, shared by SongInfo and Track."""
+    __slots__ = ()
+
+    @property
+    def singer_mid(self):
+        return self.singers_mid[0] if self.singers_mid else None
+
+    @property
+    def singer_name(self):
+        return '&'.join(self.singers_name) if self.singers_name else None
+
+    @property
+    def album_singer_name(self):
+        return '&'.join(self.album_singers_name) if self.album_singers_name else self.singer_name
+
+    @property
+    def publish_date(self):
+        return parse_date(self.publish_time)
+
+    @property
+    def album_cover_bg_url(self):
+        if self.album_mid:
+            return f'https://y.gtimg.cn/music/photo_new/T002R800x800M000{self.album_mid}.jpg?max_age=2592000'
+
+
+class SongInfo(SongProperties, BaseModel):
     song_mid: str = None
     song_name: str = None
     duration: int = None
@@ -147,22 +198,52 @@ class SongInfo(BaseModel):
         return convert_seconds_to_dtstr(v)
 
 
-    @property
-    def singer_name(self):
-        return '&'.join(self.singers_name) if self.singers_name else None
+class Track(SongProperties):
+    """
+    A song of an album on its way through the download pipeline, in place of a Song and
+    the SongInfo built from it. It has the fields and properties of SongInfo in slots,
+    without validation, and the album fields, cover bytes included, are the album's own
+    objects, not copies. Pydantic models are still returned by the API functions.
+    Usage:
+        track = Track(song_mid='001xxx', song_name='Song', album_mid=album.album_mid,
+                      album_cover_content=album.album_cover_content)
+    """
+    __slots__ = tuple(SongInfo.__fields__)
 
-    @property
-    def album_singer_name(self):
-        return '&'.join(self.album_singers_name) if self.album_singers_name else self.singer_name
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __repr__(self):
+        return f'Track(song_mid={self.song_mid!r}, song_name={self.song_name!r})'
+
+    def dict(self, exclude: set=None) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__ if not exclude or name not in exclude}
 
-    @property
-    def publish_date(self):
-        return parser.parse(self.publish_time)
+
+class Resource(BaseModel):
+    """A resource to download: a song, album or singer by its mid, or a keyword to search."""
+    type: str = 'song'
+    resource: str = None
+
+    @validator('type')
+    def check_type(cls, v):
+        if v not in ('song', 'album', 'singer', 'keyword'):
+            raise ValueError(f'Unknown resource type <{v}>')
+        return v
+
+
+class ResourceReport(BaseModel):
+    type: str = None
+    resource: str = None
+    downloaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    error: str = None
 
     @property
-    def album_cover_bg_url(self):
-        if self.album_mid:
-            return f'https://y.gtimg.cn/music/photo_new/T002R800x800M000{self.album_mid}.jpg?max_age=2592000'
+    def ok(self):
+        return self.error is None and self.failed == 0
 
 
 class DownloadArgs(BaseModel):
@@ -178,12 +259,24 @@ class DownloadArgs(BaseModel):
     format: str = None
     page: int = None
     page_size: int = None
+    all_pages: bool = False
+    chunk_size: int = 8192
+    workers: int = 20
+    max_workers: int = 64
+    search_workers: int = 8
+    tag_workers: int = None
+    url_batch_size: int = 50
     proxy: str = None
 
     @property
     def extension(self):
         return 'mp3' if self.format in ['128', '320'] else self.format
 
+    @property
+    def song_workers(self):
+        """Threads of songs, as many as hosts may be raised to from `workers` concurrent requests."""
+        return max(self.workers, self.max_workers)
+
     def format_name(self, song: SongInfo) -> str:
         if self.name_style == 3:
             basename = f'{song.singer_name} - {song.album_name} - {song.song_name}.{self.extension}'
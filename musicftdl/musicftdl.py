@@ -1,63 +1,319 @@
 """Main module."""
+import json
 import os
+import re
+import shutil
+import sys
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed, wait
-from typing import List
+import unicodedata
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Optional, Union
+from urllib.parse import urlsplit
 
-import eyed3
 from requests import Response, Session, exceptions
 
+from musicftdl.cache import CoverCache, MetadataCache
 from musicftdl.id3_genres import Genre
-from musicftdl.models import (Album, Consts, DownloadArgs, SearchResult,
-                              Singer, Song, SongInfo)
-from musicftdl.utils import retry
+from musicftdl.library import LibraryIndex
+from musicftdl.metrics import Metrics
+from musicftdl.models import (Album, Consts, DownloadArgs, Resource,
+                              ResourceReport, SearchResult,
+                              Singer, Song, SongInfo, Track)
+from musicftdl.paths import PathPlanner
+from musicftdl.progress import Progress
+from musicftdl.retries import RetryPolicy
+from musicftdl.scheduler import Scheduler
+from musicftdl.session import PoolStats, new_session
+from musicftdl.state import SyncState
+from musicftdl.throttle import BandwidthLimit, HostThrottle, TokenBucket
+from musicftdl.utils import convert_seconds_to_dtstr
 
 consts = Consts()
-thread_local = threading.local()
-eyed3.log.setLevel("ERROR")
+metadata_cache = MetadataCache(ttls=consts.cache_ttls)
+cover_cache = CoverCache()
+# Prints files as they are done, unless running, see `musicftdl.progress`.
+progress = Progress()
+# Disabled unless a run asks for its metrics, see `musicftdl.metrics`.
+metrics = Metrics()
+# Connections opened and reused, also counted by metrics.
+pool_stats = PoolStats(metrics)
+session = new_session(consts.pool_connections, consts.pool_maxsize, pool_stats)
+# Set to False once the API turns out to have no batch endpoint for song URLs.
+batch_song_url_supported = True
+# Keyword searches by normalized query, see `resolve_keyword`.
+_keywords = {}
+_keywords_lock = threading.Lock()
+search_bucket = TokenBucket(consts.search_rate)
+# Library index per destination folder, see `get_library`.
+libraries = {}
+_libraries_lock = threading.Lock()
+# Path planner per destination and naming options, see `get_planner`.
+planners = {}
+_planners_lock = threading.Lock()
+# Songs being downloaded, by (destination, str_media_mid or song_mid, format), see `fetch_song_chore`.
+_media_downloads = {}
+_media_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # Tagging pulls in eyed3, so it's imported by the functions writing tags, on first use.
+    if name == 'add_tags':
+        from musicftdl import tagging
+        return tagging.add_tags
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+if sys.version_info < (3, 7):
+    # Modules have no __getattr__ before Python 3.7 (PEP 562), add_tags is imported right away.
+    from musicftdl.tagging import add_tags  # noqa: F401
 
 
 def _get_session() -> Session:
     """
-    Get a instance of requests.Session
+    Get the instance of requests.Session shared by all threads, so connections are kept
+    alive across albums and stages of a run.
     :return: requests.Session
     """
-    if not hasattr(thread_local, "session"):
-        thread_local.session = Session()
-    return thread_local.session
+    return session
+
+
+def get_library(destination: str, rescan: bool=False, manage: bool=False) -> LibraryIndex:
+    """
+    Get the library index of the destination, shared by all threads. Only destinations with
+    an index already, or those of bulk downloads, are managed: scanned and given an index,
+    so that downloading a song into the home folder does not list the whole home folder.
+    :param rescan: scan the destination again, as a run starts.
+    :param manage: make the destination a managed library, as bulk downloads start.
+    """
+    key = os.path.abspath(destination)
+    with _libraries_lock:
+        library = libraries.get(key)
+        if library is not None and not rescan:
+            return library
+        managed = manage or (library is not None and library.managed) or \
+            os.path.isfile(os.path.join(key, '.musicftdl.db'))
+        if library is None or library.managed != managed:
+            if library is not None:
+                library.close()
+            library = libraries[key] = LibraryIndex(key, managed=managed)
+        else:
+            library.paths = None
+    return library
+
+
+def get_planner(args: DownloadArgs, reset: bool=False) -> PathPlanner:
+    """
+    Get the path planner of the destination and naming options of args, shared by all threads.
+    :param reset: forget planned filenames and created folders, as a run starts.
+    """
+    key = PathPlanner.key(args)
+    with _planners_lock:
+        planner = planners.get(key)
+        if planner is None or reset:
+            planner = planners[key] = PathPlanner(args, get_library(args.destination))
+    return planner
+
+
+def plan_filenames(songs: list, args: DownloadArgs, library: LibraryIndex, exclude: set=None) -> set:
+    """
+    Plan the filenames of all songs of an album, creating the folders of songs to download,
+    and log renamed songs. Songs excluded or downloaded already are planned too, so that each
+    song gets the same filename whichever of them are downloaded by a run.
+    :param exclude: song_mids not to download.
+    :return: song_mids of the songs found in the library, which are not downloaded again.
+    """
+    found = {}
+    for song in songs if not args.overwrite else ():
+        indexed = library.get(song.song_mid, args.format)
+        if indexed:
+            # Planned filenames are relative to the destination as given.
+            found[song.song_mid] = os.path.join(args.destination, os.path.relpath(indexed[0], library.destination))
+    skipped = set(found).union(exclude or ())
+    for song, filename in get_planner(args).plan(songs, skipped, found):
+        if song.song_mid not in skipped:
+            progress.log(f'{song.song_name} [Saved as {os.path.basename(filename)}, another song has its name]')
+    return set(found)
 
 
 class DataNotFoundError(Exception):
     pass
 
 
-@retry(Exception)
-def session_request(url: str, method: str='GET') -> Response:
+def is_throttled(e: Exception) -> bool:
+    """Whether the exception means the host is overloaded and should get fewer requests."""
+    if isinstance(e, exceptions.HTTPError):
+        return e.response is not None and (e.response.status_code == 429 or e.response.status_code >= 500)
+    return isinstance(e, (exceptions.ConnectionError, exceptions.Timeout))
+
+
+def is_transient(e: Exception) -> bool:
+    """Whether the request may succeed if retried, e.g. not for a 404 of a dead song URL."""
+    if isinstance(e, exceptions.HTTPError):
+        return e.response is not None and e.response.status_code in (408, 425, 429, 500, 502, 503, 504)
+    return isinstance(e, (exceptions.ConnectionError, exceptions.Timeout, exceptions.ChunkedEncodingError))
+
+
+def retry_after(e: Exception) -> float:
+    """Seconds to wait as asked by the Retry-After header of the error's response, if any."""
+    value = getattr(getattr(e, 'response', None), 'headers', {}).get('Retry-After')
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+host_throttle = HostThrottle(consts.host_rates, consts.default_host_rate, is_throttled=is_throttled)
+# Unlimited unless configured, e.g. by --max-rate.
+bandwidth = BandwidthLimit()
+retry_policy = RetryPolicy(host=lambda url, *args, **kwargs: urlsplit(url).hostname,
+                           is_transient=is_transient, retry_after=retry_after,
+                           on_retry=lambda host, e: metrics.count('retries', host=host))
+
+
+@retry_policy
+def session_request(url: str, method: str='GET', stream: bool=False, headers: dict=None) -> Response:
+    """
+    Send a request with the shared session, within the rate and concurrency limits of its host.
+    :param stream: if True, return the response with its body unread, the caller
+        must consume and close it (e.g. use it as a context manager).
+    :param headers: extra headers sent along with the default ones.
+    :return: requests.Response
+    """
     session = _get_session()
+    headers = {**consts.headers, **headers} if headers else consts.headers
+    host = urlsplit(url).hostname
+
+    if not stream:
+        with host_throttle.slot(url), metrics.timer('http', host=host):
+            with session.request(method, url, headers=headers, timeout=consts.timeout) as resp:
+                resp.raise_for_status()
+                return resp
+
+    # The slot of the host is held until the body is read and the response closed, so that
+    # concurrent transfers are limited, not only the requests starting them.
+    release = host_throttle.acquire(url)
+    try:
+        with metrics.timer('http', host=host):
+            resp = session.request(method, url, headers=headers, timeout=consts.timeout, stream=True)
+            try:
+                resp.raise_for_status()
+            except Exception:
+                resp.close()
+                raise
+    except Exception as e:
+        release(host_throttle.is_throttled(e))
+        raise
+    resp.close = _release_on_close(resp.close, release)
+    return resp
 
-    with session.request(method, url, headers=consts.headers, timeout=consts.timeout) as resp:
-        resp.raise_for_status()
-        return resp
+
+def _release_on_close(close, release):
+    """Wrap the close method of a response to release the slot of its host once."""
+    released = False
+
+    def wrapper():
+        nonlocal released
+        try:
+            close()
+        finally:
+            if not released:
+                released = True
+                release()
+
+    return wrapper
 
 
 def get_json_data(resp):
     try:
         res = resp.json()
     except Exception as e:
-        print(e)
+        progress.log(e)
         return {}
     else:
-        if res.get('result') != 100:
-            raise DataNotFoundError(res.get('errMsg'))
-        data = res.get('data')
-        if not data:
-            raise DataNotFoundError('Data is empty')
-        return data
+        return parse_json_data(res)
 
 
+def fetch_data(endpoint: str, *params, refresh: bool=False):
+    """
+    Get the data of an API endpoint, from the metadata cache if it holds a fresh copy.
+    :param endpoint: name of the URL template in `consts.api`.
+    :param params: parameters to format the URL template with.
+    :param refresh: if True, fetch the data from the API and refresh the cache.
+    """
+    data = None if refresh else metadata_cache.get(endpoint, params)
+    if data is None:
+        data = get_json_data(session_request(getattr(consts.api, endpoint).format(*params)))
+        metadata_cache.set(endpoint, params, data)
+    return data
+
+
+def parse_json_data(res: dict):
+    if res.get('result') != 100:
+        raise DataNotFoundError(res.get('errMsg'))
+    data = res.get('data')
+    if not data:
+        raise DataNotFoundError('Data is empty')
+    return data
+
+
+@metrics.instrument('search')
 def search(key: str, page: int=1, page_size: int=20) -> List[SearchResult]:
-    data = get_json_data(session_request(consts.api.search.format(key, page, page_size)))
+    data = fetch_data('search', key, page, page_size)
+    return parse_search(data)
+
+
+def normalize_query(key: str) -> str:
+    """
+    Normalize a keyword, so that queries differing only in case, full/half width characters,
+    separators or spaces, like "Jay Chou - Mojito" and "jay chou mojito", share one search.
+    """
+    key = unicodedata.normalize('NFKC', key).casefold()
+    return re.sub(r'[\s\-|/\\~·–—]+', ' ', key).strip()
+
+
+def resolve_keyword(key: str) -> Optional[SearchResult]:
+    """
+    Search a keyword for its best matching song, or None. Searches are memoized by normalized
+    query for the life of the process, and a query searched by another thread is waited for
+    instead of being searched again. Searches are rate-limited to `consts.search_rate`.
+    """
+    query = normalize_query(key)
+    with _keywords_lock:
+        future = _keywords.get(query)
+        searching = future is None
+        if searching:
+            future = _keywords[query] = Future()
+    if not searching:
+        return future.result()
 
+    try:
+        search_bucket.acquire()
+        try:
+            result = search(query, page=1, page_size=1)
+        except DataNotFoundError:
+            result = []
+    except Exception as e:
+        # Not memoized, the next one to ask searches again.
+        with _keywords_lock:
+            _keywords.pop(query, None)
+        future.set_exception(e)
+        raise
+    future.set_result(result[0] if result else None)
+    return future.result()
+
+
+def iter_search(key: str, page_size: int=20) -> Iterator[SearchResult]:
+    """Yield search results of all pages, see `iter_pages`."""
+    return iter_pages('search', parse_search, key, page_size=page_size)
+
+
+def parse_search(data: dict) -> List[SearchResult]:
     result = []
     for item in data.get('list', []):
         result.append(SearchResult(
@@ -73,9 +329,62 @@ def search(key: str, page: int=1, page_size: int=20) -> List[SearchResult]:
     return result
 
 
-def get_singer_albums(singer_mid: str, page: int=1, page_size: int=50) -> List[Album]:
-    data = get_json_data(session_request(consts.api.singer_album.format(singer_mid, page, page_size)))
+@metrics.instrument('get_singer_albums')
+def get_singer_albums(singer_mid: str, page: int=1, page_size: int=50, refresh: bool=False) -> List[Album]:
+    data = fetch_data('singer_album', singer_mid, page, page_size, refresh=refresh)
+    return parse_singer_albums(data)
+
+
+def iter_singer_albums(singer_mid: str, page_size: int=50, refresh: bool=False) -> Iterator[Album]:
+    """Yield albums of the singer of all pages, see `iter_pages`."""
+    return iter_pages('singer_album', parse_singer_albums, singer_mid, page_size=page_size, refresh=refresh)
+
+
+def iter_pages(endpoint: str, parse, *params, page_size: int=50, refresh: bool=False,
+               workers: int=consts.page_workers) -> Iterator:
+    """
+    Yield the items of all pages of a paged endpoint. The total read from the first page
+    tells how many pages there are, which are fetched concurrently and yielded as they
+    arrive. Without a total, pages are walked one after another until a short one.
+    :param parse: function parsing the data of a page to a list of items.
+    :param params: parameters of the URL template, less page No. and page size.
+    :param workers: number of pages fetched concurrently.
+    """
+    data = fetch_data(endpoint, *params, 1, page_size, refresh=refresh)
+    items = parse(data)
+    yield from items
+    total = data.get('total')
+
+    if not isinstance(total, int):
+        page = 1
+        while len(items) >= page_size:
+            page += 1
+            try:
+                items = parse(fetch_data(endpoint, *params, page, page_size, refresh=refresh))
+            except DataNotFoundError:
+                return
+            yield from items
+        return
 
+    pages = -(-total // page_size)
+    if pages < 2:
+        return
+    with ThreadPoolExecutor(max_workers=min(workers, pages - 1)) as executor:
+        futures = [executor.submit(fetch_data, endpoint, *params, page, page_size, refresh=refresh)
+                   for page in range(2, pages + 1)]
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield from parse(future.result())
+                except DataNotFoundError:
+                    # The total shrank since the first page.
+                    continue
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def parse_singer_albums(data: dict) -> List[Album]:
     result = []
     for idx, item in enumerate(reversed(data.get('list', []))):
         result.append(Album(
@@ -93,9 +402,13 @@ def get_singer_albums(singer_mid: str, page: int=1, page_size: int=50) -> List[A
     return result
 
 
+@metrics.instrument('get_album')
 def get_album(album_mid: str) -> Album:
-    data = get_json_data(session_request(consts.api.album.format(album_mid)))
+    data = fetch_data('album', album_mid)
+    return parse_album(data)
+
 
+def parse_album(data: dict) -> Album:
     album = Album(
         album_mid=data.get('mid'),
         album_name=data.get('name'),
@@ -111,13 +424,24 @@ def get_album(album_mid: str) -> Album:
 
 
 def get_album_cover(album_mid: str) -> str:
-    data = get_json_data(session_request(consts.api.album.format(album_mid)))
+    data = fetch_data('album', album_mid)
 
     return 'http:' + data.get('picUrl')
 
 
+@metrics.instrument('get_album_cover_content')
+def get_album_cover_content(album_mid: str, url: str) -> bytes:
+    """Get the cover image of an album, downloading it only if it's not in the cover cache."""
+    return cover_cache.get(album_mid, lambda: session_request(url).content)
+
+
+@metrics.instrument('get_album_songs')
 def get_album_songs(album_mid: str) -> List[Song]:
-    data = get_json_data(session_request(consts.api.album_songs.format(album_mid)))
+    data = fetch_data('album_songs', album_mid)
+    return parse_album_songs(data)
+
+
+def parse_album_songs(data: dict) -> List[Song]:
     result = []
 
     for idx, item in enumerate(data.get('list', [])):
@@ -134,12 +458,98 @@ def get_album_songs(album_mid: str) -> List[Song]:
     return result
 
 
+@metrics.instrument('get_album_songs')
+def get_album_tracks(album: Album) -> List[Track]:
+    """Songs of the album as tracks for the download pipeline, see `musicftdl.models.Track`."""
+    data = fetch_data('album_songs', album.album_mid)
+    return parse_album_tracks(data, album)
+
+
+def parse_album_tracks(data: dict, album: Album) -> List[Track]:
+    result = []
+    album_cover_url = album.album_cover_bg_url
+
+    for item in data.get('list', []):
+        singers = item.get('singer', [{}])
+        interval = item.get('interval')
+        result.append(Track(
+            song_mid=item.get('mid'),
+            song_name=item.get('name'),
+            song_index=item.get('index_album'),
+            singers_mid=[it.get('mid') for it in singers],
+            singers_name=[it.get('name') for it in singers],
+            duration=convert_seconds_to_dtstr(interval) if interval is not None else None,
+            genre=item.get('genre'),
+            str_media_mid=item.get('file', {}).get('media_mid'),
+            album_mid=album.album_mid,
+            album_name=album.album_name,
+            album_singers_mid=album.singers_mid,
+            album_singers_name=album.singers_name,
+            album_cover_url=album_cover_url,
+            album_cover_content=album.album_cover_content,
+            company=album.company,
+            language=album.language,
+            publish_time=album.publish_time
+        ))
+    return result
+
+
+@metrics.instrument('get_song_url')
 def get_song_url(song_mid: str, format: str= '128') -> str:
-    return get_json_data(session_request(consts.api.song_url.format(song_mid, format)))
+    return fetch_data('song_url', song_mid, format)
+
+
+@metrics.instrument('get_song_urls')
+def get_song_urls(song_mids: List[str], format: str='128', batch_size: int=consts.url_batch_size,
+                  fallback: bool=True) -> dict:
+    """
+    Resolve play URLs of many songs with one request per `batch_size` songs.
+    :param fallback: resolve the songs one by one when the API has no batch endpoint.
+        Otherwise, leave them out of the result for the caller to resolve.
+    :return: dict of song_mid to URL, songs without a URL are left out.
+    """
+    global batch_song_url_supported
 
+    urls = {}
+    for mid in song_mids:
+        url = metadata_cache.get('song_url', (mid, format))
+        if url is not None:
+            urls[mid] = url
+    missing = [mid for mid in song_mids if mid not in urls]
 
+    for i in range(0, len(missing) if batch_song_url_supported else 0, batch_size):
+        batch = missing[i:i + batch_size]
+        try:
+            data = get_json_data(session_request(consts.api.song_urls.format(','.join(batch), format)))
+        except exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                batch_song_url_supported = False
+                break
+            raise
+        except DataNotFoundError:
+            continue
+        for mid in batch:
+            if data.get(mid):
+                urls[mid] = data[mid]
+                metadata_cache.set('song_url', (mid, format), data[mid])
+
+    if fallback and not batch_song_url_supported:
+        for mid in song_mids:
+            if mid not in urls:
+                try:
+                    urls[mid] = get_song_url(mid, format)
+                except DataNotFoundError:
+                    pass
+    return urls
+
+
+@metrics.instrument('get_song_info')
 def get_song_info(song_mid: str) -> SongInfo:
-    data = get_json_data(session_request(consts.api.song_info.format(song_mid)))
+    data = fetch_data('song_info', song_mid)
+    return parse_song_info(data)
+
+
+def parse_song_info(data: dict) -> SongInfo:
     song_info = SongInfo(
         song_mid=data.get('track_info', {}).get('mid'),
         song_name=data.get('track_info', {}).get('name'),
@@ -153,103 +563,367 @@ def get_song_info(song_mid: str) -> SongInfo:
         genre=Genre.get_num(data.get('info', {}).get('genre', {}).get('content', [{}])[0].get('value')),
         introduction=data.get('info', {}).get('intro', {}).get('content', [{}])[0].get('value'),
         language=data.get('info', {}).get('lan', {}).get('content', [{}])[0].get('value'),
-        publish_time=data.get('info', {}).get('pub_time', {}).get('content', [{}])[0].get('value')
+        publish_time=data.get('info', {}).get('pub_time', {}).get('content', [{}])[0].get('value'),
+        str_media_mid=data.get('track_info', {}).get('file', {}).get('media_mid')
     )
     return song_info
 
 
-def download_music(url: str, filename: str, overwrite: bool=False):
-    if os.path.isfile(filename) \
-        and not overwrite \
-        and os.path.getsize(filename) > 0:
-        print(f'{filename} [Skipped]')
+@metrics.instrument('download_music')
+def download_music(url: str, filename: str, overwrite: bool=False, chunk_size: int=consts.chunk_size,
+                   tag: Union[bytes, Future]=None, library: LibraryIndex=None):
+    """
+    Download url to filename through a `.part` file, which is renamed to filename once
+    the download completes. An existing `.part` file is resumed with a Range request.
+    :param tag: rendered ID3 tag, or a future of it, written ahead of the audio in place of
+        the ID3v2 tag the audio may start with, so that the file is written once.
+    :param library: index of the destination, to tell which files exist without a stat.
+    :return: True if downloaded, False if skipped, None on error.
+    """
+    from musicftdl.tagging import id3v2_size, parse_id3v2_size, strip_id3v2
+
+    if not overwrite and _file_size(filename, library) > 0:
+        if isinstance(tag, Future):
+            tag.cancel()
+        progress.done(filename, 'skipped')
         return False
 
+    part = filename + '.part'
+    offset = _file_size(part, library) if not overwrite else 0
+    tag_size = id3v2_size(part) if tag and offset else 0
+    if tag and offset and not tag_size:
+        offset = 0  # Not started by a tagging download, start over.
+    meta = read_part_meta(part) if offset else {}
+
+    # Offset of the audio in the body, which is past its own ID3v2 tag when resuming with a tag.
+    body_offset = offset
+    if tag_size and offset:
+        try:
+            with session_request(url, stream=True, headers={'Range': 'bytes=0-9'}) as resp:
+                body_offset = offset - tag_size + parse_id3v2_size(resp.raw.read(10))
+        except Exception as e:
+            progress.log(e)
+            return
+
+    headers = None
+    if body_offset:
+        headers = {'Range': f'bytes={body_offset}-'}
+        if meta.get('validator'):
+            # Answered with the whole body if the song changed since the `.part` file was started.
+            headers['If-Range'] = meta['validator']
+    received = 0
     try:
-        resp = session_request(url)
+        resp = session_request(url, stream=True, headers=headers)
+    except exceptions.HTTPError as e:
+        if e.response is None or not is_complete_part(e.response.status_code, e.response.headers, body_offset):
+            if e.response is not None and e.response.status_code == 416 and body_offset:
+                # The `.part` file is longer than the song, of another version of it: start over.
+                discard_part(part, library)
+                return download_music(url, filename, overwrite, chunk_size, tag, library)
+            progress.log(e)
+            return
     except Exception as e:
-        print(e)
+        progress.log(e)
+        return
     else:
-        if resp is not None:
-            with open(filename, 'wb') as f:
-                for chunk in resp.iter_content(8192):
+        if resp.status_code == 206 and meta.get('size') and content_range_size(resp.headers) != meta['size']:
+            # Without validators, a song of another size is another version of it.
+            resp.close()
+            discard_part(part, library)
+            return download_music(url, filename, overwrite, chunk_size, tag, library)
+        if resp.status_code != 206:
+            write_part_meta(part, resp.headers)
+        expected = -1 if 'Content-Encoding' in resp.headers else int(resp.headers.get('Content-Length', -1))
+
+        def counted(chunks):
+            nonlocal received
+            for chunk in chunks:
+                received += len(chunk)
+                progress.advance(len(chunk))
+                yield chunk
+
+        try:
+            with resp:
+                chunks = counted(bandwidth.limit(resp.iter_content(chunk_size), url))
+                if resp.status_code == 206:
+                    mode = 'ab'
+                elif tag:
+                    # Servers that ignore Range answer 200 with the whole body, so start over.
+                    # The tag may still be rendered by the tag stage while the headers arrived.
+                    with open(part, 'wb') as f:
+                        f.write(_tag_result(tag) or b'')
+                    chunks, mode = strip_id3v2(chunks), 'ab'
+                else:
+                    mode = 'wb'
+                with open(part, mode) as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+        except Exception as e:
+            progress.log(f'{e}, {filename} [Incomplete]')
+            return
+        if 0 <= expected != received:
+            progress.log(f'Received {received} of {expected} bytes, {filename} [Incomplete]')
+            return
+
+    os.replace(part, filename)
+    discard_part(part)
+    metrics.count('bytes', received, stage='download_music')
+    progress.done(filename, 'downloaded')
+    return True
+
+
+@metrics.instrument('copy_music')
+def copy_music(source: str, filename: str, tag: Union[bytes, Future]=None):
+    """
+    Save the audio of source, the same recording downloaded before, to filename instead of
+    downloading it again: as a hardlink, or a copy where hardlinks are not supported.
+    :param tag: ID3 tag of this copy, written in place of the source's own, so the copy
+        can't be a link.
+    :return: True if copied, False if filename is source, None on error.
+    """
+    from musicftdl.tagging import strip_id3v2
+
+    if os.path.abspath(source) == os.path.abspath(filename):
+        return False
+
+    part = filename + '.part'
+    try:
+        if os.path.lexists(part):
+            os.remove(part)
+        if tag is not None:
+            with open(source, 'rb') as src, open(part, 'wb') as f:
+                f.write(_tag_result(tag) or b'')
+                for chunk in strip_id3v2(iter(lambda: src.read(consts.chunk_size), b'')):
                     f.write(chunk)
-            print(filename)
-            return True
+        else:
+            try:
+                os.link(source, part)
+            except OSError:
+                shutil.copyfile(source, part)
+        os.replace(part, filename)
+    except Exception as e:
+        progress.log(f'{e}, {filename} [Incomplete]')
+        return None
+    progress.done(f'{filename} [Copied from {source}]', 'downloaded')
+    return True
+
+
+def _file_size(filename: str, library: LibraryIndex=None) -> int:
+    if library is not None:
+        return library.size(filename)
+    return os.path.getsize(filename) if os.path.isfile(filename) else 0
 
 
-def add_tags(filename: str, song_info: SongInfo):
+def _tag_result(tag: Union[bytes, Future]) -> bytes:
+    if isinstance(tag, Future):
+        # Tags are rendered in other processes, only the wait for them is timed here.
+        with metrics.timer('tag_wait'):
+            try:
+                return tag.result()
+            except Exception:
+                return None
+    return tag
+
+
+def is_complete_part(status_code: int, headers, offset: int) -> bool:
+    """Whether a 416 response says the `.part` file already holds the whole body."""
+    if status_code != 416 or not offset:
+        return False
+    return content_range_size(headers) == offset
+
+
+def content_range_size(headers) -> Optional[int]:
+    """Size of the whole body, as told by the Content-Range header of a response."""
+    total = headers.get('Content-Range', '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+
+def read_part_meta(part: str) -> dict:
+    """Validator and size of the body a `.part` file was started from, saved alongside it."""
     try:
-        audiofile = eyed3.load(filename)
-
-        audiofile.tag.title = song_info.song_name
-        audiofile.tag.artist = song_info.singer_name
-        # audiofile.tag.genre = song_info.genre
-        audiofile.tag.album = song_info.album_name
-        audiofile.tag.album_artist = song_info.album_singer_name
-        # audiofile.tag.album_type = song.genre
-        audiofile.tag.track_num = (song_info.song_index, 0)
-        # audiofile.tag.disc_num = (None, None)
-        audiofile.tag.publisher = song_info.company
-        audiofile.tag.copyright = song_info.company
-        audiofile.tag.recording_date = song_info.publish_date
-        audiofile.tag.release_date = song_info.publish_time
-        # audiofile.tag.best_release_date = song.publish_date
-        audiofile.tag.images.set(3, song_info.album_cover_content, 'image/jpeg', song_info.album_name + '.JPG')
-        audiofile.tag.save(encoding='utf-8')
-    except Exception:
+        with open(part + '.meta') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_part_meta(part: str, headers):
+    """Save the validator and size of the body, from the response starting a `.part` file."""
+    etag = headers.get('ETag')
+    size = None if 'Content-Encoding' in headers else headers.get('Content-Length')
+    meta = {
+        # Weak ETags may not be used in If-Range.
+        'validator': etag if etag and not etag.startswith('W/') else headers.get('Last-Modified'),
+        'size': int(size) if size and size.isdigit() else None,
+    }
+    try:
+        with open(part + '.meta', 'w') as f:
+            json.dump(meta, f)
+    except OSError:
         pass
 
 
-def download_with_tags(filename: str, song_info: SongInfo, overwrite: bool=False, retag: bool=True):
-    downloaded = download_music(song_info.url, filename, overwrite)
-    if downloaded and retag:
-        add_tags(filename, song_info)
+def discard_part(part: str, library: LibraryIndex=None):
+    """Remove the `.part` file, if any, and what is saved alongside it."""
+    for name in (part, part + '.meta'):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+        if library is not None:
+            library.discard(name)
 
 
-def fetch_album_chore(album: Album, args: DownloadArgs) -> Album:
-    with ThreadPoolExecutor(max_workers=20) as pool:
-        album.songs = get_album_songs(album.album_mid)
-        song_url_futures = {pool.submit(get_song_url, song.song_mid, args.format): song
-                            for song in album.songs}
+def download_with_tags(filename: str, song_info: SongInfo, overwrite: bool=False, retag: bool=True,
+                       chunk_size: int=consts.chunk_size, tag: Future=None, library: LibraryIndex=None):
+    """
+    :param tag: future of the rendered tag from the tag stage, rendered here if not given.
+    """
+    if retag and tag is None:
+        from musicftdl.tagging import render_tag
+        with metrics.timer('render_tag'):
+            tag = render_tag(song_info)
+    return download_music(song_info.url, filename, overwrite, chunk_size, tag if retag else None, library)
 
-        cover_resp = session_request(album.album_cover_bg_url)
-        album.album_cover_content = cover_resp.content if cover_resp.status_code == 200 else b''
 
-        download_futures = {}
-        for future in as_completed(song_url_futures):
-            try:
-                result = future.result()
-            except Exception as e:
-                song = song_url_futures[future]
-                print(f'{e}, {song.singer_name} - {album.album_name} - '
-                      f'[{song.song_mid} {args.format}] {song.song_name}')
-            else:
-                song = song_url_futures[future]
-                song.url = result
-                song_info = SongInfo(
-                    song_mid=song.song_mid,
-                    song_name=song.song_name,
-                    singers_mid=song.singers_mid,
-                    singers_name=song.singers_name,
-                    album_mid=album.album_mid,
-                    album_name=album.album_name,
-                    album_singers_mid=album.singers_mid,
-                    album_singers_name=album.singers_name,
-                    album_cover_url=album.album_cover_bg_url,
-                    album_cover_content=album.album_cover_content,
-                    song_index=song.song_index,
-                    company=album.company,
-                    genre=song.genre,
-                    introduction=None,
-                    language=album.language,
-                    publish_time=album.publish_time,
-                    url=result,
-                    str_media_mid=song.str_media_mid
-                )
-                download_futures[pool.submit(download_with_tags, args.filename(song_info),
-                                             song_info, args.overwrite, args.retag)] = song_info
-        wait(download_futures)
+def build_song_info(song: Song, album: Album) -> SongInfo:
+    return SongInfo(
+        song_mid=song.song_mid,
+        song_name=song.song_name,
+        singers_mid=song.singers_mid,
+        singers_name=song.singers_name,
+        album_mid=album.album_mid,
+        album_name=album.album_name,
+        album_singers_mid=album.singers_mid,
+        album_singers_name=album.singers_name,
+        album_cover_url=album.album_cover_bg_url,
+        album_cover_content=album.album_cover_content,
+        song_index=song.song_index,
+        company=album.company,
+        genre=song.genre,
+        introduction=None,
+        language=album.language,
+        publish_time=album.publish_time,
+        url=song.url,
+        str_media_mid=song.str_media_mid
+    )
+
+
+def fetch_song_chore(song_info: SongInfo, args: DownloadArgs, tag: Future=None, callback=None):
+    """
+    :param callback: called with the song_info and the result of `download_music`.
+    """
+    library = get_library(args.destination)
+    if args.overwrite:
+        result = _write_song(_download_song, song_info, args, tag, library)
+    else:
+        # A song, or the same recording on other albums, is downloaded once, by the first
+        # chore to claim it. Others wait for it and look it up in the library.
+        key = (library.destination, song_info.str_media_mid or song_info.song_mid, args.format)
+        with _media_lock:
+            claimed = _media_downloads.get(key)
+            if claimed is None:
+                _media_downloads[key] = threading.Event()
+        if claimed is not None:
+            claimed.wait()
+        try:
+            result = _write_song(_fetch_or_copy_song, song_info, args, tag, library)
+        finally:
+            if claimed is None:
+                with _media_lock:
+                    _media_downloads.pop(key).set()
+    metrics.count('songs', result={True: 'downloaded', False: 'skipped'}.get(result, 'failed'))
+    if result is None:
+        progress.done(song_info.song_name, 'failed')
+    progress.album_song_done(song_info.album_mid)
+    if callback is not None:
+        callback(song_info, result)
+    return result
+
+
+def _write_song(write, song_info: SongInfo, args: DownloadArgs, tag: Future, library: LibraryIndex):
+    # The filename is held while the song is written, so that a song given it meanwhile
+    # waits for the song to be moved to its own filename.
+    planner = get_planner(args)
+    planner.acquire(song_info)
+    result = None
+    try:
+        result = write(song_info, args, tag, library)
+    finally:
+        planner.release(song_info, written=result is True)
+    return result
+
+
+def _fetch_or_copy_song(song_info: SongInfo, args: DownloadArgs, tag: Future, library: LibraryIndex):
+    # Found under any name style or album folder it was downloaded to.
+    found = library.get(song_info.song_mid, args.format)
+    if found:
+        if isinstance(tag, Future):
+            tag.cancel()
+        progress.done(found[0], 'skipped')
+        return False
+
+    source = library.find_media(song_info.str_media_mid, args.format)
+    if not source:
+        return _download_song(song_info, args, tag, library)
+    filename = get_planner(args).filename(song_info)
+    from musicftdl.tagging import render_tag
+    result = copy_music(source[0], filename, (tag or render_tag(song_info) or b'') if args.retag else None)
+    if result is not None:
+        library.add(song_info.song_mid, song_info.str_media_mid, args.format, filename)
+    return result
+
+
+def _download_song(song_info: SongInfo, args: DownloadArgs, tag: Future, library: LibraryIndex):
+    try:
+        song_info.url = song_info.url or get_song_url(song_info.song_mid, args.format)
+    except Exception as e:
+        progress.log(f'{e}, {song_info.singer_name} - {song_info.album_name} - '
+                     f'[{song_info.song_mid} {args.format}] {song_info.song_name}')
+        return None
+    filename = get_planner(args).filename(song_info)
+    result = download_with_tags(filename, song_info, args.overwrite, args.retag, args.chunk_size, tag, library)
+    if result is not None:
+        library.add(song_info.song_mid, song_info.str_media_mid, args.format, filename)
+    return result
+
+
+def fetch_album_chore(album: Album, args: DownloadArgs, scheduler: Scheduler=None, exclude: set=None,
+                      callback=None) -> Album:
+    """
+    Resolve songs and cover of the album, then submit a chore per song to the scheduler.
+    Without a scheduler, download the album on its own and wait until it is done.
+    :param exclude: song_mids not to download.
+    :param callback: passed to each `fetch_song_chore`.
+    """
+    from musicftdl.tagging import render_tag
+
+    if scheduler is None:
+        with Scheduler(max_workers=args.song_workers, max_tag_workers=args.tag_workers) as scheduler:
+            return fetch_album_chore(album, args, scheduler, exclude, callback)
+
+    # Tracks stand in for the Songs of the album, see `musicftdl.models.Track`.
+    album.songs = get_album_tracks(album)
+    songs = [song for song in album.songs if not exclude or song.song_mid not in exclude]
+    if not songs:
+        return album
+    progress.add(len(songs), album.album_mid, album.album_name)
+    found = plan_filenames(album.songs, args, get_library(args.destination), exclude)
+    album.album_cover_content = get_album_cover_content(album.album_mid, album.album_cover_bg_url)
+    # Songs left out are resolved one by one, concurrently, by their own chores.
+    try:
+        urls = get_song_urls([song.song_mid for song in songs], args.format, args.url_batch_size,
+                             fallback=False)
+    except Exception:
+        urls = {}
+
+    for track in songs:
+        track.url = urls.get(track.song_mid)
+        track.album_cover_content = album.album_cover_content
+        # Tags are rendered by the tag stage, off the threads doing network I/O, for the
+        # songs to download only: the chores of songs found in the library just skip them.
+        tag = scheduler.submit_tag(render_tag, track) if args.retag and track.song_mid not in found else None
+        scheduler.submit_song(fetch_song_chore, track, args, tag, callback)
     return album
 
 
@@ -257,14 +931,22 @@ def _download_by_song_mid(song_mid, args):
     song_info = get_song_info(song_mid)
     assert song_info.song_mid, f'Song <{song_mid}> not found!'
     song_info.url = get_song_url(song_info.song_mid, args.format)
-    song_info.album_cover_content = session_request(song_info.album_cover_bg_url).content
-    download_with_tags(args.filename(song_info), song_info, args.overwrite, args.retag)
+    song_info.album_cover_content = get_album_cover_content(song_info.album_mid, song_info.album_cover_bg_url)
+    progress.add(1)
+    fetch_song_chore(song_info, args)
 
 
 def download(args: DownloadArgs):
+    # Singers and albums make a library of the destination, single songs don't.
+    get_library(args.destination, rescan=True, manage=args.singer or args.album)
+    get_planner(args, reset=True)
+    # Hosts start at --workers concurrent requests, and are raised up to --max-workers.
+    host_throttle.configure(limit=args.workers, maximum=args.song_workers)
     if not any([args.singer, args.album, args.keywords]):
         return _download_by_song_mid(args.resource, args)
 
+    if args.singer and args.all_pages:
+        return _download_all_singer_albums(args)
     if args.singer:
         albums = get_singer_albums(args.resource, page=args.page, page_size=args.page_size)
         assert albums, f'Singer <{args.resource}> not found!'
@@ -274,9 +956,186 @@ def download(args: DownloadArgs):
         assert album.album_mid, f'Album <{args.resource}> not found!'
         singer = Singer(singer_mid=album.singer_mid, singer_name=album.singer_name, albums=[album])
     else:
-        result = search(args.resource, page=1, page_size=1)
+        result = resolve_keyword(args.resource)
         assert result, f'Resource <{args.resource}> not found!'
-        return _download_by_song_mid(result[0].song_mid, args)
+        return _download_by_song_mid(result.song_mid, args)
 
-    for album in args.filter_albums(singer.albums):
-        fetch_album_chore(album, args)
+    with Scheduler(max_workers=args.song_workers, max_tag_workers=args.tag_workers) as scheduler:
+        for album in args.filter_albums(singer.albums):
+            scheduler.submit_album(fetch_album_chore, album, args, scheduler)
+
+
+def parse_manifest(lines, default_type: str='song', strict: bool=True) -> Iterator[Union[Resource, ResourceReport]]:
+    """
+    Parse resources to download, one per line, as `TYPE:RESOURCE` (e.g. `album:003DFRzD192KKD`),
+    as a bare RESOURCE of the default type, or as a JSON object like `{"type": "singer",
+    "resource": "0025NhlN2yWrP4"}`. Blank lines and lines starting with `#` are ignored.
+    :param strict: raise ValueError on an invalid line, or else yield a failed ResourceReport
+        of it in its place and go on with the next lines, see `download_many`.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            yield _parse_manifest_line(line, default_type)
+        except (ValueError, TypeError) as e:
+            if strict:
+                raise ValueError(f'Invalid line {number} <{line}>: {e}') from e
+            yield ResourceReport(type='invalid', resource=line, error=f'Invalid line {number}: {e}')
+
+
+def _parse_manifest_line(line: str, default_type: str) -> Resource:
+    if line.startswith('{'):
+        return Resource(**json.loads(line))
+    type, sep, resource = line.partition(':')
+    type = type.strip().lower()
+    if sep and type in ('song', 'album', 'singer', 'keyword', 'keywords'):
+        return Resource(type=type.rstrip('s'), resource=resource.strip())
+    return Resource(type=default_type, resource=line)
+
+
+def download_many(args: DownloadArgs, resources) -> List[ResourceReport]:
+    """
+    Download mixed resources through one scheduler, sharing its pools, the caches and the
+    connections, and report the songs downloaded, skipped and failed of each resource.
+    :param resources: Resources, and ResourceReports of invalid lines of a manifest, which
+        are reported as they are.
+    """
+    get_library(args.destination, rescan=True, manage=True)
+    get_planner(args, reset=True)
+    host_throttle.configure(limit=args.workers, maximum=args.song_workers)
+    reports = []
+    lock = threading.Lock()
+
+    def counter(report: ResourceReport):
+        def count(song_info: SongInfo, result):
+            with lock:
+                if result:
+                    report.downloaded += 1
+                elif result is False:
+                    report.skipped += 1
+                else:
+                    report.failed += 1
+        return count
+
+    with Scheduler(max_workers=args.song_workers, max_tag_workers=args.tag_workers,
+                   max_search_workers=args.search_workers) as scheduler:
+        for resource in resources:
+            if isinstance(resource, ResourceReport):
+                reports.append(resource)
+                continue
+            report = ResourceReport(type=resource.type, resource=resource.resource)
+            reports.append(report)
+            # Keywords are searched on their own pool, and their songs downloaded as each resolves.
+            submit = scheduler.submit_search if resource.type == 'keyword' else scheduler.submit_album
+            submit(_resource_chore, resource, args, scheduler, report, counter(report))
+    return reports
+
+
+def _resource_chore(resource: Resource, args: DownloadArgs, scheduler: Scheduler, report: ResourceReport,
+                    callback):
+    try:
+        if resource.type == 'keyword':
+            result = resolve_keyword(resource.resource)
+            assert result, f'Resource <{resource.resource}> not found!'
+            _song_chore(result.song_mid, args, scheduler, callback)
+        elif resource.type == 'song':
+            _song_chore(resource.resource, args, scheduler, callback)
+        elif resource.type == 'album':
+            album = get_album(resource.resource)
+            assert album.album_mid, f'Album <{resource.resource}> not found!'
+            fetch_album_chore(album, args, scheduler, callback=callback)
+        else:
+            if args.all_pages:
+                albums = [album for album in iter_singer_albums(resource.resource, page_size=args.page_size)]
+            else:
+                albums = get_singer_albums(resource.resource, page=args.page, page_size=args.page_size)
+            assert albums, f'Singer <{resource.resource}> not found!'
+            for album in args.filter_albums(albums):
+                scheduler.submit_album(_album_chore, album, args, scheduler, report, callback)
+    except Exception as e:
+        report.error = str(e) or e.__class__.__name__
+
+
+def _album_chore(album: Album, args: DownloadArgs, scheduler: Scheduler, report: ResourceReport, callback):
+    try:
+        fetch_album_chore(album, args, scheduler, callback=callback)
+    except Exception as e:
+        report.error = str(e) or e.__class__.__name__
+
+
+def _song_chore(song_mid: str, args: DownloadArgs, scheduler: Scheduler, callback):
+    song_info = get_song_info(song_mid)
+    assert song_info.song_mid, f'Song <{song_mid}> not found!'
+    song_info.album_cover_content = get_album_cover_content(song_info.album_mid, song_info.album_cover_bg_url)
+    from musicftdl.tagging import render_tag
+    tag = scheduler.submit_tag(render_tag, song_info) if args.retag else None
+    progress.add(1)
+    scheduler.submit_song(fetch_song_chore, song_info, args, tag, callback)
+
+
+def _download_all_singer_albums(args: DownloadArgs):
+    """Download albums of all pages, each as soon as its page arrives."""
+    with Scheduler(max_workers=args.song_workers, max_tag_workers=args.tag_workers) as scheduler:
+        for album in iter_singer_albums(args.resource, page_size=args.page_size):
+            for album in args.filter_albums([album]):
+                scheduler.submit_album(fetch_album_chore, album, args, scheduler)
+
+
+def get_new_singer_albums(singer_mid: str, known: set, page_size: int=50) -> List[Album]:
+    """
+    Get albums of the singer not in `known`, walking pages from the newest albums until
+    a page holds a known album or is the last one.
+    """
+    result, page = [], 1
+    while True:
+        try:
+            albums = get_singer_albums(singer_mid, page, page_size, refresh=True)
+        except DataNotFoundError:
+            break
+        new = [album for album in albums if album.album_mid not in known]
+        result.extend(new)
+        if len(new) < len(albums) or len(albums) < page_size:
+            break
+        page += 1
+    return result
+
+
+def sync(args: DownloadArgs, singer_mids: List[str], state: SyncState=None):
+    """
+    Download songs of the singers which are new since the last sync into the destination:
+    songs of albums released since, and songs of albums not completely downloaded before.
+    """
+    state = state or SyncState(args.destination)
+    get_library(args.destination, rescan=True, manage=True)
+    get_planner(args, reset=True)
+    host_throttle.configure(limit=args.workers, maximum=args.song_workers)
+    downloaded = state.songs(args.format)
+
+    def record(song_info: SongInfo, result):
+        # Skipped songs already exist in the destination, they are synced too.
+        if result is not None:
+            state.add_song(song_info.song_mid, args.format, song_info.album_mid)
+
+    albums = []
+    try:
+        with Scheduler(max_workers=args.song_workers, max_tag_workers=args.tag_workers) as scheduler:
+            for singer_mid in singer_mids:
+                known = state.albums(singer_mid, args.format)
+                new = get_new_singer_albums(singer_mid, set(known), args.page_size or 50)
+                # Albums not completely downloaded last time are retried.
+                incomplete = [get_album(album_mid) for album_mid, complete in known.items() if not complete]
+                wanted = args.filter_albums(new)
+                # Albums left out by the filters are seen all the same, and not walked again.
+                for album_mid in {album.album_mid for album in new}.difference(album.album_mid for album in wanted):
+                    state.add_album(singer_mid, album_mid, args.format, True)
+                for album in wanted + incomplete:
+                    albums.append((singer_mid, album))
+                    scheduler.submit_album(fetch_album_chore, album, args, scheduler, downloaded, record)
+                progress.log(f'{singer_mid}: {len(new)} new albums, {len(incomplete)} incomplete albums')
+    finally:
+        downloaded = state.songs(args.format)
+        for singer_mid, album in albums:
+            complete = bool(album.songs) and all(song.song_mid in downloaded for song in album.songs)
+            state.add_album(singer_mid, album.album_mid, args.format, complete)
@@ -0,0 +1,172 @@
+"""Filenames of the songs of a run, planned an album at a time."""
+import os
+import threading
+from typing import List, Tuple
+
+from musicftdl.utils import convert_to_safe_filename
+
+
+class PathPlanner:
+    """
+    Plan the filenames of songs for the destination and naming options of a run. The folder
+    of each album, with its sanitized singer and album names, is computed once and created
+    once, as the songs of the album are planned together. A song planned to the filename
+    of another recording is told apart by its song_mid, instead of being skipped as if it
+    was downloaded already.
+    Of songs sharing a filename, the one with the least (album_mid, song_mid) keeps it,
+    whichever album is planned first, so that names are the same from run to run. A song
+    losing its filename is moved to its own, if it is written already. Songs downloaded by
+    earlier runs keep the filenames they were saved to.
+    Usage:
+        planner = PathPlanner(args, library)
+        renamed = planner.plan(album.songs)
+        filename = planner.acquire(song_info)
+        ...
+        filename = planner.release(song_info, written=True)
+    """
+
+    def __init__(self, args, library=None):
+        """
+        :param args: DownloadArgs of the run, only its destination and naming options are used.
+        :param library: LibraryIndex of the destination, songs moved to another filename are
+            indexed again in it.
+        """
+        self.args = args
+        self.library = library
+        self.folders = {}
+        self.created = set()
+        self.planned = {}
+        # Filename: (key, media, song) of the song it is planned to.
+        self.owners = {}
+        # Filename: song_mid of the song writing it, and the other way round.
+        self.writers = {}
+        self.writing = {}
+        self.written = set()
+        self._cond = threading.Condition(threading.RLock())
+
+    @staticmethod
+    def key(args) -> tuple:
+        """Options of args which the planned filenames depend on."""
+        return os.path.abspath(args.destination), args.classified, args.name_style, args.extension
+
+    def folder(self, song) -> str:
+        """Folder of the song, the destination or the folder of its album."""
+        if not self.args.classified:
+            return self.args.destination
+        key = (song.album_singer_name, song.album_name)
+        folder = self.folders.get(key)
+        if folder is None:
+            folder = self.folders[key] = os.path.join(self.args.destination, *map(convert_to_safe_filename, key))
+        return folder
+
+    def plan(self, songs: list, skipped: set=frozenset(), pinned: dict=None) -> List[Tuple[object, str]]:
+        """
+        Plan the filenames of songs not planned yet and create their folders.
+        :param skipped: song_mids of songs not to download, downloaded already or excluded, whose
+            filenames are planned all the same, so that no other song is given them, but whose
+            folders are not created.
+        :param pinned: song_mid: filename of songs downloaded already, which keep their filenames.
+        :return: (song, filename) of the songs renamed as another recording had their filename.
+        """
+        renamed = []
+        # Folders are created under the lock, so no other thread is given a filename in a
+        # folder that is yet to be created.
+        with self._cond:
+            for song in sorted(songs, key=lambda song: (song.album_mid or '', song.song_mid)):
+                if song.song_mid in self.planned:
+                    continue
+                folder = self.folder(song)
+                filename = (pinned or {}).get(song.song_mid)
+                key = (0,) if filename else (1, song.album_mid or '', song.song_mid)
+                self._claim(filename or os.path.join(folder, self.args.format_name(song)), key, song, renamed)
+                if song.song_mid not in skipped and folder not in self.created:
+                    os.makedirs(folder, exist_ok=True)
+                    self.created.add(folder)
+        return renamed
+
+    def _claim(self, filename: str, key: tuple, song, renamed: list):
+        media = song.str_media_mid or song.song_mid
+        owner = self.owners.get(filename)
+        if owner is not None and owner[1] != media:
+            if owner[0] <= key:
+                filename = self._suffixed(filename, song.song_mid)
+                renamed.append((song, filename))
+            else:
+                renamed.append((owner[2], self._displace(filename)))
+                owner = None
+        if owner is None:
+            self.owners[filename] = (key, media, song)
+        self.planned[song.song_mid] = filename
+
+    @staticmethod
+    def _suffixed(filename: str, song_mid: str) -> str:
+        root, extension = os.path.splitext(filename)
+        return f'{root} [{song_mid}]{extension}'
+
+    def _displace(self, filename: str) -> str:
+        # The owner of filename, and songs of the same recording sharing it, move to the
+        # filename of the owner. Songs being written are moved as they are released.
+        owner = self.owners.pop(filename)
+        new = self._suffixed(filename, owner[2].song_mid)
+        self.owners[new] = owner
+        for song_mid, planned in list(self.planned.items()):
+            if planned == filename:
+                self.planned[song_mid] = new
+                if song_mid in self.written:
+                    self._move(song_mid, filename, new)
+        return new
+
+    def _move(self, song_mid: str, old: str, new: str):
+        try:
+            os.replace(old, new)
+        except OSError:
+            return
+        if self.library is not None:
+            self.library.discard(old)
+            self.library.add(song_mid, self.owners[new][2].str_media_mid, self.args.format, new)
+
+    def filename(self, song) -> str:
+        """Filename of the song, the one it's writing, or the planned one, planned now if it was not."""
+        with self._cond:
+            filename = self.writing.get(song.song_mid) or self.planned.get(song.song_mid)
+            if filename is None:
+                self.plan([song])
+                filename = self.planned[song.song_mid]
+            return filename
+
+    def acquire(self, song) -> str:
+        """Wait until no other song is writing the filename of the song and hold it for the song."""
+        with self._cond:
+            while True:
+                filename = self.filename(song)
+                if self.writers.get(filename, song.song_mid) == song.song_mid:
+                    break
+                self._cond.wait()
+            self.writers[filename] = song.song_mid
+            self.writing[song.song_mid] = filename
+            return filename
+
+    def release(self, song, written: bool) -> str:
+        """
+        Let go of the filename held for the song, moving the song to the filename it was
+        planned to meanwhile, if any.
+        :param written: whether the song was written to the filename.
+        :return: filename of the song.
+        """
+        with self._cond:
+            held = self.writing.pop(song.song_mid, None)
+            self.writers.pop(held, None)
+            filename = self.planned.get(song.song_mid, held)
+            if written:
+                self.written.add(song.song_mid)
+                if held and held != filename:
+                    self._move(song.song_mid, held, filename)
+            elif held and held != filename:
+                # Not to be resumed by the song given the filename.
+                for part in (held + '.part', held + '.part.meta'):
+                    try:
+                        os.remove(part)
+                    except OSError:
+                        pass
+            self._cond.notify_all()
+            return filename
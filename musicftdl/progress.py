@@ -0,0 +1,165 @@
+"""Progress of a run aggregated from all workers, rendered at a fixed rate instead of a print per file."""
+import sys
+import threading
+import time
+
+
+def format_size(size: float) -> str:
+    if size < 1024:
+        return f'{int(size)} B'
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}'
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}'
+
+
+class Progress:
+    """
+    Count files, bytes and albums done by all workers, and render them from one thread:
+    a status line refreshed several times a second on a terminal, a summary line every
+    `interval` seconds otherwise. Errors and completed albums are still printed as lines.
+    Not running, each file is printed as it's done, as it used to be.
+    Usage:
+        with progress:
+            progress.add(files=10, album='album_mid', name='Album')
+            progress.advance(len(chunk))
+            progress.done(filename, 'downloaded')
+            progress.album_song_done('album_mid')
+    """
+
+    def __init__(self, stream=None, interval: float=None):
+        """
+        :param stream: stream to render to, stdout by default.
+        :param interval: seconds between renders, 0.2 on a terminal and 10 otherwise by default.
+        """
+        self._stream = stream
+        self.interval = interval
+        self.running = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.files = {'downloaded': 0, 'skipped': 0, 'failed': 0}
+        self.bytes = 0
+        self.albums = {}
+        self.albums_done = 0
+        self.started_at = time.monotonic()
+        self._line = False
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    @property
+    def tty(self) -> bool:
+        return hasattr(self.stream, 'isatty') and self.stream.isatty()
+
+    def add(self, files: int=1, album: str=None, name: str=None):
+        """Expect files more to be done, of the album if given."""
+        with self._lock:
+            self.total += files
+            if album is not None:
+                done, total, _ = self.albums.get(album, (0, 0, name))
+                self.albums[album] = (done, total + files, name or album)
+
+    def advance(self, size: int):
+        """Count bytes received, cheap enough to be called per chunk."""
+        with self._lock:
+            self.bytes += size
+
+    def done(self, filename: str, status: str):
+        """A file is done, status is one of 'downloaded', 'skipped' or 'failed'."""
+        with self._lock:
+            self.files[status] += 1
+            if self.running:
+                return
+        if status == 'downloaded':
+            self.log(filename)
+        elif status == 'skipped':
+            self.log(f'{filename} [Skipped]')
+
+    def album_song_done(self, album: str):
+        with self._lock:
+            if album not in self.albums:
+                return
+            done, total, name = self.albums[album]
+            self.albums[album] = (done + 1, total, name)
+            if done + 1 < total:
+                return
+            self.albums_done += 1
+        if self.running:
+            self.log(f'{name} [{total}/{total}]')
+
+    def log(self, message):
+        """Print a line, above the status line on a terminal."""
+        with self._lock:
+            self._write(f'{message}\n')
+
+    def _write(self, text: str):
+        if self._line:
+            text = '\r\x1b[K' + text
+            self._line = False
+        self.stream.write(text)
+        self.stream.flush()
+
+    def status(self) -> str:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-6)
+            done = sum(self.files.values())
+            parts = [f'{done}/{self.total} files']
+            if self.files['skipped'] or self.files['failed']:
+                parts.append(f'{self.files["skipped"]} skipped, {self.files["failed"]} failed')
+            parts.append(f'{format_size(self.bytes)} at {format_size(self.bytes / elapsed)}/s')
+            if 0 < done < self.total:
+                parts.append(f'ETA {format_seconds((self.total - done) * elapsed / done)}')
+            if self.albums:
+                parts.append(f'{self.albums_done}/{len(self.albums)} albums')
+            return ', '.join(parts)
+
+    def render(self):
+        status = self.status()
+        with self._lock:
+            if self.tty:
+                self._write(status)
+                self._line = True
+            else:
+                self._write(status + '\n')
+
+    def _run(self, interval: float):
+        while not self._wake.wait(interval):
+            self.render()
+
+    def start(self):
+        self._reset()
+        self.running = True
+        self._wake.clear()
+        interval = self.interval or (0.2 if self.tty else 10)
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop rendering, and print the final status."""
+        if not self.running:
+            return
+        self._wake.set()
+        self._thread.join()
+        self.running = False
+        status = self.status()
+        with self._lock:
+            self._write(status + '\n')
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,145 @@
+"""Retry policy telling transient from permanent errors, with a retry budget and circuit breakers."""
+import random
+import threading
+import time
+from functools import wraps
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a host whose circuit is open."""
+    pass
+
+
+class RetryBudget:
+    """
+    Limit retries to a `ratio` of the requests sent, on top of a reserve of `minimum` retries
+    which refills as requests are sent, so that a run with many failures does not multiply
+    its load with retries.
+    """
+
+    def __init__(self, ratio: float=0.2, minimum: float=20):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.tokens = minimum
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Record a request, which earns `ratio` of a retry, up to the reserve."""
+        with self._lock:
+            self.tokens = min(self.tokens + self.ratio, self.minimum)
+
+    def withdraw(self) -> bool:
+        """Take a retry from the budget, return False if the budget is exhausted."""
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Open the circuit of a host after `threshold` consecutive transient failures: requests
+    to it fail fast for `reset_timeout` seconds, then a single trial request is let through
+    and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, threshold: int=5, reset_timeout: float=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = {}
+        self.opened_at = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        with self._lock:
+            opened_at = self.opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at >= self.reset_timeout:
+                # Half open: let this request through, and hold the others until it's done.
+                self.opened_at[host] = time.monotonic()
+                return True
+            return False
+
+    def record(self, host: str, failed: bool):
+        with self._lock:
+            if not failed:
+                self.failures.pop(host, None)
+                self.opened_at.pop(host, None)
+                return
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= self.threshold:
+                self.opened_at[host] = time.monotonic()
+
+
+class RetryPolicy:
+    """
+    Retry the decorated function on transient errors only, sleeping with jittered exponential
+    backoff or as long as the error's Retry-After asks, within a global retry budget. Each
+    host has a circuit breaker, so requests to a host that is down fail fast.
+    Usage:
+        policy = RetryPolicy(host=lambda url, **kwargs: urlsplit(url).hostname,
+                             is_transient=lambda e: isinstance(e, ConnectionError))
+
+        @policy
+        def request(url, **kwargs):
+            ...
+    """
+
+    def __init__(self, host, is_transient, retry_after=None, tries: int=3, delay: float=1,
+                 backoff: float=2, max_delay: float=30, budget: RetryBudget=None,
+                 breaker: CircuitBreaker=None, on_retry=None):
+        """
+        :param host: function taking the arguments of the decorated function and returning its host.
+        :param is_transient: function telling if an exception is worth retrying.
+        :param retry_after: function returning the seconds an exception asks to wait, or None.
+        :param tries: number of times to try (not retry) before giving up.
+        :param delay: initial delay between retries in seconds.
+        :param backoff: backoff multiplier (e.g. value of 2 will double the delay each retry).
+        :param max_delay: maximum delay between retries in seconds.
+        :param on_retry: function called with the host and the exception before each retry.
+        """
+        self.host = host
+        self.is_transient = is_transient
+        self.retry_after = retry_after or (lambda e: None)
+        self.tries = tries
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.on_retry = on_retry
+
+    def sleep_time(self, attempt: int, e: Exception) -> float:
+        retry_after = self.retry_after(e)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return min(self.delay * self.backoff ** attempt * random.uniform(0.5, 1.5), self.max_delay)
+
+    def __call__(self, f):
+
+        @wraps(f)
+        def f_retry(*args, **kwargs):
+            host = self.host(*args, **kwargs)
+            attempt = 0
+            while True:
+                if not self.breaker.allow(host):
+                    raise CircuitOpenError(f'Too many failures from {host}, not trying for a while')
+                self.budget.deposit()
+                try:
+                    result = f(*args, **kwargs)
+                except Exception as e:
+                    transient = self.is_transient(e)
+                    self.breaker.record(host, failed=transient)
+                    attempt += 1
+                    if not transient or attempt >= self.tries or not self.budget.withdraw():
+                        raise
+                    if self.on_retry is not None:
+                        self.on_retry(host, e)
+                    time.sleep(self.sleep_time(attempt - 1, e))
+                else:
+                    self.breaker.record(host, failed=False)
+                    return result
+
+        return f_retry
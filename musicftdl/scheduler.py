@@ -0,0 +1,101 @@
+"""Pools shared by all albums and songs of a download run."""
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import (Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+
+class Scheduler:
+    """
+    Run the chores of a whole download run on shared pools: a small one for per-album
+    metadata, one for keyword searches, a large one for per-song work, and a process pool
+    for CPU bound tagging so it does not hold the GIL against network I/O. Albums are
+    resolved while songs of earlier albums are still downloading, and no worker sits idle
+    waiting for an album to finish.
+    Usage:
+        with Scheduler(max_workers=20) as scheduler:
+            scheduler.submit_album(fetch_album_chore, album, args, scheduler)
+    """
+
+    def __init__(self, max_workers: int=20, max_album_workers: int=4, max_tag_workers: int=None,
+                 max_search_workers: int=8):
+        """
+        :param max_tag_workers: processes of the tag pool, defaults to the number of CPUs.
+        :param max_search_workers: threads searching keywords, so that thousands of searches
+            do not hold up albums.
+        """
+        self.album_pool = ThreadPoolExecutor(max_workers=max_album_workers)
+        self.search_pool = ThreadPoolExecutor(max_workers=max_search_workers)
+        self.song_pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_tag_workers = max_tag_workers
+        self._tag_pool = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._errors = []
+
+    def _track(self, future: Future) -> Future:
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())
+
+    def submit_album(self, fn, *args, **kwargs) -> Future:
+        return self._track(self.album_pool.submit(fn, *args, **kwargs))
+
+    def submit_search(self, fn, *args, **kwargs) -> Future:
+        return self._track(self.search_pool.submit(fn, *args, **kwargs))
+
+    def submit_song(self, fn, *args, **kwargs) -> Future:
+        return self._track(self.song_pool.submit(fn, *args, **kwargs))
+
+    def submit_tag(self, fn, *args, **kwargs) -> Future:
+        """
+        Submit CPU bound work to the tag pool, started on first use. Its futures are not
+        waited for by `join`: the song chores using them do.
+        """
+        with self._lock:
+            if self._tag_pool is None:
+                # Forking a process running threads may copy locks held by other threads,
+                # leaving the child deadlocked, so workers are spawned where they can be.
+                options = {'mp_context': multiprocessing.get_context('spawn')} if sys.version_info >= (3, 7) else {}
+                self._tag_pool = ProcessPoolExecutor(max_workers=self.max_tag_workers, **options)
+        return self._tag_pool.submit(fn, *args, **kwargs)
+
+    def join(self):
+        """
+        Wait until every submitted chore, including those submitted meanwhile by other
+        chores, is done. Raise the first exception raised by any of them.
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            wait(pending)
+
+        if self._errors:
+            raise self._errors[0]
+
+    def shutdown(self):
+        self.album_pool.shutdown()
+        self.search_pool.shutdown()
+        self.song_pool.shutdown()
+        if self._tag_pool is not None:
+            self._tag_pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.join()
+        finally:
+            self.shutdown()
@@ -0,0 +1,97 @@
+"""A requests session shared by all threads, with a sized connection pool per host."""
+import threading
+from urllib.parse import urlsplit
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PoolStats:
+    """
+    Counters of requests sent and connections opened, to tell how often connections are reused.
+    They are also counted by `metrics`, if given, as `http_connections_opened` and
+    `http_connections_reused` of each host.
+    """
+
+    def __init__(self, metrics=None):
+        """
+        :param metrics: `musicftdl.metrics.Metrics` to count connections of each request in.
+        """
+        self.requests = 0
+        self.new_connections = 0
+        self.metrics = metrics
+        self._lock = threading.Lock()
+
+    def add(self, requests: int=0, new_connections: int=0):
+        with self._lock:
+            self.requests += requests
+            self.new_connections += new_connections
+
+    def add_request(self, host: str, new_connections: int):
+        """Count a request sent to host, over new_connections new connections, or a reused one."""
+        self.add(1, new_connections)
+        if self.metrics is not None:
+            if new_connections:
+                self.metrics.count('http_connections_opened', new_connections, host=host)
+            else:
+                self.metrics.count('http_connections_reused', host=host)
+
+    @property
+    def reused_connections(self) -> int:
+        """Requests sent over a connection kept alive from a previous request."""
+        return max(0, self.requests - self.new_connections)
+
+    def dict(self) -> dict:
+        return {'requests': self.requests, 'new_connections': self.new_connections,
+                'reused_connections': self.reused_connections}
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """An HTTPAdapter counting requests and new connections of its pools in `stats`."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self.stats = stats
+        # Connections opened by the request each thread is sending, as it sends it.
+        self._local = threading.local()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        local = self._local
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                local.new_connections = getattr(local, 'new_connections', 0) + 1
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                local.new_connections = getattr(local, 'new_connections', 0) + 1
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {'http': CountingHTTPConnectionPool,
+                                                   'https': CountingHTTPSConnectionPool}
+
+    def send(self, request, **kwargs):
+        self._local.new_connections = 0
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            self.stats.add_request(urlsplit(request.url).hostname, self._local.new_connections)
+
+
+def new_session(pool_connections: int=10, pool_maxsize: int=64, stats: PoolStats=None) -> Session:
+    """
+    Create a session to be shared by all threads.
+    :param pool_connections: number of hosts to keep a connection pool for.
+    :param pool_maxsize: number of connections kept alive per host, at least the number of
+        concurrent requests to one host, or extra connections are closed after each use.
+    :param stats: counters to update, see `PoolStats`.
+    """
+    session = Session()
+    adapter = CountingHTTPAdapter(stats or PoolStats(), pool_connections=pool_connections,
+                                  pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -0,0 +1,63 @@
+"""State of a destination folder kept across runs."""
+import os
+import sqlite3
+import threading
+import time
+
+
+class SyncState:
+    """
+    Remember, in a SQLite database in the destination folder, which albums of each singer
+    were seen and which songs were downloaded in which format, so that `sync` only fetches
+    what is new since the last run.
+    """
+
+    def __init__(self, destination: str, filename: str='.musicftdl.db'):
+        self.path = os.path.join(destination, filename)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS albums ('
+                               'singer_mid TEXT NOT NULL, album_mid TEXT NOT NULL, format TEXT NOT NULL, '
+                               'complete INTEGER NOT NULL DEFAULT 0, synced_at REAL NOT NULL, '
+                               'PRIMARY KEY (singer_mid, album_mid, format))')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS songs ('
+                               'song_mid TEXT NOT NULL, format TEXT NOT NULL, album_mid TEXT, '
+                               'synced_at REAL NOT NULL, PRIMARY KEY (song_mid, format))')
+        return self._conn
+
+    def albums(self, singer_mid: str, format: str) -> dict:
+        """Return album_mid to whether all its songs were downloaded, of albums seen before."""
+        with self._lock:
+            rows = self._connect().execute('SELECT album_mid, complete FROM albums WHERE singer_mid = ? AND format = ?',
+                                           (singer_mid, format)).fetchall()
+        return {album_mid: bool(complete) for album_mid, complete in rows}
+
+    def add_album(self, singer_mid: str, album_mid: str, format: str, complete: bool):
+        with self._lock:
+            self._connect().execute('INSERT OR REPLACE INTO albums VALUES (?, ?, ?, ?, ?)',
+                                    (singer_mid, album_mid, format, int(complete), time.time()))
+
+    def songs(self, format: str, album_mid: str=None) -> set:
+        """Return song_mids downloaded in the format, of the album if given."""
+        sql, params = 'SELECT song_mid FROM songs WHERE format = ?', (format,)
+        if album_mid is not None:
+            sql, params = sql + ' AND album_mid = ?', params + (album_mid,)
+        with self._lock:
+            return {row[0] for row in self._connect().execute(sql, params)}
+
+    def add_song(self, song_mid: str, format: str, album_mid: str=None):
+        with self._lock:
+            self._connect().execute('INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?)',
+                                    (song_mid, format, album_mid, time.time()))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
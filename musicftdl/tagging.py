@@ -0,0 +1,107 @@
+"""ID3 tags of songs, written ahead of the audio while it's downloaded or into finished files."""
+import os
+import tempfile
+
+import eyed3
+from eyed3.core import Date
+from eyed3.id3 import Tag
+
+from musicftdl.models import SongInfo
+
+eyed3.log.setLevel("ERROR")
+
+
+def set_tag_fields(tag: Tag, song_info: SongInfo):
+    tag.title = song_info.song_name
+    tag.artist = song_info.singer_name
+    # tag.genre = song_info.genre
+    tag.album = song_info.album_name
+    tag.album_artist = song_info.album_singer_name
+    # tag.album_type = song.genre
+    tag.track_num = (song_info.song_index, 0)
+    # tag.disc_num = (None, None)
+    tag.publisher = song_info.company
+    tag.copyright = song_info.company
+    date = song_info.publish_date
+    tag.recording_date = Date(date.year, date.month, date.day)
+    tag.release_date = song_info.publish_time
+    # tag.best_release_date = song.publish_date
+    tag.images.set(3, song_info.album_cover_content, 'image/jpeg', song_info.album_name + '.JPG')
+
+
+def build_tag(song_info: SongInfo) -> Tag:
+    """Build the ID3 tag of a song before it's downloaded, return None if it can't be built."""
+    try:
+        tag = Tag()
+        set_tag_fields(tag, song_info)
+        return tag
+    except Exception:
+        return None
+
+
+def render_tag(song_info: SongInfo) -> bytes:
+    """
+    Render the ID3 tag of a song to bytes, to be written ahead of its audio. This is the CPU
+    bound part of tagging, picklable to run in a process pool. Return None if it fails.
+    """
+    tag = build_tag(song_info)
+    if tag is None:
+        return None
+
+    fd, filename = tempfile.mkstemp(suffix='.id3')
+    try:
+        os.close(fd)
+        tag.save(filename, encoding='utf-8')
+        with open(filename, 'rb') as f:
+            return f.read()
+    except Exception:
+        return None
+    finally:
+        os.remove(filename)
+
+
+def add_tags(filename: str, song_info: SongInfo):
+    """Tag a finished file, which is read and written again."""
+    try:
+        audiofile = eyed3.load(filename)
+        set_tag_fields(audiofile.tag, song_info)
+        audiofile.tag.save(encoding='utf-8')
+    except Exception:
+        pass
+
+
+def parse_id3v2_size(header: bytes) -> int:
+    """Size of the ID3v2 tag starting with the 10 bytes header, 0 if header is not an ID3v2 header."""
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = 0
+    for b in header[6:10]:
+        size = (size << 7) | (b & 0x7f)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def id3v2_size(filename: str) -> int:
+    """Size of the ID3v2 tag at the start of the file, 0 if there is none."""
+    with open(filename, 'rb') as f:
+        return parse_id3v2_size(f.read(10))
+
+
+def strip_id3v2(chunks):
+    """Yield the chunks of a stream, less the ID3v2 tag it may start with."""
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= 10:
+            break
+    skip = parse_id3v2_size(head)
+    while len(head) < skip:
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        skip -= len(head)
+        head = chunk
+    if head[skip:]:
+        yield head[skip:]
+    yield from chunks
@@ -0,0 +1,213 @@
+"""Rate limits and adaptive concurrency limits shared by worker threads."""
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at `rate` tokens per second, holding up to `capacity` tokens.
+    Callers reserve tokens in arrival order and sleep until their reservation is covered,
+    so concurrent callers share the rate fairly.
+    """
+
+    def __init__(self, rate: float, capacity: float=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float=1) -> float:
+        """Take tokens, possibly going into debt, and return the seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            self.tokens -= tokens
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self, tokens: float=1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AdaptiveLimit:
+    """
+    A concurrency limit adjusted by AIMD: each success raises the limit by 1/limit (about
+    one per round trip of the whole window), and being throttled multiplies it by `backoff`,
+    at most once per `cooldown` seconds so a burst of failures counts once.
+    """
+
+    def __init__(self, limit: float=20, minimum: float=1, maximum: float=64, backoff: float=0.5,
+                 cooldown: float=1):
+        self.limit = float(limit)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_backoff = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                now = time.monotonic()
+                if now - self._last_backoff >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_backoff = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class HostThrottle:
+    """
+    Give every host its own token bucket and adaptive concurrency limit.
+    Usage:
+        throttle = HostThrottle({'mapi.lonsty.me': 20}, default_rate=50,
+                                is_throttled=lambda e: isinstance(e, ConnectionError))
+        with throttle.slot(url):
+            session.get(url)
+    """
+
+    def __init__(self, rates: dict=None, default_rate: float=50, limit: float=20, maximum: float=64,
+                 is_throttled=None, enabled: bool=True):
+        """
+        :param rates: requests per second allowed to each host, None for no limit.
+        :param default_rate: requests per second allowed to hosts not in rates.
+        :param limit: initial number of concurrent requests allowed to each host.
+        :param maximum: maximum number of concurrent requests allowed to each host.
+        :param is_throttled: function telling if an exception means the host is overloaded.
+        """
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self.limit = limit
+        self.maximum = maximum
+        self.is_throttled = is_throttled or (lambda e: False)
+        self.enabled = enabled
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    def configure(self, rates: dict=None, limit: float=None, maximum: float=None):
+        """
+        Change the request rates of hosts, or the number of concurrent requests each host
+        starts at and may be raised to. Hosts start over.
+        """
+        with self._lock:
+            if rates is not None:
+                self.rates = rates
+            if limit:
+                self.limit = limit
+            if maximum:
+                self.maximum = maximum
+            self.hosts = {}
+
+    def get(self, host: str) -> tuple:
+        """Return the (TokenBucket, AdaptiveLimit) of the host, its bucket is None if its rate is unlimited."""
+        with self._lock:
+            if host not in self.hosts:
+                rate = self.rates.get(host, self.default_rate)
+                self.hosts[host] = (TokenBucket(rate) if rate else None,
+                                    AdaptiveLimit(self.limit, maximum=self.maximum))
+            return self.hosts[host]
+
+    def acquire(self, url: str):
+        """
+        Wait for the host of url to accept one more request, and take a slot of it.
+        :return: function releasing the slot, called with whether the request was throttled.
+        """
+        if not self.enabled:
+            return lambda throttled=False: None
+
+        bucket, limit = self.get(urlsplit(url).hostname)
+        limit.acquire()
+        try:
+            if bucket is not None:
+                bucket.acquire()
+        except BaseException:
+            limit.release()
+            raise
+        return limit.release
+
+    @contextmanager
+    def slot(self, url: str):
+        """Wait for the host of url to accept one more request, and hold a slot while in the block."""
+        release = self.acquire(url)
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = self.is_throttled(e)
+            raise
+        finally:
+            release(throttled)
+
+
+class BandwidthLimit:
+    """
+    Cap the bytes per second received by all downloads together, and optionally by each host.
+    Every chunk reserves its size from the shared bucket, in arrival order, so concurrent
+    downloads share the rate fairly chunk by chunk.
+    Usage:
+        bandwidth = BandwidthLimit(rate=2 * 1024 * 1024, host_rates={'dl.stream.qqmusic.qq.com': 1024 * 1024})
+        for chunk in bandwidth.limit(resp.iter_content(8192), url):
+            f.write(chunk)
+    """
+
+    def __init__(self, rate: float=None, host_rates: dict=None):
+        """
+        :param rate: bytes per second of all downloads, unlimited if None.
+        :param host_rates: bytes per second of the downloads from each host.
+        """
+        self.configure(rate, host_rates)
+
+    def configure(self, rate: float=None, host_rates: dict=None):
+        # Buckets hold a second of bytes, the burst allowed after an idle while.
+        self.bucket = TokenBucket(rate) if rate else None
+        self.host_rates = host_rates or {}
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.bucket is not None or bool(self.host_rates)
+
+    def _host_bucket(self, host: str) -> TokenBucket:
+        rate = self.host_rates.get(host)
+        if not rate:
+            return None
+        with self._lock:
+            if host not in self.hosts:
+                self.hosts[host] = TokenBucket(rate)
+            return self.hosts[host]
+
+    def consume(self, size: int, host: str=None):
+        """Wait until size bytes more may be received, from host if given."""
+        delay = self.bucket.reserve(size) if self.bucket is not None else 0
+        bucket = self._host_bucket(host) if host else None
+        if bucket is not None:
+            delay = max(delay, bucket.reserve(size))
+        if delay > 0:
+            time.sleep(delay)
+
+    def limit(self, chunks, url: str=None):
+        """Yield the chunks of a download no faster than the caps allow."""
+        if not self.enabled:
+            return chunks
+        return self._limit(chunks, urlsplit(url).hostname if url else None)
+
+    def _limit(self, chunks, host: str):
+        for chunk in chunks:
+            self.consume(len(chunk), host)
+            yield chunk
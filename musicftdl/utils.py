@@ -2,54 +2,19 @@
 # @Date: May 06 14:36 2020
 import math
 import os
-import random
-import time
-from datetime import timedelta
-from functools import wraps
-
-from prettytable import PrettyTable
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
 
 
 def print_table(title, items):
-    table = PrettyTable(title, border=True, hrules=1, header_style='upper', align='m')
+    from prettytable import PrettyTable
+
+    table = PrettyTable(title, border=True, hrules=1, header_style='upper', align='c', valign='m')
     for item in items: table.add_row(item)
     print(table)
 
 
-def retry(exceptions, tries=3, delay=1, backoff=2, logger=None):
-    """
-    Retry calling the decorated function using an exponential backoff.
-    Args:
-        exceptions: The exception to check. may be a tuple of
-            exceptions to check.
-        tries: Number of times to try (not retry) before giving up.
-        delay: Initial delay between retries in seconds.
-        backoff: Backoff multiplier (e.g. value of 2 will double the delay
-            each retry).
-        logger: Logger to use. If None, print.
-    """
-
-    def deco_retry(f):
-
-        @wraps(f)
-        def f_retry(*args, **kwargs):
-            mtries, mdelay = tries, delay or random.uniform(0.5, 1.5)
-            while mtries > 1:
-                try:
-                    return f(*args, **kwargs)
-                except exceptions as e:
-                    if logger:
-                        logger.warning('{}, Retrying in {} seconds...'.format(e, mdelay))
-                    time.sleep(mdelay)
-                    mtries -= 1
-                    mdelay *= backoff
-            return f(*args, **kwargs)
-
-        return f_retry
-
-    return deco_retry
-
-
 def mkdirs_if_not_exist(dir):
     if not os.path.isdir(dir):
         try:
@@ -58,8 +23,11 @@ def mkdirs_if_not_exist(dir):
             pass
 
 
+_UNSAFE_CHARS = str.maketrans('', '', r'\/:*?"<>|')
+
+
 def convert_to_safe_filename(filename):
-    return "".join([c for c in filename if c not in r'\/:*?"<>|']).strip()
+    return filename.translate(_UNSAFE_CHARS).strip()
 
 
 # def convert_seconds_to_dtstr(sec: int) -> str:
@@ -72,6 +40,13 @@ def convert_seconds_to_dtstr(sec: int) -> str:
     return dt_str[-5:] if sec < 3600 else dt_str
 
 
+@lru_cache(maxsize=4096)
+def parse_date(s: str) -> datetime:
+    """Parse a date with dateutil, memoized as all songs of an album share its publish time."""
+    from dateutil import parser
+    return parser.parse(s)
+
+
 def cut_str_to_multi_line(s, l=50):
     """
 
@@ -80,3 +55,14 @@ def cut_str_to_multi_line(s, l=50):
     :return:
     """
     return '\n'.join([s[i * l:(i + 1) * l] for i in range(math.ceil(len(s) / l))])
+
+
+def parse_rate(rate: str) -> float:
+    """
+    Parse a rate in bytes per second, with an optional K, M or G suffix (powers of 1024),
+    e.g. '512K', '2M', '1.5MB/s'.
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?\s*', rate, re.IGNORECASE)
+    if not match:
+        raise ValueError(f'Invalid rate <{rate}>, expected e.g. 512K or 2M')
+    return float(match.group(1)) * 1024 ** ' KMG'.index(match.group(2).upper() or ' ')
@@ -13,6 +13,8 @@ with open('HISTORY.rst') as history_file:
 requirements = ['Click>=7.0', 'eyeD3>=0.9.5', 'pydantic>=1.5.1', 'requests>=2.23.0',
                 'prettytable>=0.7.2', 'python-dateutil>=2.8.1']
 
+extras_requirements = {'aio': ['aiohttp>=3.6.2']}
+
 setup_requirements = [ ]
 
 test_requirements = [ ]
@@ -38,6 +40,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
@@ -0,0 +1,324 @@
+"""A local HTTP server standing in for the music API and CDN hosts in tests."""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            failed = self.server.error_rate and self.server.random.random() < self.server.error_rate
+        try:
+            time.sleep(self.server.latency)
+            if failed:
+                self.send_error(503)
+                return
+            self._respond()
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _respond(self):
+        url = urlsplit(self.path)
+        route = self.server.routes.get(url.path)
+        if route is not None:
+            data = route({k: v[0] for k, v in parse_qs(url.query).items()})
+            body = json.dumps({'result': 100, 'data': data} if data else {'result': 301, 'errMsg': 'Not found'})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body.encode())))
+            self.end_headers()
+            self.wfile.write(body.encode())
+            return
+
+        body = self.server.files.get(url.path)
+        if body is None:
+            self.send_error(404)
+            return
+
+        view, start = memoryview(body), 0
+        etag = f'"{zlib.crc32(body):08x}"' if self.server.etags else None
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range') or '')
+        # A Range is ignored if the file changed since the validator of If-Range was sent.
+        if_range = self.headers.get('If-Range')
+        if match and self.server.accept_ranges and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            if start >= len(view):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(view)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(view) - 1}/{len(view)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(view) - start))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+
+        # Drop the connection after `cut_after` bytes to emulate an interrupted transfer.
+        end = min(len(view), self.server.cut_after.pop(self.path, len(view)))
+        bandwidth = self.server.bandwidth
+        for i in range(start, end, 65536):
+            chunk = view[i:min(i + 65536, end)]
+            if bandwidth:
+                time.sleep(len(chunk) / bandwidth)
+            self.wfile.write(chunk)
+        if end < len(view):
+            self.close_connection = True
+
+
+class MockServer:
+    """
+    Serve in-memory files over HTTP on localhost.
+    Usage:
+        with MockServer() as server:
+            server.files['/song.mp3'] = b'...'
+            server.url('/song.mp3')
+    """
+
+    def __init__(self, accept_ranges: bool=True, latency: float=0, bandwidth: float=None,
+                 error_rate: float=0, seed: int=None, etags: bool=True):
+        """
+        :param etags: send an ETag of each file, and honour If-Range with it.
+        :param latency: seconds to wait before answering each request.
+        :param bandwidth: bytes per second each response of a file is sent at, unlimited if None.
+        :param error_rate: fraction of requests answered with 503 Service Unavailable.
+        :param seed: seed of the random errors.
+        """
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.httpd.files = {}
+        self.httpd.routes = {}
+        self.httpd.requests = []
+        self.httpd.lock = threading.Lock()
+        self.httpd.latency = latency
+        self.httpd.bandwidth = bandwidth
+        self.httpd.error_rate = error_rate
+        self.httpd.random = random.Random(seed)
+        self.httpd.in_flight = 0
+        self.httpd.max_in_flight = 0
+        self.httpd.cut_after = {}
+        self.httpd.accept_ranges = accept_ranges
+        self.httpd.etags = etags
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def files(self) -> dict:
+        return self.httpd.files
+
+    @property
+    def routes(self) -> dict:
+        """Path to a function taking the query parameters and returning the JSON `data`."""
+        return self.httpd.routes
+
+    @property
+    def requests(self) -> list:
+        """(path, Range header) of every request received."""
+        return self.httpd.requests
+
+    @property
+    def cut_after(self) -> dict:
+        """Path to the number of bytes after which the next response to it is cut off."""
+        return self.httpd.cut_after
+
+    @property
+    def latency(self) -> float:
+        return self.httpd.latency
+
+    @latency.setter
+    def latency(self, seconds: float):
+        self.httpd.latency = seconds
+
+    @property
+    def max_in_flight(self) -> int:
+        """Maximum number of requests being served at the same time."""
+        return self.httpd.max_in_flight
+
+    def url(self, path: str) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_port}{path}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MockMusicApi(MockServer):
+    """
+    Emulate the music API, the cover host and the audio CDN with generated singers,
+    albums and songs, and point `musicftdl` at it while in use.
+    Usage:
+        with MockMusicApi() as api:
+            api.add_album('singer', 'album', songs=3)
+            musicftdl.download(DownloadArgs(resource='singer', singer=True, ...))
+    """
+
+    def __init__(self, batch: bool=True, cdn_host: str='127.0.0.1', **kwargs):
+        """
+        :param batch: if False, there is no batch endpoint for song URLs.
+        :param cdn_host: host name of covers and audio, e.g. 'localhost' to have them requested
+            from another host than the API, as they are.
+        """
+        super().__init__(**kwargs)
+        self.cdn_host = cdn_host
+        self.albums = {}
+        self.songs = {}
+        self.routes.update({
+            '/singer/album': self._singer_album,
+            '/album': self._album,
+            '/album/songs': self._album_songs,
+            '/song': self._song,
+            '/song/url': self._song_url,
+            '/search': self._search,
+        })
+        if batch:
+            self.routes['/song/urls'] = self._song_urls
+        self._patches = []
+
+    def add_album(self, singer_mid: str, album_mid: str, songs: int=1, size: int=1024,
+                  album_type: str='录音室专辑') -> list:
+        """Add an album with generated songs of `size` bytes, return their song_mids."""
+        song_mids = [f'{album_mid}_{i + 1}' for i in range(songs)]
+        self.albums[album_mid] = {
+            'album_mid': album_mid,
+            'album_name': f'Album {album_mid}',
+            'albumtype': album_type,
+            'lan': '国语',
+            'latest_song': {'song_count': songs},
+            'company': {'company_name': 'Company'},
+            'pub_time': '2020-05-11',
+            'singers': [{'singer_mid': singer_mid, 'singer_name': f'Singer {singer_mid}'}],
+            'song_mids': song_mids,
+        }
+        for i, song_mid in enumerate(song_mids):
+            self.songs[song_mid] = {
+                'mid': song_mid,
+                'name': f'Song {song_mid}',
+                'index_album': i + 1,
+                'singer': [{'mid': singer_mid, 'name': f'Singer {singer_mid}'}],
+                'interval': 200,
+                'genre': 1,
+                'file': {'media_mid': f'media_{song_mid}'},
+                'album_mid': album_mid,
+            }
+            self.files[f'/audio/{song_mid}'] = bytes([i % 256]) * size
+        self.files[f'/cover/{album_mid}.jpg'] = b'\xff\xd8\xff\xe0' + album_mid.encode()
+        return song_mids
+
+    def _singer_album(self, query):
+        # Newest albums first, as the API lists them.
+        albums = [a for a in reversed(list(self.albums.values()))
+                  if a['singers'][0]['singer_mid'] == query['singermid']]
+        page, page_size = int(query.get('pageNo', 1)), int(query.get('pageSize', 50))
+        return {'list': albums[(page - 1) * page_size:page * page_size], 'total': len(albums)}
+
+    def _album(self, query):
+        album = self.albums.get(query['albummid'])
+        if album:
+            return {
+                'mid': album['album_mid'],
+                'name': album['album_name'],
+                'company': album['company']['company_name'],
+                'publishTime': album['pub_time'],
+                'ar': [{'mid': it['singer_mid'], 'name': it['singer_name']} for it in album['singers']],
+                'picUrl': f'//cover/{album["album_mid"]}.jpg',
+            }
+
+    def _album_songs(self, query):
+        album = self.albums.get(query['albummid'])
+        if album:
+            return {'list': [self.songs[mid] for mid in album['song_mids']]}
+
+    def _song(self, query):
+        song = self.songs.get(query['songmid'])
+        if song:
+            album = self.albums[song['album_mid']]
+            return {
+                'track_info': {**song, 'album': {'mid': album['album_mid'], 'name': album['album_name']}},
+                'info': {
+                    'company': {'content': [{'value': album['company']['company_name']}]},
+                    'genre': {'content': [{'value': 'Pop'}]},
+                    'intro': {'content': [{'value': 'Intro'}]},
+                    'lan': {'content': [{'value': album['lan']}]},
+                    'pub_time': {'content': [{'value': album['pub_time']}]},
+                },
+            }
+
+    def cdn_url(self, path: str) -> str:
+        return f'http://{self.cdn_host}:{self.httpd.server_port}{path}'
+
+    def _song_url(self, query):
+        if query['id'] in self.songs:
+            return self.cdn_url(f'/audio/{query["id"]}')
+
+    def _song_urls(self, query):
+        return {mid: self.cdn_url(f'/audio/{mid}') for mid in query['id'].split(',') if mid in self.songs}
+
+    def _search(self, query):
+        songs = [song for song in self.songs.values() if query['key'].lower() in song['name'].lower()]
+        page, page_size = int(query.get('pageNo', 1)), int(query.get('pageSize', 20))
+        return {
+            'list': [{
+                'singer': song['singer'],
+                'albumname': self.albums[song['album_mid']]['album_name'],
+                'albummid': song['album_mid'],
+                'songname': song['name'],
+                'songmid': song['mid'],
+                'interval': song['interval'],
+                'strMediaMid': song['file']['media_mid'],
+            } for song in songs[(page - 1) * page_size:page * page_size]],
+            'total': len(songs),
+        }
+
+    def __enter__(self):
+        from unittest import mock
+
+        from musicftdl import models, musicftdl
+
+        base = self.url('')
+        api = models.API(**{k: v.replace('http://mapi.lonsty.me', base)
+                            for k, v in models.API().dict().items()})
+        cover = property(lambda obj: obj.album_mid and self.cdn_url(f'/cover/{obj.album_mid}.jpg'))
+        self._patches = [
+            mock.patch.object(musicftdl.consts, 'api', api),
+            mock.patch.object(models.Album, 'album_cover_bg_url', cover),
+            mock.patch.object(models.SongProperties, 'album_cover_bg_url', cover),
+            mock.patch.object(musicftdl.metadata_cache, 'enabled', False),
+            mock.patch.object(musicftdl, 'batch_song_url_supported', True),
+            mock.patch.object(musicftdl.cover_cache, 'enabled', False),
+            mock.patch.object(musicftdl.cover_cache, 'memory', OrderedDict()),
+        ]
+        for patch in self._patches:
+            patch.start()
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        for patch in reversed(self._patches):
+            patch.stop()
+        super().__exit__(*exc)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.aio` module."""
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import eyed3
+
+from musicftdl import musicftdl
+from musicftdl.models import DownloadArgs
+from tests.mock_server import MockMusicApi
+from tests.test_tagging import AUDIO, id3_tag
+
+try:
+    from musicftdl import aio
+except ImportError:
+    aio = None
+
+
+@unittest.skipIf(aio is None, 'aiohttp is not installed')
+class TestAio(unittest.TestCase):
+    """Tests for `musicftdl.aio` against a mock API."""
+
+    def setUp(self):
+        self.api = MockMusicApi().__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.api.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def test_concurrent_metadata_lookups(self):
+        song_mids = self.api.add_album('singer', 'album', songs=50)
+        self.api.latency = 0.1
+
+        async def lookup():
+            async with aio.AsyncClient(limit=25) as client:
+                return await asyncio.gather(*[aio.get_song_info(client, mid) for mid in song_mids])
+
+        song_infos = asyncio.run(lookup())
+
+        self.assertEqual([info.song_mid for info in song_infos], song_mids)
+        self.assertEqual(self.api.max_in_flight, 25)
+
+    def test_download_singer(self):
+        self.api.add_album('singer', 'album1', songs=2)
+        self.api.add_album('singer', 'album2', songs=1)
+        args = DownloadArgs(resource='singer', singer=True, destination=self.tmpdir.name, name_style=1,
+                            format='flac', page=1, page_size=50)
+
+        asyncio.run(aio.download(args))
+
+        files = sorted(name for _, _, names in os.walk(self.tmpdir.name) for name in names)
+        self.assertEqual(files, ['Song album1_1.flac', 'Song album1_2.flac', 'Song album2_1.flac'])
+
+    def test_interrupted_download_is_resumed(self):
+        self.api.files['/song.flac'] = os.urandom(256 * 1024)
+        self.api.cut_after['/song.flac'] = 100 * 1024
+        filename = os.path.join(self.tmpdir.name, 'song.flac')
+
+        async def download():
+            async with aio.AsyncClient() as client:
+                return [await aio.download_music(client, self.api.url('/song.flac'), filename) for _ in range(2)]
+
+        self.assertEqual(asyncio.run(download()), [None, True])
+        self.assertEqual(self.api.requests[-1][1], f'bytes={100 * 1024}-')
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), self.api.files['/song.flac'])
+
+    def test_caches_and_files_are_used_off_the_event_loop(self):
+        self.api.add_album('singer', 'album', songs=2)
+        args = DownloadArgs(resource='album', album=True, destination=self.tmpdir.name, name_style=1,
+                            format='flac')
+        threads = []
+
+        def record(f):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return f(*args, **kwargs)
+            return wrapper
+
+        cache = musicftdl.metadata_cache
+        with mock.patch.object(cache, 'get', record(cache.get)), mock.patch.object(cache, 'set', record(cache.set)), \
+                mock.patch.object(aio, 'open', record(open), create=True):
+            asyncio.run(aio.download(args))
+
+        self.assertEqual(len([name for _, _, names in os.walk(self.tmpdir.name) for name in names]), 2)
+        self.assertGreater(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_songs_are_tagged_as_they_are_downloaded(self):
+        self.api.add_album('singer', 'album', songs=2)
+        for i in (1, 2):
+            self.api.files[f'/audio/album_{i}'] = id3_tag('source') + AUDIO
+        args = DownloadArgs(resource='album', album=True, destination=self.tmpdir.name, name_style=1,
+                            classified=False, format='128')
+
+        # The first song is cut short, and resumed by the second run.
+        self.api.cut_after['/audio/album_1'] = len(AUDIO) // 2
+        with mock.patch('eyed3.load', wraps=eyed3.load) as load:
+            asyncio.run(aio.download(args))
+            asyncio.run(aio.download(args))
+
+        # Files are not loaded to be tagged once downloaded.
+        load.assert_not_called()
+        self.assertTrue(self.api.requests[-1][1].startswith('bytes='))
+        for i in (1, 2):
+            filename = os.path.join(self.tmpdir.name, f'Song album_{i}.mp3')
+            self.assertEqual(eyed3.load(filename).tag.title, f'Song album_{i}')
+            with open(filename, 'rb') as f:
+                self.assertTrue(f.read().endswith(AUDIO))
+
+    def test_failing_album_does_not_stop_others(self):
+        self.api.add_album('singer', 'album1', songs=1)
+        self.api.add_album('singer', 'album2', songs=1)
+        self.api.files.pop('/cover/album1.jpg')
+        args = DownloadArgs(resource='singer', singer=True, destination=self.tmpdir.name, name_style=1,
+                            classified=False, format='flac', page=1, page_size=50)
+
+        with mock.patch.object(aio, 'get_song_urls', side_effect=RuntimeError('Batch failed')):
+            asyncio.run(aio.download(args))
+
+        # The cover of album1 is missing, songs of album2 are resolved one by one.
+        self.assertEqual(os.listdir(self.tmpdir.name), ['Song album2_1.flac'])
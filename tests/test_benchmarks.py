@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""Tests for the `benchmarks` of `musicftdl` package."""
+
+import time
+import unittest
+
+import requests
+
+from benchmarks.bench_download import percentile, run_scenario
+from tests.mock_server import MockServer
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Smoke tests for the download benchmark and its mock server."""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 99), 0)
+
+    def test_run_scenario(self):
+        for scenario in ('album', 'singer'):
+            result = run_scenario(scenario, albums=2, songs=2, size=1024)
+            self.assertEqual(result['songs'], 4)
+            self.assertGreater(result['mb_per_second'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertEqual(result['connections_opened'] + result['connections_reused'], result['requests'])
+
+    def test_mock_server_bandwidth_and_errors(self):
+        with MockServer(bandwidth=64 * 1024, error_rate=0.5, seed=1) as server:
+            server.files['/song.flac'] = b'0' * 64 * 1024
+            statuses = [requests.get(server.url('/song.flac')).status_code for _ in range(20)]
+            start = time.perf_counter()
+            while requests.get(server.url('/song.flac')).status_code != 200:
+                start = time.perf_counter()
+            elapsed = time.perf_counter() - start
+
+        self.assertTrue(0 < statuses.count(503) < 20)
+        self.assertGreaterEqual(elapsed, 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.cache` module."""
+
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from musicftdl import musicftdl
+from musicftdl.cache import CoverCache, MetadataCache
+from musicftdl.models import DownloadArgs
+from tests.mock_server import MockMusicApi
+
+
+class TestMetadataCache(unittest.TestCase):
+    """Tests for `MetadataCache`."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'metadata.sqlite3')
+        self.cache = MetadataCache(self.path, ttls={'album': 60, 'song_url': 0.1})
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_set_and_get(self):
+        self.cache.set('album', ('001',), {'mid': '001'})
+
+        self.assertEqual(self.cache.get('album', ('001',)), {'mid': '001'})
+        self.assertIsNone(self.cache.get('album', ('002',)))
+        self.assertEqual(MetadataCache(self.path, ttls={'album': 60}).get('album', ('001',)), {'mid': '001'})
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.set('song_url', ('001', '128'), 'http://example.com/001.mp3')
+        self.assertIsNotNone(self.cache.get('song_url', ('001', '128')))
+
+        time.sleep(0.2)
+        self.assertIsNone(self.cache.get('song_url', ('001', '128')))
+
+    def test_endpoints_without_ttl_are_not_cached(self):
+        self.cache.set('search', ('jay', 1, 20), {'list': []})
+
+        self.assertIsNone(self.cache.get('search', ('jay', 1, 20)))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.max_size = 1000
+        for i in range(10):
+            self.cache.set('album', (i,), 'x' * 100)
+            self.cache.get('album', (0,))
+
+        self.assertIsNotNone(self.cache.get('album', (0,)))
+        self.assertIsNone(self.cache.get('album', (1,)))
+        self.assertIsNotNone(self.cache.get('album', (9,)))
+
+    def test_disabled_and_refresh(self):
+        self.cache.set('album', ('001',), {'mid': '001'})
+
+        self.cache.refresh = True
+        self.assertIsNone(self.cache.get('album', ('001',)))
+        self.cache.set('album', ('001',), {'mid': '002'})
+        self.cache.refresh = False
+        self.assertEqual(self.cache.get('album', ('001',)), {'mid': '002'})
+
+        self.cache.enabled = False
+        self.assertIsNone(self.cache.get('album', ('001',)))
+
+    def test_repeated_calls_hit_the_cache(self):
+        with MockMusicApi() as api, mock.patch.object(musicftdl, 'metadata_cache', self.cache):
+            self.cache.ttls = musicftdl.consts.cache_ttls
+            api.add_album('singer', 'album', songs=2)
+
+            first = musicftdl.get_album_songs('album')
+            second = musicftdl.get_album_songs('album')
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(api.requests), 1)
+
+
+class TestCoverCache(unittest.TestCase):
+    """Tests for `CoverCache`."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = CoverCache(self.tmpdir.name, capacity=2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cover_is_fetched_once(self):
+        fetch = mock.Mock(return_value=b'cover')
+
+        self.assertEqual(self.cache.get('album', fetch), b'cover')
+        self.assertEqual(self.cache.get('album', fetch), b'cover')
+        self.assertEqual(CoverCache(self.tmpdir.name).get('album', fetch), b'cover')
+        fetch.assert_called_once_with()
+
+    def test_memory_keeps_most_recently_used_covers(self):
+        for album_mid in ('a', 'b', 'a', 'c'):
+            self.cache.get(album_mid, lambda: album_mid.encode())
+
+        self.assertEqual(list(self.cache.memory), ['a', 'c'])
+
+    def test_concurrent_requests_share_one_fetch(self):
+        def fetch():
+            time.sleep(0.1)
+            return b'cover'
+        fetch = mock.Mock(side_effect=fetch)
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda _: self.cache.get('album', fetch), range(10)))
+
+        self.assertEqual(results, [b'cover'] * 10)
+        fetch.assert_called_once_with()
+
+    def test_songs_of_one_album_fetch_its_cover_once(self):
+        with MockMusicApi() as api, mock.patch.object(musicftdl, 'cover_cache', self.cache):
+            song_mids = api.add_album('singer', 'album', songs=5)
+            args = DownloadArgs(destination=self.tmpdir.name, name_style=1, format='flac')
+
+            for song_mid in song_mids:
+                musicftdl._download_by_song_mid(song_mid, args)
+
+        self.assertEqual([path for path, _ in api.requests if path.startswith('/cover/')], ['/cover/album.jpg'])
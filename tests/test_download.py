@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+"""Tests for downloading songs in `musicftdl` package."""
+
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+import eyed3
+
+from musicftdl import musicftdl
+from musicftdl.models import DownloadArgs
+from tests.mock_server import MockMusicApi, MockServer
+
+
+class TestDownloadMusic(unittest.TestCase):
+    """Tests for `musicftdl.download_music`."""
+
+    def setUp(self):
+        self.server = MockServer().__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def test_download_is_streamed_with_bounded_memory(self):
+        payload = os.urandom(1024) * 32 * 1024  # 32 MiB
+        self.server.files['/large.flac'] = payload
+        filename = os.path.join(self.tmpdir.name, 'large.flac')
+
+        tracemalloc.start()
+        try:
+            downloaded = musicftdl.download_music(self.server.url('/large.flac'), filename, chunk_size=8192)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertTrue(downloaded)
+        self.assertEqual(os.path.getsize(filename), len(payload))
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+    def test_existing_file_is_skipped(self):
+        self.server.files['/song.mp3'] = b'new'
+        filename = os.path.join(self.tmpdir.name, 'song.mp3')
+        with open(filename, 'wb') as f:
+            f.write(b'old')
+
+        self.assertFalse(musicftdl.download_music(self.server.url('/song.mp3'), filename))
+        self.assertEqual(self.server.requests, [])
+
+    def test_interrupted_download_is_resumed(self):
+        payload = os.urandom(256 * 1024)
+        self.server.files['/song.flac'] = payload
+        self.server.cut_after['/song.flac'] = 100 * 1024
+        filename = os.path.join(self.tmpdir.name, 'song.flac')
+
+        self.assertIsNone(musicftdl.download_music(self.server.url('/song.flac'), filename))
+        self.assertFalse(os.path.exists(filename))
+        offset = os.path.getsize(filename + '.part')
+        self.assertTrue(0 < offset <= 100 * 1024)
+
+        self.assertTrue(musicftdl.download_music(self.server.url('/song.flac'), filename))
+        self.assertEqual(self.server.requests[-1], ('/song.flac', f'bytes={offset}-'))
+        self.assertFalse(os.path.exists(filename + '.part'))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), payload)
+
+    def test_resume_restarts_when_range_is_not_supported(self):
+        self.server.httpd.accept_ranges = False
+        self.server.files['/song.flac'] = b'0123456789'
+        filename = os.path.join(self.tmpdir.name, 'song.flac')
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'01234')
+
+        self.assertTrue(musicftdl.download_music(self.server.url('/song.flac'), filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+
+    def test_complete_part_file_is_renamed(self):
+        self.server.files['/song.flac'] = b'0123456789'
+        filename = os.path.join(self.tmpdir.name, 'song.flac')
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'0123456789')
+
+        self.assertTrue(musicftdl.download_music(self.server.url('/song.flac'), filename))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+
+    def test_oversized_part_file_is_restarted(self):
+        self.server.files['/song.flac'] = b'0123456789'
+        filename = os.path.join(self.tmpdir.name, 'song.flac')
+        with open(filename + '.part', 'wb') as f:
+            f.write(b'0123456789abc')
+
+        self.assertTrue(musicftdl.download_music(self.server.url('/song.flac'), filename))
+        self.assertEqual([range_ for _, range_ in self.server.requests], ['bytes=13-', None])
+        self.assertEqual(os.listdir(self.tmpdir.name), ['song.flac'])
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+
+    def test_part_file_of_a_changed_song_is_restarted(self):
+        for etags in (True, False):
+            with self.subTest(etags=etags):
+                self.server.httpd.etags = etags
+                self.server.files['/song.flac'] = os.urandom(64 * 1024)
+                self.server.cut_after['/song.flac'] = 32 * 1024
+                filename = os.path.join(self.tmpdir.name, f'song{etags}.flac')
+                self.assertIsNone(musicftdl.download_music(self.server.url('/song.flac'), filename))
+
+                # With an ETag, the server tells it changed. Without, its size does.
+                self.server.files['/song.flac'] = payload = os.urandom(64 * 1024 + (0 if etags else 1))
+                self.assertTrue(musicftdl.download_music(self.server.url('/song.flac'), filename))
+                self.assertFalse(os.path.exists(filename + '.part.meta'))
+                with open(filename, 'rb') as f:
+                    self.assertEqual(f.read(), payload)
+
+
+class TestDownload(unittest.TestCase):
+    """Tests for `musicftdl.download` against a mock API."""
+
+    def setUp(self):
+        self.api = MockMusicApi().__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.api.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def args(self, resource, **kwargs):
+        options = dict(resource=resource, destination=self.tmpdir.name, name_style=3, format='flac',
+                       page=1, page_size=50)
+        options.update(kwargs)
+        return DownloadArgs(**options)
+
+    def files(self):
+        # Less the state and library index of the destination.
+        return sorted(name for _, _, names in os.walk(self.tmpdir.name) for name in names
+                      if not name.startswith('.musicftdl.db'))
+
+    def test_download_album(self):
+        self.api.add_album('singer', 'album', songs=3)
+
+        musicftdl.download(self.args('album', album=True))
+
+        self.assertEqual(self.files(), [f'Singer singer - Album album - Song album_{i}.flac' for i in (1, 2, 3)])
+
+    def test_albums_of_a_singer_share_one_scheduler(self):
+        for i in range(4):
+            self.api.add_album('singer', f'ep{i}', songs=1)
+        self.api.latency = 0.2
+
+        musicftdl.download(self.args('singer', singer=True))
+
+        self.assertEqual(len(self.files()), 4)
+        # Albums were resolved and downloaded side by side instead of one after another.
+        self.assertGreaterEqual(self.api.max_in_flight, 4)
+
+
+class TestDedupe(unittest.TestCase):
+    """Tests for songs shared by albums being downloaded once."""
+
+    def setUp(self):
+        self.api = MockMusicApi().__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for album in ('studio', 'live'):
+            self.api.add_album('singer', album, songs=1)
+            self.api.songs[f'{album}_1']['file']['media_mid'] = 'media'
+
+    def tearDown(self):
+        self.api.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def download(self, format):
+        args = DownloadArgs(resource='singer', singer=True, destination=self.tmpdir.name, name_style=3,
+                            classified=False, format=format, page=1, page_size=50)
+        musicftdl.download(args)
+        return [os.path.join(self.tmpdir.name, f'Singer singer - Album {album} - Song {album}_1.{args.extension}')
+                for album in ('studio', 'live')]
+
+    def audio_requests(self):
+        return [path for path, _ in self.api.requests if path.startswith('/audio/')]
+
+    def test_same_media_is_hardlinked(self):
+        studio, live = self.download('flac')
+
+        self.assertEqual(len(self.audio_requests()), 1)
+        self.assertTrue(os.path.samefile(studio, live))
+
+    def test_same_media_is_copied_with_its_own_tag(self):
+        studio, live = self.download('128')
+
+        self.assertEqual(len(self.audio_requests()), 1)
+        self.assertFalse(os.path.samefile(studio, live))
+        self.assertEqual(eyed3.load(studio).tag.album, 'Album studio')
+        self.assertEqual(eyed3.load(live).tag.album, 'Album live')
+
+
+class TestAllPages(unittest.TestCase):
+    """Tests for fetching all pages of paged endpoints."""
+
+    def setUp(self):
+        self.api = MockMusicApi().__enter__()
+        for i in range(7):
+            self.api.add_album('singer', f'album{i}', songs=1)
+
+    def tearDown(self):
+        self.api.__exit__(None, None, None)
+
+    def test_pages_are_fetched_concurrently(self):
+        self.api.latency = 0.2
+
+        albums = musicftdl.iter_singer_albums('singer', page_size=2)
+
+        self.assertEqual(sorted(album.album_mid for album in albums), [f'album{i}' for i in range(7)])
+        self.assertEqual(len(self.api.requests), 4)
+        self.assertGreaterEqual(self.api.max_in_flight, 3)
+
+    def test_search_results_of_all_pages(self):
+        result = [item.song_mid for item in musicftdl.iter_search('song', page_size=3)]
+
+        self.assertEqual(sorted(result), [f'album{i}_1' for i in range(7)])
+
+    def test_download_albums_of_all_pages(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            musicftdl.download(DownloadArgs(resource='singer', singer=True, all_pages=True, destination=tmpdir,
+                                            name_style=1, classified=False, format='flac', page_size=2))
+
+            self.assertEqual(len([name for name in os.listdir(tmpdir) if name.endswith('.flac')]), 7)
+
+
+class TestGetSongUrls(unittest.TestCase):
+    """Tests for `musicftdl.get_song_urls`."""
+
+    def song_url_requests(self, api):
+        return [path.split('?')[0] for path, _ in api.requests if path.startswith('/song/url')]
+
+    def test_urls_are_resolved_in_batches(self):
+        with MockMusicApi() as api:
+            song_mids = api.add_album('singer', 'album', songs=5)
+
+            urls = musicftdl.get_song_urls(song_mids + ['missing'], batch_size=2)
+
+        self.assertEqual(urls, {mid: api.url(f'/audio/{mid}') for mid in song_mids})
+        self.assertEqual(self.song_url_requests(api), ['/song/urls'] * 3)
+
+    def test_fallback_without_batch_endpoint(self):
+        with MockMusicApi(batch=False) as api:
+            song_mids = api.add_album('singer', 'album', songs=3)
+
+            urls = musicftdl.get_song_urls(song_mids, batch_size=2)
+            self.assertFalse(musicftdl.batch_song_url_supported)
+
+        self.assertEqual(urls, {mid: api.url(f'/audio/{mid}') for mid in song_mids})
+        self.assertEqual(self.song_url_requests(api), ['/song/urls'] + ['/song/url'] * 3)
+
+    def test_album_songs_are_resolved_in_one_batch(self):
+        with MockMusicApi() as api, tempfile.TemporaryDirectory() as tmpdir:
+            api.add_album('singer', 'album', songs=10)
+
+            musicftdl.download(DownloadArgs(resource='album', album=True, destination=tmpdir, name_style=1,
+                                            format='flac'))
+
+        self.assertEqual(self.song_url_requests(api), ['/song/urls'])
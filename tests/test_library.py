@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.library` module."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from musicftdl import musicftdl
+from musicftdl.library import LibraryIndex
+from musicftdl.models import DownloadArgs
+from tests.mock_server import MockMusicApi
+
+
+class TestLibraryIndex(unittest.TestCase):
+    """Tests for `LibraryIndex`."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmpdir.name, 'Singer', 'Album'))
+        self.filename = os.path.join(self.tmpdir.name, 'Singer', 'Album', 'Song.flac')
+        with open(self.filename, 'wb') as f:
+            f.write(b'0123456789')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_scan_finds_files(self):
+        library = LibraryIndex(self.tmpdir.name)
+        self.assertEqual(library.size(self.filename), 10)
+        self.assertEqual(library.size(self.filename + '.part'), 0)
+        library.close()
+
+    def test_songs_are_found_by_mid(self):
+        library = LibraryIndex(self.tmpdir.name)
+        library.add('song', 'media', 'flac', self.filename)
+        self.assertEqual(library.get('song', 'flac'), (self.filename, 10))
+        self.assertEqual(library.find_media('media', 'flac'), (self.filename, 10))
+        self.assertIsNone(library.get('song', '320'))
+        library.close()
+
+        # Kept across runs, until the file is gone.
+        library = LibraryIndex(self.tmpdir.name)
+        self.assertEqual(library.get('song', 'flac'), (self.filename, 10))
+        library.close()
+        os.remove(self.filename)
+        library = LibraryIndex(self.tmpdir.name)
+        self.assertIsNone(library.get('song', 'flac'))
+        library.close()
+
+    def test_unmanaged_destination_is_not_scanned(self):
+        library = LibraryIndex(self.tmpdir.name, managed=False)
+        other = os.path.join(self.tmpdir.name, 'Other.flac')
+
+        with mock.patch('os.scandir') as scandir:
+            self.assertEqual(library.size(self.filename), 10)
+            self.assertIsNone(library.get('song', 'flac'))
+            with open(other, 'wb') as f:
+                f.write(b'01234')
+            library.add('other', 'media', 'flac', other)
+            self.assertEqual(library.find_media('media', 'flac'), (other, 5))
+        library.close()
+
+        scandir.assert_not_called()
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ['Other.flac', 'Singer'])
+
+
+class TestDownloadWithLibrary(unittest.TestCase):
+    """Tests for downloads looking songs up in the library index."""
+
+    def test_song_under_another_name_style_is_skipped(self):
+        with MockMusicApi() as api, tempfile.TemporaryDirectory() as tmpdir:
+            api.add_album('singer', 'album', songs=2)
+            args = DownloadArgs(resource='album', album=True, destination=tmpdir, name_style=1, format='flac')
+            musicftdl.download(args)
+
+            del api.requests[:]
+            musicftdl.download(args.copy(update={'name_style': 3}))
+
+        self.assertEqual([path for path, _ in api.requests if path.startswith('/audio/')], [])
+
+    def test_single_song_does_not_make_a_library(self):
+        with MockMusicApi() as api, tempfile.TemporaryDirectory() as tmpdir:
+            api.add_album('singer', 'album', songs=1)
+            args = DownloadArgs(resource='album_1', destination=tmpdir, name_style=1, classified=False,
+                                format='flac')
+            musicftdl.download(args)
+            self.assertEqual(os.listdir(tmpdir), ['Song album_1.flac'])
+
+            # Unless the destination is a library already.
+            musicftdl.download(args.copy(update={'resource': 'album', 'album': True}))
+            os.remove(os.path.join(tmpdir, 'Song album_1.flac'))
+            musicftdl.download(args)
+            self.assertIn('.musicftdl.db', os.listdir(tmpdir))
+            self.assertEqual(musicftdl.get_library(tmpdir).get('album_1', 'flac'),
+                             (os.path.join(tmpdir, 'Song album_1.flac'), 1024))
+
+
+if __name__ == '__main__':
+    unittest.main()
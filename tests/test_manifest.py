@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""Tests for downloading resources listed in a manifest."""
+
+import os
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from musicftdl import cli, musicftdl
+from musicftdl.models import DownloadArgs, Resource
+from tests.mock_server import MockMusicApi
+
+
+class TestParseManifest(unittest.TestCase):
+    """Tests for `musicftdl.parse_manifest`."""
+
+    def test_typed_lines_and_json(self):
+        lines = ['# comment', 'song:s1', '', 'album: a1', 'Singer:p1', 'keywords:Jay Chou - Mojito',
+                 '{"type": "album", "resource": "a2"}', 'bare']
+
+        resources = list(musicftdl.parse_manifest(lines, default_type='singer'))
+
+        self.assertEqual(resources, [Resource(type='song', resource='s1'), Resource(type='album', resource='a1'),
+                                     Resource(type='singer', resource='p1'),
+                                     Resource(type='keyword', resource='Jay Chou - Mojito'),
+                                     Resource(type='album', resource='a2'), Resource(type='singer', resource='bare')])
+
+    def test_unknown_type_in_json(self):
+        with self.assertRaises(ValueError):
+            list(musicftdl.parse_manifest(['{"type": "playlist", "resource": "x"}']))
+
+    def test_invalid_lines_are_reported_when_not_strict(self):
+        lines = ['album:a1', '{"type": "playlist", "resource": "x"}', '{bad json', '{"type": ["song"]}', 'song:s1']
+
+        resources = list(musicftdl.parse_manifest(lines, strict=False))
+
+        self.assertEqual(resources[0], Resource(type='album', resource='a1'))
+        self.assertEqual(resources[-1], Resource(type='song', resource='s1'))
+        self.assertEqual([(r.resource, r.error.split(':')[0], r.ok) for r in resources[1:-1]],
+                         [(lines[1], 'Invalid line 2', False), (lines[2], 'Invalid line 3', False),
+                          (lines[3], 'Invalid line 4', False)])
+
+
+class TestDownloadMany(unittest.TestCase):
+    """Tests for `musicftdl.download_many` against a mock API."""
+
+    def setUp(self):
+        self.api = MockMusicApi().__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.api.add_album('singer1', 'album1', songs=2)
+        self.api.add_album('singer2', 'album2', songs=3)
+        self.api.add_album('singer2', 'album3', songs=1)
+
+    def tearDown(self):
+        self.api.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def flacs(self):
+        return sorted(name for _, _, names in os.walk(self.tmpdir.name) for name in names if name.endswith('.flac'))
+
+    def test_mixed_resources_share_one_pipeline(self):
+        args = DownloadArgs(destination=self.tmpdir.name, name_style=1, format='flac', page=1, page_size=50)
+        resources = musicftdl.parse_manifest(['song:album1_1', 'album:album1', 'singer:singer2',
+                                              'keyword:album3_1', 'album:missing'])
+
+        reports = musicftdl.download_many(args, resources)
+
+        # Songs listed twice are downloaded by whichever resource comes first, and skipped by the other.
+        self.assertEqual([(r.downloaded + r.skipped, r.failed) for r in reports],
+                         [(1, 0), (2, 0), (4, 0), (1, 0), (0, 0)])
+        self.assertEqual(sum(r.downloaded for r in reports), 6)
+        self.assertEqual(reports[-1].error, 'Not found')
+        self.assertEqual([r.ok for r in reports], [True, True, True, True, False])
+        self.assertEqual(len(self.flacs()), 6)
+
+    def test_cli_reads_stdin(self):
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, ['download', '-F', '-', '-a', '-d', self.tmpdir.name, '-f', 'flac',
+                                         '--no-cache'],
+                               input='album1\nalbum2\n')
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('DOWNLOADED', result.output)
+        self.assertEqual(len(self.flacs()), 5)
+
+    def test_cli_reports_invalid_lines_and_goes_on(self):
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, ['download', '-F', '-', '-a', '-d', self.tmpdir.name, '-f', 'flac',
+                                         '--no-cache'],
+                               input='album1\n{"type": "playlist", "resource": "x"}\nalbum2\n')
+
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn('Invalid line 2', result.output)
+        self.assertIn('1 of 3 resources failed', result.output)
+        self.assertEqual(len(self.flacs()), 5)
+
+
+class TestKeywords(unittest.TestCase):
+    """Tests for batches of keywords."""
+
+    def setUp(self):
+        self.api = MockMusicApi().__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for i in range(6):
+            self.api.add_album('singer', f'album{i}', songs=1)
+        musicftdl._keywords.clear()
+
+    def tearDown(self):
+        self.api.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def test_normalize_query(self):
+        self.assertEqual(musicftdl.normalize_query('  Jay Chou - Mojito '), 'jay chou mojito')
+        self.assertEqual(musicftdl.normalize_query('ＪＡＹ　ＣＨＯＵ／Mojito'), 'jay chou mojito')
+
+    def test_searches_are_memoized_by_normalized_query(self):
+        songs = [musicftdl.resolve_keyword(key) for key in ('Song album1_1', 'song   ALBUM1_1', 'nothing')]
+
+        self.assertEqual([song and song.song_mid for song in songs], ['album1_1', 'album1_1', None])
+        self.assertEqual(len([path for path, _ in self.api.requests if path.startswith('/search')]), 2)
+
+    def test_keywords_are_searched_concurrently(self):
+        self.api.latency = 0.2
+        args = DownloadArgs(destination=self.tmpdir.name, name_style=1, format='flac', search_workers=6)
+        resources = musicftdl.parse_manifest([f'Song album{i}_1' for i in range(6)], default_type='keyword')
+
+        reports = musicftdl.download_many(args, resources)
+
+        self.assertEqual([r.downloaded for r in reports], [1] * 6)
+        self.assertGreaterEqual(self.api.max_in_flight, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
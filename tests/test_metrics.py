@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.metrics` module."""
+
+import json
+import os
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from musicftdl import cli, musicftdl
+from musicftdl.metrics import Histogram, Metrics
+from tests.mock_server import MockMusicApi
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests for `Metrics`."""
+
+    def test_disabled_records_nothing(self):
+        metrics = Metrics()
+
+        @metrics.instrument('stage')
+        def stage():
+            return 1
+
+        self.assertEqual(stage(), 1)
+        metrics.count('bytes', 10)
+        self.assertEqual(metrics.dict(), {'counters': [], 'histograms': []})
+
+    def test_timer_and_counters(self):
+        metrics = Metrics(enabled=True)
+        with metrics.timer('http', host='a'):
+            pass
+        with self.assertRaises(ValueError), metrics.timer('http', host='a'):
+            raise ValueError
+        metrics.count('bytes', 10, stage='download_music')
+        metrics.count('bytes', 5, stage='download_music')
+
+        data = metrics.dict()
+        self.assertEqual(data['counters'], [
+            {'name': 'bytes', 'labels': {'stage': 'download_music'}, 'value': 15},
+            {'name': 'errors', 'labels': {'host': 'a', 'stage': 'http'}, 'value': 1},
+        ])
+        self.assertEqual(data['histograms'][0]['count'], 2)
+
+    def test_histogram_buckets(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.cumulative(), [(0.1, 2), (1, 3), ('+Inf', 4)])
+
+    def test_prometheus_textfile(self):
+        metrics = Metrics(enabled=True)
+        metrics.observe('stage_seconds', 0.2, stage='get_song_url')
+        metrics.count('retries', host='mapi.lonsty.me')
+
+        text = metrics.prometheus()
+        self.assertIn('# TYPE musicftdl_retries_total counter', text)
+        self.assertIn('musicftdl_retries_total{host="mapi.lonsty.me"} 1', text)
+        self.assertIn('musicftdl_stage_seconds_bucket{stage="get_song_url",le="0.25"} 1', text)
+        self.assertIn('musicftdl_stage_seconds_count{stage="get_song_url"} 1', text)
+
+
+class TestRunMetrics(unittest.TestCase):
+    """Tests for the metrics of a download run."""
+
+    def test_download_exports_metrics(self):
+        with MockMusicApi() as api, tempfile.TemporaryDirectory() as tmpdir:
+            api.add_album('singer', 'album', songs=3, size=1000)
+            path = os.path.join(tmpdir, 'metrics.json')
+            try:
+                result = CliRunner().invoke(cli.cli, ['download', '-a', 'album', '-d', tmpdir, '-f', 'flac',
+                                                      '--no-cache', '--metrics', path])
+            finally:
+                musicftdl.metrics.enabled = False
+
+            self.assertEqual(result.exit_code, 0, result.output)
+            with open(path) as f:
+                data = json.load(f)
+
+        counters = {(c['name'], tuple(c['labels'].values())): c['value'] for c in data['counters']}
+        self.assertEqual(counters[('bytes', ('download_music',))], 3000)
+        self.assertEqual(counters[('songs', ('downloaded',))], 3)
+        stages = {h['labels'].get('stage'): h['count'] for h in data['histograms']}
+        self.assertEqual(stages['download_music'], 3)
+        self.assertEqual(stages['get_album_songs'], 1)
+        self.assertEqual(stages['http'], len(api.requests))
+        connections = sum(value for (name, _), value in counters.items()
+                          if name in ('http_connections_opened', 'http_connections_reused'))
+        self.assertEqual(connections, len(api.requests))
+        self.assertGreater(counters[('http_connections_reused', ('127.0.0.1',))], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Tests for the models of `musicftdl` package."""
+
+import pickle
+import unittest
+
+from benchmarks.bench_models import album_songs_data, run_scenario, singer_albums_data
+from musicftdl.models import Track
+from musicftdl.musicftdl import (build_song_info, parse_album_songs,
+                                 parse_album_tracks, parse_singer_albums)
+from musicftdl.tagging import render_tag
+from musicftdl.utils import parse_date
+
+
+class TestTrack(unittest.TestCase):
+    """Tests for `musicftdl.models.Track`."""
+
+    def setUp(self):
+        self.album = parse_singer_albums(singer_albums_data(1))[0]
+        self.album.album_cover_content = b'\xff\xd8\xff\xe0cover'
+        self.data = album_songs_data(self.album.album_mid, 3)
+
+    def test_track_has_the_fields_of_song_info(self):
+        tracks = parse_album_tracks(self.data, self.album)
+        song_infos = [build_song_info(song, self.album) for song in parse_album_songs(self.data)]
+
+        self.assertEqual([track.dict(exclude={'duration'}) for track in tracks],
+                         [song_info.dict(exclude={'duration'}) for song_info in song_infos])
+        self.assertEqual(tracks[0].duration, '03:20')
+        self.assertEqual(tracks[0].singer_name, 'Singer&Guest')
+        self.assertEqual(tracks[0].album_singer_name, 'Singer')
+        self.assertFalse(hasattr(tracks[0], '__dict__'))
+
+    def test_album_fields_are_shared(self):
+        tracks = parse_album_tracks(self.data, self.album)
+
+        for track in tracks:
+            self.assertIs(track.album_cover_content, self.album.album_cover_content)
+            self.assertIs(track.album_singers_name, self.album.singers_name)
+
+    def test_publish_date_is_parsed_once(self):
+        parse_date.cache_clear()
+        tracks = parse_album_tracks(self.data, self.album)
+
+        dates = [track.publish_date for track in tracks]
+
+        self.assertEqual(dates[0].year, 2000)
+        self.assertEqual(parse_date.cache_info().misses, 1)
+        self.assertIs(self.album.publish_date, dates[0])
+
+    def test_track_is_rendered_in_a_process_pool(self):
+        track = parse_album_tracks(self.data, self.album)[0]
+
+        copy = pickle.loads(pickle.dumps(track))
+
+        self.assertEqual(copy.dict(), track.dict())
+        self.assertEqual(render_tag(copy), render_tag(build_song_info(parse_album_songs(self.data)[0], self.album)))
+
+    def test_missing_fields_are_none(self):
+        track = Track(song_mid='001')
+
+        self.assertIsNone(track.album_cover_content)
+        self.assertIsNone(track.singer_name)
+
+
+class TestBenchModels(unittest.TestCase):
+    """Smoke tests for the model microbenchmark."""
+
+    def test_run_scenario(self):
+        result = run_scenario('singer', albums=3, songs=4, repeat=1)
+
+        # How much faster tracks are built is left to the benchmark, not timed here.
+        self.assertEqual(list(result), ['scenario', 'songs', 'pydantic_us_per_song', 'track_us_per_song', 'speedup'])
+        self.assertEqual((result['scenario'], result['songs']), ('singer', 12))
+        self.assertGreater(result['pydantic_us_per_song'], 0)
+        self.assertGreater(result['track_us_per_song'], 0)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+"""Tests for planning the filenames of songs in `musicftdl` package."""
+
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from musicftdl import musicftdl
+from musicftdl.library import LibraryIndex
+from musicftdl.models import DownloadArgs, Track
+from musicftdl.paths import PathPlanner
+from musicftdl.state import SyncState
+from tests.mock_server import MockMusicApi
+
+
+def track(song_mid, song_name=None, album_name='Album', str_media_mid=None, album_mid=None):
+    return Track(song_mid=song_mid, song_name=song_name or f'Song {song_mid}', singers_name=['Singer'],
+                 album_name=album_name, str_media_mid=str_media_mid, album_mid=album_mid)
+
+
+class TestPathPlanner(unittest.TestCase):
+    """Tests for `musicftdl.paths.PathPlanner`."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def planner(self, library=None, **kwargs):
+        options = dict(destination=self.tmpdir.name, name_style=1, format='flac')
+        options.update(kwargs)
+        return PathPlanner(DownloadArgs(**options), library)
+
+    def write(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(b'audio')
+
+    def test_folders_are_created_once(self):
+        planner = self.planner()
+        songs = [track(str(i), album_name='A/B: C?') for i in range(50)]
+        # Or os.makedirs calls itself for the singer folder.
+        os.mkdir(os.path.join(self.tmpdir.name, 'Singer'))
+
+        with mock.patch('os.makedirs', wraps=os.makedirs) as makedirs, \
+                mock.patch('os.path.isdir', wraps=os.path.isdir) as isdir:
+            self.assertEqual(planner.plan(songs), [])
+            filenames = [planner.filename(song) for song in songs]
+            planner.filename(track('other', album_name='A/B: C?'))
+
+        folder = os.path.join(self.tmpdir.name, 'Singer', 'AB C')
+        self.assertTrue(os.path.isdir(folder))
+        self.assertEqual(makedirs.call_count, 1)
+        self.assertEqual(isdir.call_count, 0)
+        self.assertEqual(filenames[0], os.path.join(folder, 'Song 0.flac'))
+
+    def test_filenames_are_those_of_download_args(self):
+        for classified in (True, False):
+            for name_style in (1, 2, 3):
+                args = DownloadArgs(destination=self.tmpdir.name, name_style=name_style, classified=classified,
+                                    format='320')
+                song = track('001', song_name='Song: 1')
+
+                self.assertEqual(PathPlanner(args).filename(song), args.filename(song))
+
+    def test_collision_is_renamed(self):
+        planner = self.planner(classified=False)
+        songs = [track('001', 'Intro', 'Album 1'), track('002', 'Intro', 'Album 2'),
+                 track('003', 'Intro', 'Album 3', str_media_mid='media'),
+                 track('004', 'Intro', 'Album 4', str_media_mid='media')]
+
+        renamed = planner.plan(songs)
+
+        self.assertEqual([(song.song_mid, os.path.basename(filename)) for song, filename in renamed],
+                         [(mid, f'Intro [{mid}].flac') for mid in ('002', '003', '004')])
+        self.assertEqual(planner.filename(songs[0]), os.path.join(self.tmpdir.name, 'Intro.flac'))
+
+    def test_collision_does_not_depend_on_the_planning_order(self):
+        first, second = track('002', 'Intro', 'Album 1', album_mid='a'), track('001', 'Intro', 'Album 2', album_mid='b')
+        for albums in ([first], [second]), ([second], [first]):
+            planner = self.planner(classified=False)
+
+            renamed = [rename for album in albums for rename in planner.plan(album)]
+
+            self.assertEqual([(song.song_mid, os.path.basename(filename)) for song, filename in renamed],
+                             [('001', 'Intro [001].flac')])
+            self.assertEqual(planner.filename(first), os.path.join(self.tmpdir.name, 'Intro.flac'))
+            self.assertEqual(planner.filename(second), os.path.join(self.tmpdir.name, 'Intro [001].flac'))
+
+    def test_written_song_is_moved_to_its_own_filename(self):
+        library = LibraryIndex(self.tmpdir.name, managed=True)
+        self.addCleanup(library.close)
+        planner = self.planner(library, classified=False)
+        first, second = track('002', 'Intro', album_mid='a'), track('001', 'Intro', album_mid='b')
+        planner.plan([second])
+        filename = planner.acquire(second)
+        self.write(filename)
+        library.add('001', None, 'flac', filename)
+        self.assertEqual(planner.release(second, written=True), filename)
+
+        planner.plan([first])
+
+        self.assertEqual(planner.acquire(first), filename)
+        moved = os.path.join(self.tmpdir.name, 'Intro [001].flac')
+        self.assertEqual(library.get('001', 'flac')[0], moved)
+        self.assertFalse(os.path.exists(filename))
+        self.assertTrue(os.path.exists(moved))
+
+    def test_song_being_written_is_moved_as_it_is_released(self):
+        planner = self.planner(classified=False)
+        first, second = track('002', 'Intro', album_mid='a'), track('001', 'Intro', album_mid='b')
+        planner.plan([second])
+        filename = planner.acquire(second)
+        planner.plan([first])
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(planner.acquire(first)))
+        waiter.start()
+        time.sleep(0.1)
+
+        # The song given the filename waits until the song writing it is done.
+        self.assertEqual(acquired, [])
+        self.assertEqual(planner.filename(second), filename)
+        self.write(filename)
+        moved = planner.release(second, written=True)
+        waiter.join(5)
+
+        self.assertEqual(acquired, [filename])
+        self.assertEqual(moved, os.path.join(self.tmpdir.name, 'Intro [001].flac'))
+        self.assertTrue(os.path.exists(moved))
+        self.assertFalse(os.path.exists(filename))
+
+    def test_skipped_songs_keep_their_filenames(self):
+        planner = self.planner(classified=True)
+        songs = [track('001', 'Intro'), track('002', 'Intro')]
+
+        renamed = planner.plan(songs, skipped={'001'})
+
+        self.assertEqual([(song.song_mid, os.path.basename(filename)) for song, filename in renamed],
+                         [('002', 'Intro [002].flac')])
+        self.assertEqual(planner.filename(songs[0]), os.path.join(self.tmpdir.name, 'Singer', 'Album', 'Intro.flac'))
+        self.assertTrue(os.path.isdir(os.path.join(self.tmpdir.name, 'Singer', 'Album')))
+
+        planner = self.planner(classified=True)
+        planner.plan(songs, skipped={'001', '002'})
+        self.assertEqual(os.listdir(self.tmpdir.name), ['Singer'])
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, 'Singer')), ['Album'])
+
+    def test_same_recording_is_not_renamed(self):
+        planner = self.planner(classified=False)
+        songs = [track('001', 'Intro', 'Album 1', str_media_mid='media'),
+                 track('002', 'Intro', 'Album 2', str_media_mid='media')]
+
+        # Given the same filename, the recording is downloaded once for both.
+        self.assertEqual(planner.plan(songs), [])
+        self.assertEqual(planner.filename(songs[0]), planner.filename(songs[1]))
+
+
+class TestPlanFilenames(unittest.TestCase):
+    """Tests for filenames planned while downloading albums."""
+
+    def setUp(self):
+        self.api = MockMusicApi().__enter__()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.api.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def download(self, **kwargs):
+        options = dict(resource='album', album=True, destination=self.tmpdir.name, name_style=1, format='flac')
+        options.update(kwargs)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            musicftdl.download(DownloadArgs(**options))
+        return output.getvalue()
+
+    def files(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.tmpdir.name)
+                      for root, _, names in os.walk(self.tmpdir.name) for name in names
+                      if not name.startswith('.musicftdl.db'))
+
+    def test_songs_of_the_same_name_are_both_downloaded(self):
+        self.api.add_album('singer', 'album', songs=2)
+        self.api.songs['album_2']['name'] = 'Song album_1'
+
+        output = self.download(classified=False)
+
+        self.assertEqual(self.files(), ['Song album_1 [album_2].flac', 'Song album_1.flac'])
+        self.assertIn('Song album_1 [Saved as Song album_1 [album_2].flac', output)
+
+    def test_no_folder_is_created_for_downloaded_songs(self):
+        self.api.add_album('singer', 'album', songs=2)
+        self.download(classified=False)
+
+        self.download(classified=True)
+
+        self.assertEqual(os.listdir(self.tmpdir.name).count('Singer singer'), 0)
+        self.assertEqual(self.files(), ['Song album_1.flac', 'Song album_2.flac'])
+
+    def test_collision_does_not_depend_on_which_album_is_done_first(self):
+        self.api.add_album('singer', 'album_a')
+        self.api.add_album('singer', 'album_b')
+        self.api.songs['album_b_1']['name'] = 'Song album_a_1'
+        get_album_tracks = musicftdl.get_album_tracks
+
+        def album_b_first(album):
+            # The song of album_b is downloaded before album_a is planned.
+            library = musicftdl.get_library(self.tmpdir.name)
+            for _ in range(100):
+                if album.album_mid != 'album_a' or library.get('album_b_1', 'flac'):
+                    break
+                time.sleep(0.05)
+            return get_album_tracks(album)
+
+        for tracks in (get_album_tracks, album_b_first):
+            self.tmpdir = tempfile.TemporaryDirectory()
+            self.addCleanup(self.tmpdir.cleanup)
+            with self.subTest(tracks=tracks.__name__), \
+                    mock.patch('musicftdl.musicftdl.get_album_tracks', side_effect=tracks):
+                self.download(resource='singer', album=False, singer=True, classified=False, page=1, page_size=50)
+
+                self.assertEqual(self.files(), ['Song album_a_1 [album_b_1].flac', 'Song album_a_1.flac'])
+                library = musicftdl.get_library(self.tmpdir.name)
+                self.assertEqual(library.get('album_b_1', 'flac')[0],
+                                 os.path.join(self.tmpdir.name, 'Song album_a_1 [album_b_1].flac'))
+
+    def fail_second_song(self):
+        """Add an album of two songs of the same name, the second of which fails to download."""
+        self.api.add_album('singer', 'album', songs=2)
+        self.api.songs['album_2']['name'] = 'Song album_1'
+        return self.api.files.pop('/audio/album_2')
+
+    def assertSecondSongIsRenamed(self):
+        self.assertEqual(self.files(), ['Song album_1 [album_2].flac', 'Song album_1.flac'])
+        library = musicftdl.get_library(self.tmpdir.name)
+        self.assertEqual(library.get('album_1', 'flac')[0], os.path.join(self.tmpdir.name, 'Song album_1.flac'))
+        self.assertEqual(library.get('album_2', 'flac')[0],
+                         os.path.join(self.tmpdir.name, 'Song album_1 [album_2].flac'))
+
+    def test_renamed_song_keeps_its_name_in_the_next_run(self):
+        audio = self.fail_second_song()
+        self.download(classified=False)
+        self.assertEqual(self.files(), ['Song album_1.flac'])
+
+        # The first song, downloaded by the first run, still has its filename.
+        self.api.files['/audio/album_2'] = audio
+        self.download(classified=False)
+
+        self.assertSecondSongIsRenamed()
+
+    def test_renamed_song_keeps_its_name_in_the_next_sync(self):
+        audio = self.fail_second_song()
+        args = DownloadArgs(singer=True, destination=self.tmpdir.name, name_style=1, format='flac',
+                            classified=False)
+
+        for _ in range(2):
+            state = SyncState(self.tmpdir.name)
+            try:
+                with redirect_stdout(io.StringIO()):
+                    musicftdl.sync(args, ['singer'], state)
+            finally:
+                state.close()
+            self.api.files['/audio/album_2'] = audio
+
+        self.assertSecondSongIsRenamed()
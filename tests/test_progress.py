@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.progress` module."""
+
+import io
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from musicftdl import musicftdl
+from musicftdl.models import DownloadArgs
+from musicftdl.progress import Progress, format_seconds, format_size
+from tests.mock_server import MockMusicApi
+
+
+class TTY(io.StringIO):
+
+    def isatty(self):
+        return True
+
+
+class TestProgress(unittest.TestCase):
+    """Tests for `Progress`."""
+
+    def test_formats(self):
+        self.assertEqual(format_size(512), '512 B')
+        self.assertEqual(format_size(3 * 1024 * 1024), '3.0 MB')
+        self.assertEqual(format_seconds(3725), '1:02:05')
+
+    def test_files_are_printed_when_not_running(self):
+        stream = io.StringIO()
+        progress = Progress(stream)
+        progress.done('a.flac', 'downloaded')
+        progress.done('b.flac', 'skipped')
+        progress.done('c.flac', 'failed')
+
+        self.assertEqual(stream.getvalue(), 'a.flac\nb.flac [Skipped]\n')
+
+    def test_summary_lines_when_not_a_tty(self):
+        stream = io.StringIO()
+        with Progress(stream, interval=0.05) as progress:
+            progress.add(2, album='album', name='Album')
+            progress.advance(2048)
+            progress.done('a.flac', 'downloaded')
+            progress.album_song_done('album')
+            time.sleep(0.12)
+            progress.done('b.flac', 'failed')
+            progress.album_song_done('album')
+
+        lines = stream.getvalue().splitlines()
+        self.assertNotIn('a.flac', lines)
+        self.assertIn('Album [2/2]', lines)
+        self.assertTrue(lines[0].startswith('1/2 files, 2.0 KB at '), lines)
+        self.assertTrue(lines[-1].startswith('2/2 files, 0 skipped, 1 failed, 2.0 KB at '), lines)
+        self.assertTrue(lines[-1].endswith('1/1 albums'), lines)
+
+    def test_status_line_is_refreshed_on_a_tty(self):
+        stream = TTY()
+        with Progress(stream, interval=0.02) as progress:
+            progress.add(1)
+            time.sleep(0.07)
+            progress.log('error')
+            progress.done('a.flac', 'downloaded')
+
+        output = stream.getvalue()
+        self.assertIn('0/1 files', output)
+        self.assertIn('\r\x1b[Kerror\n', output)
+        self.assertTrue(output.endswith('1/1 files, 0 B at 0 B/s\n'), repr(output))
+
+
+class TestDownloadProgress(unittest.TestCase):
+    """Tests for the progress of a download run."""
+
+    def test_progress_of_a_run(self):
+        stream = io.StringIO()
+        with MockMusicApi() as api, tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(musicftdl, 'progress', Progress(stream)):
+            api.add_album('singer', 'album', songs=3, size=1024)
+            with musicftdl.progress:
+                musicftdl.download(DownloadArgs(resource='album', album=True, destination=tmpdir, name_style=1,
+                                                format='flac'))
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 2, lines)
+        self.assertEqual(lines[0], 'Album album [3/3]')
+        self.assertTrue(lines[1].startswith('3/3 files, 3.0 KB at '), lines)
+        self.assertTrue(lines[1].endswith(', 1/1 albums'), lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.retries` module."""
+
+import time
+import unittest
+from unittest import mock
+
+from musicftdl.retries import (CircuitBreaker, CircuitOpenError, RetryBudget,
+                               RetryPolicy)
+
+
+class TransientError(Exception):
+    retry_after = None
+
+
+class PermanentError(Exception):
+    pass
+
+
+def policy(**kwargs):
+    options = dict(host=lambda url: url, is_transient=lambda e: isinstance(e, TransientError),
+                   retry_after=lambda e: getattr(e, 'retry_after', None), delay=0.01)
+    options.update(kwargs)
+    return RetryPolicy(**options)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Tests for `RetryPolicy`."""
+
+    def test_transient_errors_are_retried(self):
+        f = mock.Mock(side_effect=[TransientError, TransientError, 'ok'])
+
+        self.assertEqual(policy()(f)('host'), 'ok')
+        self.assertEqual(f.call_count, 3)
+
+    def test_permanent_errors_are_not_retried(self):
+        f = mock.Mock(side_effect=PermanentError)
+
+        with self.assertRaises(PermanentError):
+            policy()(f)('host')
+        self.assertEqual(f.call_count, 1)
+
+    def test_retry_after_is_honoured(self):
+        error = TransientError()
+        error.retry_after = 0.2
+        f = mock.Mock(side_effect=[error, 'ok'])
+
+        start = time.monotonic()
+        self.assertEqual(policy(delay=0)(f)('host'), 'ok')
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_backoff_is_jittered(self):
+        sleeps = {policy(delay=1).sleep_time(2, TransientError()) for _ in range(10)}
+
+        self.assertGreater(len(sleeps), 1)
+        self.assertTrue(all(2 <= sleep <= 6 for sleep in sleeps))
+
+    def test_retries_stop_when_budget_is_exhausted(self):
+        f = mock.Mock(side_effect=TransientError)
+        decorated = policy(tries=10, budget=RetryBudget(ratio=0, minimum=3),
+                           breaker=CircuitBreaker(threshold=100))(f)
+
+        for _ in range(3):
+            with self.assertRaises(TransientError):
+                decorated('host')
+        # 3 retries were allowed in all, then every call is tried once only.
+        self.assertEqual(f.call_count, 3 + 3)
+
+    def test_circuit_opens_for_a_failing_host(self):
+        f = mock.Mock(side_effect=TransientError)
+        decorated = policy(tries=1, breaker=CircuitBreaker(threshold=2, reset_timeout=0.1))(f)
+
+        for _ in range(2):
+            with self.assertRaises(TransientError):
+                decorated('down')
+        with self.assertRaises(CircuitOpenError):
+            decorated('down')
+        self.assertEqual(f.call_count, 2)
+
+        f.side_effect = None
+        f.return_value = 'ok'
+        self.assertEqual(decorated('up'), 'ok')
+        time.sleep(0.1)
+        self.assertEqual(decorated('down'), 'ok')
+        self.assertEqual(decorated('down'), 'ok')
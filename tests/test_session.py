@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.session` module."""
+
+import tempfile
+import unittest
+from unittest import mock
+
+from musicftdl import musicftdl
+from musicftdl.models import DownloadArgs
+from musicftdl.session import PoolStats, new_session
+from tests.mock_server import MockMusicApi
+
+
+class TestSession(unittest.TestCase):
+    """Tests for the session shared by all threads."""
+
+    def test_connections_are_reused_across_albums(self):
+        stats = PoolStats()
+        session = new_session(pool_maxsize=4, stats=stats)
+
+        with MockMusicApi() as api, tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(musicftdl, 'session', session):
+            for i in range(3):
+                api.add_album('singer', f'album{i}', songs=8)
+                musicftdl.download(DownloadArgs(resource=f'album{i}', album=True, destination=tmpdir,
+                                                name_style=1, format='flac', workers=4, max_workers=4))
+
+        self.assertEqual(stats.requests, len(api.requests))
+        # A warm pool of 4 connections per host serves every album after the first one.
+        self.assertLessEqual(stats.new_connections, 4)
+        self.assertEqual(stats.reused_connections, stats.requests - stats.new_connections)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+"""Tests for the startup of `musicftdl` CLI, guarding against heavy imports."""
+
+import subprocess
+import sys
+import unittest
+
+from benchmarks.bench_startup import COMMANDS, heavy_modules, import_times
+
+
+class TestStartup(unittest.TestCase):
+    """Tests that commands import heavy dependencies only once they need them."""
+
+    def test_help_imports_no_heavy_dependency(self):
+        self.assertEqual(heavy_modules(import_times(COMMANDS['help'])), [])
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Tagging is imported with the main module before Python 3.7')
+    def test_search_imports_no_tagging_dependency(self):
+        self.assertEqual(heavy_modules(import_times(COMMANDS['search'])), ['pydantic', 'requests'])
+
+    def test_import_times(self):
+        times = import_times('import json')
+
+        self_us, cumulative_us, depth = times['json']
+        self.assertEqual(depth, 0)
+        self.assertLessEqual(self_us, cumulative_us)
+        self.assertEqual(times['json.decoder'][2], 1)
+
+    def test_help_runs_without_heavy_dependency(self):
+        code = ('import sys\n'
+                'from musicftdl.cli import cli\n'
+                'heavy = ("eyed3", "requests", "dateutil", "pydantic")\n'
+                'try:\n'
+                '    cli(["download", "--help"])\n'
+                'except SystemExit:\n'
+                '    print("loaded:" + ",".join(m for m in heavy if m in sys.modules))\n')
+        output = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+
+        self.assertIn('--max-rate', output)
+        self.assertEqual(output.strip().splitlines()[-1], 'loaded:')
+
+    def test_add_tags_is_still_exported(self):
+        from musicftdl import musicftdl
+        from musicftdl.tagging import add_tags
+
+        self.assertIs(musicftdl.add_tags, add_tags)
+        with self.assertRaises(AttributeError):
+            musicftdl.missing
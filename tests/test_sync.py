@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""Tests for the `sync` of `musicftdl` package."""
+
+import os
+import tempfile
+import unittest
+
+from musicftdl import musicftdl
+from musicftdl.models import DownloadArgs
+from musicftdl.state import SyncState
+from tests.mock_server import MockMusicApi
+
+
+class TestSync(unittest.TestCase):
+    """Tests for incremental downloads of singers."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.args = DownloadArgs(singer=True, destination=self.tmpdir.name, name_style=1, format='flac',
+                                 classified=False, page_size=2, workers=4)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def sync(self):
+        state = SyncState(self.args.destination)
+        try:
+            musicftdl.sync(self.args, ['singer'], state)
+        finally:
+            state.close()
+
+    def test_second_sync_fetches_one_page(self):
+        with MockMusicApi() as api:
+            for i in range(5):
+                api.add_album('singer', f'album{i}', songs=2)
+            self.sync()
+            self.assertEqual(len([name for name in os.listdir(self.tmpdir.name) if name.endswith('.flac')]), 10)
+
+            del api.requests[:]
+            self.sync()
+
+        self.assertEqual([path for path, _ in api.requests], ['/singer/album?singermid=singer&pageNo=1&pageSize=2'])
+
+    def test_sync_downloads_new_albums_only(self):
+        with MockMusicApi() as api:
+            api.add_album('singer', 'old', songs=2)
+            self.sync()
+            api.add_album('singer', 'new', songs=3)
+            del api.requests[:]
+            self.sync()
+
+        audio = sorted(path for path, _ in api.requests if path.startswith('/audio/'))
+        self.assertEqual(audio, ['/audio/new_1', '/audio/new_2', '/audio/new_3'])
+
+    def test_incomplete_album_is_retried(self):
+        with MockMusicApi() as api:
+            api.add_album('singer', 'album', songs=2)
+            audio = api.files.pop('/audio/album_2')
+            self.sync()
+            api.files['/audio/album_2'] = audio
+            del api.requests[:]
+            self.sync()
+
+        self.assertEqual([path for path, _ in api.requests if path.startswith('/audio/')], ['/audio/album_2'])
+        state = SyncState(self.args.destination)
+        self.assertEqual(state.albums('singer', 'flac'), {'album': True})
+        state.close()
+
+    def test_filtered_out_albums_are_not_walked_again(self):
+        self.args = self.args.copy(update={'album_types': 'S'})
+        with MockMusicApi() as api:
+            api.add_album('singer', 'live', songs=2, album_type='现场专辑')
+            api.add_album('singer', 'studio', songs=2)
+            self.sync()
+            del api.requests[:]
+            self.sync()
+
+        self.assertEqual([path for path, _ in api.requests], ['/singer/album?singermid=singer&pageNo=1&pageSize=2'])
+        state = SyncState(self.args.destination)
+        self.assertEqual(state.albums('singer', 'flac'), {'live': True, 'studio': True})
+        self.assertEqual(state.songs('flac'), {'studio_1', 'studio_2'})
+        state.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
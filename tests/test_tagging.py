@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.tagging` module."""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import eyed3
+from eyed3.id3 import Tag
+
+from musicftdl import musicftdl
+from musicftdl.models import DownloadArgs, SongInfo
+from musicftdl.scheduler import Scheduler
+from musicftdl.tagging import add_tags, strip_id3v2
+from tests.mock_server import MockMusicApi, MockServer
+
+# MPEG-1 Layer III frames, 128 kbps, 44.1 kHz.
+AUDIO = (b'\xff\xfb\x90\x64' + b'\x00' * 413) * 200
+
+
+def id3_tag(title: str) -> bytes:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'tag.id3')
+        open(filename, 'wb').close()
+        tag = Tag()
+        tag.title = title
+        tag.save(filename)
+        with open(filename, 'rb') as f:
+            return f.read()
+
+
+SONG_INFO = SongInfo(song_mid='001', song_name='晴天', singers_name=['周杰伦'], album_name='叶惠美',
+                     song_index=3, company='杰威尔音乐', publish_time='2003-07-31',
+                     album_cover_content=b'\xff\xd8\xff\xe0cover')
+
+
+class TestTagging(unittest.TestCase):
+    """Tests for writing tags while downloading."""
+
+    def setUp(self):
+        self.server = MockServer().__enter__()
+        self.server.files['/song.mp3'] = id3_tag('source') + AUDIO
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        self.tmpdir.cleanup()
+
+    def download(self, name, **kwargs):
+        filename = os.path.join(self.tmpdir.name, name)
+        song_info = SONG_INFO.copy(update={'url': self.server.url('/song.mp3')})
+        musicftdl.download_with_tags(filename, song_info, **kwargs)
+        return filename
+
+    def assertSameTags(self, first, second):
+        first, second = eyed3.load(first).tag, eyed3.load(second).tag
+        for field in ('title', 'artist', 'album', 'album_artist', 'track_num', 'publisher', 'copyright',
+                      'recording_date', 'release_date'):
+            self.assertEqual(getattr(first, field), getattr(second, field), field)
+        self.assertEqual([(image.picture_type, image.image_data) for image in first.images],
+                         [(image.picture_type, image.image_data) for image in second.images])
+
+    def test_tag_is_written_ahead_of_the_audio(self):
+        filename = self.download('streamed.mp3')
+
+        tagged_after = self.download('tagged_after.mp3', retag=False)
+        add_tags(tagged_after, SONG_INFO)
+
+        self.assertSameTags(filename, tagged_after)
+        self.assertEqual(eyed3.load(filename).tag.title, '晴天')
+        with open(filename, 'rb') as f:
+            self.assertTrue(f.read().endswith(AUDIO))
+
+    def test_tagged_download_is_resumed(self):
+        expected = self.download('expected.mp3')
+        self.server.cut_after['/song.mp3'] = 20000
+
+        filename = self.download('resumed.mp3')
+        self.assertFalse(os.path.exists(filename))
+        filename = self.download('resumed.mp3')
+
+        with open(filename, 'rb') as f, open(expected, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_strip_id3v2(self):
+        tag = id3_tag('source')
+        stream = tag + AUDIO
+
+        for size in (1, 7, 10, 4096):
+            chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+            self.assertEqual(b''.join(strip_id3v2(chunks)), AUDIO)
+        self.assertEqual(b''.join(strip_id3v2([AUDIO])), AUDIO)
+        self.assertEqual(b''.join(strip_id3v2([b'ID3'])), b'ID3')
+
+
+class TestTagStage(unittest.TestCase):
+    """Tests for tags rendered by the tag stage of the scheduler."""
+
+    def test_album_songs_are_tagged(self):
+        with MockMusicApi() as api, tempfile.TemporaryDirectory() as tmpdir:
+            api.add_album('singer', 'album', songs=3)
+            for i in (1, 2, 3):
+                api.files[f'/audio/album_{i}'] = id3_tag('source') + AUDIO
+
+            with mock.patch.object(Scheduler, 'submit_tag', autospec=True,
+                                   side_effect=Scheduler.submit_tag) as submit_tag:
+                musicftdl.download(DownloadArgs(resource='album', album=True, destination=tmpdir, name_style=1,
+                                                classified=False, format='128', tag_workers=2))
+
+            self.assertEqual(submit_tag.call_count, 3)
+            for i in (1, 2, 3):
+                tag = eyed3.load(os.path.join(tmpdir, f'Song album_{i}.mp3')).tag
+                self.assertEqual((tag.title, tag.album, tag.track_num[0]), (f'Song album_{i}', 'Album album', i))
+
+    def test_no_tag_is_rendered_for_downloaded_songs(self):
+        with MockMusicApi() as api, tempfile.TemporaryDirectory() as tmpdir:
+            api.add_album('singer', 'album', songs=3)
+            args = DownloadArgs(resource='album', album=True, destination=tmpdir, name_style=1,
+                                classified=False, format='128', tag_workers=2)
+            musicftdl.download(args)
+            os.remove(os.path.join(tmpdir, 'Song album_2.mp3'))
+
+            with mock.patch.object(Scheduler, 'submit_tag', autospec=True,
+                                   side_effect=Scheduler.submit_tag) as submit_tag:
+                musicftdl.download(args)
+
+            self.assertEqual([call.args[2].song_mid for call in submit_tag.call_args_list], ['album_2'])
+            self.assertEqual(eyed3.load(os.path.join(tmpdir, 'Song album_2.mp3')).tag.title, 'Song album_2')
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Process pools take no start method before Python 3.7')
+    def test_tag_pool_spawns_its_workers(self):
+        with Scheduler(max_tag_workers=1) as scheduler:
+            self.assertNotEqual(scheduler.submit_tag(os.getpid).result(timeout=60), os.getpid())
+            self.assertEqual(scheduler._tag_pool._mp_context.get_start_method(), 'spawn')
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+"""Tests for `musicftdl.throttle` module."""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from click.testing import CliRunner
+
+from musicftdl import musicftdl
+from musicftdl.cli import cli
+from musicftdl.models import DownloadArgs
+from musicftdl.throttle import (AdaptiveLimit, BandwidthLimit, HostThrottle,
+                                TokenBucket)
+from musicftdl.utils import parse_rate
+from tests.mock_server import MockMusicApi
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Tests for `TokenBucket`."""
+
+    def test_rate_is_enforced_after_the_burst(self):
+        bucket = TokenBucket(rate=100, capacity=10)
+
+        start = time.monotonic()
+        for _ in range(30):
+            bucket.acquire()
+        elapsed = time.monotonic() - start
+
+        # 10 tokens are available at once, the other 20 take 0.2s to refill.
+        self.assertGreaterEqual(elapsed, 0.18)
+        self.assertLess(elapsed, 0.5)
+
+
+class TestAdaptiveLimit(unittest.TestCase):
+    """Tests for `AdaptiveLimit`."""
+
+    def test_additive_increase(self):
+        limit = AdaptiveLimit(limit=4, maximum=5)
+        for _ in range(4):
+            limit.acquire()
+            limit.release()
+        self.assertAlmostEqual(limit.limit, 5, delta=0.1)
+
+        for _ in range(100):
+            limit.acquire()
+            limit.release()
+        self.assertEqual(limit.limit, 5)
+
+    def test_multiplicative_decrease_once_per_cooldown(self):
+        limit = AdaptiveLimit(limit=16, cooldown=10)
+        for _ in range(3):
+            limit.acquire()
+            limit.release(throttled=True)
+
+        self.assertEqual(limit.limit, 8)
+
+    def test_concurrency_is_bounded(self):
+        limit = AdaptiveLimit(limit=3)
+        peak, lock = [0], threading.Lock()
+
+        def work():
+            limit.acquire()
+            with lock:
+                peak[0] = max(peak[0], limit.in_flight)
+            time.sleep(0.05)
+            limit.release(throttled=True)
+
+        threads = [threading.Thread(target=work) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(peak[0], 3)
+
+
+class TestHostThrottle(unittest.TestCase):
+    """Tests for `HostThrottle`."""
+
+    def test_hosts_are_throttled_separately(self):
+        throttle = HostThrottle({'api.example.com': 10}, default_rate=1000,
+                                is_throttled=lambda e: isinstance(e, ConnectionError))
+
+        with self.assertRaises(ConnectionError), throttle.slot('http://api.example.com/song?id=1'):
+            raise ConnectionError
+        with throttle.slot('http://cdn.example.com/1.mp3'):
+            pass
+
+        api_bucket, api_limit = throttle.get('api.example.com')
+        cdn_bucket, cdn_limit = throttle.get('cdn.example.com')
+        self.assertEqual((api_bucket.rate, cdn_bucket.rate), (10, 1000))
+        self.assertEqual(api_limit.limit, 10)
+        self.assertGreater(cdn_limit.limit, 20)
+        self.assertEqual(api_limit.in_flight + cdn_limit.in_flight, 0)
+
+    def test_concurrency_is_raised_to_the_maximum(self):
+        throttle = HostThrottle({'api.example.com': None}, default_rate=1000)
+        throttle.configure(limit=4, maximum=6)
+
+        for _ in range(100):
+            with throttle.slot('http://api.example.com/song?id=1'):
+                pass
+
+        bucket, limit = throttle.get('api.example.com')
+        self.assertIsNone(bucket)
+        self.assertEqual(limit.limit, 6)
+
+    def test_streamed_downloads_hold_their_slot(self):
+        in_flight = []
+
+        def limit(chunks, url):
+            # Transfers of the CDN count until their body is read.
+            in_flight.append(musicftdl.host_throttle.get('localhost')[1].in_flight)
+            return chunks
+
+        with MockMusicApi(cdn_host='localhost', bandwidth=256 * 1024) as api, \
+                tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(musicftdl.bandwidth, 'limit', side_effect=limit):
+            api.add_album('singer', 'album', songs=12, size=64 * 1024)
+            musicftdl.download(DownloadArgs(resource='album', album=True, destination=tmpdir, name_style=1,
+                                            classified=False, format='flac', workers=3, max_workers=6))
+
+            self.assertEqual(len([name for name in os.listdir(tmpdir) if name.endswith('.flac')]), 12)
+
+        _, cdn = musicftdl.host_throttle.get('localhost')
+        self.assertEqual((cdn.maximum, cdn.in_flight), (6, 0))
+        self.assertGreater(cdn.limit, 3)
+        self.assertEqual(len(in_flight), 12)
+        self.assertTrue(all(1 <= n <= 6 for n in in_flight), in_flight)
+
+    def test_cli_configures_host_rates(self):
+        with mock.patch('musicftdl.musicftdl.download'):
+            result = CliRunner().invoke(cli, ['download', '--host-rate', 'mapi.lonsty.me=5', 'song'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual(musicftdl.host_throttle.get('mapi.lonsty.me')[0].rate, 5)
+
+            result = CliRunner().invoke(cli, ['download', 'song'])
+            self.assertEqual(musicftdl.host_throttle.get('mapi.lonsty.me')[0].rate, 50)
+            self.assertEqual(musicftdl.host_throttle.get('y.gtimg.cn')[0].rate, 20)
+
+            result = CliRunner().invoke(cli, ['download', '--host-rate', 'mapi.lonsty.me=fast', 'song'])
+            self.assertEqual(result.exit_code, 2)
+
+
+class TestBandwidthLimit(unittest.TestCase):
+    """Tests for `BandwidthLimit`."""
+
+    def download(self, bandwidth, url, size=40 * 1024, chunk=1024):
+        received = 0
+        for data in bandwidth.limit((b'0' * chunk for _ in range(size // chunk)), url):
+            received += len(data)
+        return received
+
+    def test_unlimited_returns_chunks_as_is(self):
+        chunks = iter([b'0'])
+        self.assertIs(BandwidthLimit().limit(chunks, 'http://a/'), chunks)
+
+    def test_rate_is_shared_fairly_by_downloads(self):
+        bandwidth = BandwidthLimit(rate=40 * 1024)
+        bandwidth.consume(40 * 1024)  # Drain the burst.
+        finished = {}
+        start = time.monotonic()
+
+        def download(name):
+            self.download(bandwidth, 'http://a/', size=20 * 1024)
+            finished[name] = time.monotonic() - start
+
+        threads = [threading.Thread(target=download, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 40 KiB at 40 KiB/s.
+        self.assertGreaterEqual(max(finished.values()), 0.9)
+        # Both downloads progressed side by side and finished together.
+        self.assertLess(abs(finished[0] - finished[1]), 0.2)
+
+    def test_host_rate(self):
+        bandwidth = BandwidthLimit(host_rates={'slow': 20 * 1024})
+
+        start = time.monotonic()
+        self.download(bandwidth, 'http://fast/')
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.download(bandwidth, 'http://slow/')
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('100'), 100)
+        self.assertEqual(parse_rate('512K'), 512 * 1024)
+        self.assertEqual(parse_rate('1.5MB/s'), 1.5 * 1024 * 1024)
+        with self.assertRaises(ValueError):
+            parse_rate('fast')